@@ -0,0 +1,96 @@
+"""Measure embedding throughput against a local stub of the OpenAI embeddings API.
+
+The stub adds per-request latency and rejects a share of requests with 429s, so the
+concurrency and retry behaviour of the pipeline can be compared without an API key.
+
+Run from the ai_pipeline directory:
+    python -m benchmarks.embedding_benchmark --chunks 2000 --concurrency 1 4 8 --rate-limit 0.1
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+STUB_PORT = 8765
+
+
+def build_stub_app(latency: float, rate_limit: float, dimensions: int = 16) -> FastAPI:
+    """OpenAI-compatible /v1/embeddings endpoint returning deterministic vectors"""
+    app = FastAPI()
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(latency)
+        if random.random() < rate_limit:
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                headers={"retry-after-ms": "200", "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "200ms"},
+            )
+        data = []
+        for index, text in enumerate(texts):
+            digest = hashlib.sha256(str(text).encode("utf-8")).digest()
+            data.append({"object": "embedding", "index": index, "embedding": [byte / 255.0 for byte in digest[:dimensions]]})
+        return JSONResponse(
+            content={"object": "list", "data": data, "model": body["model"], "usage": {"prompt_tokens": 0, "total_tokens": 0}},
+            headers={"x-ratelimit-remaining-requests": "1000", "x-ratelimit-remaining-tokens": "1000000"},
+        )
+
+    return app
+
+
+def start_stub(latency: float, rate_limit: float):
+    server = uvicorn.Server(uvicorn.Config(build_stub_app(latency, rate_limit), port=STUB_PORT, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per stub request")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Share of stub requests answered with 429")
+    args = parser.parse_args()
+
+    # Point the shared OpenAI clients at the stub before they are created
+    os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "stub-key"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}/v1"
+    from services.embedding_pipeline import EmbeddingPipeline
+
+    texts = [f"chunk {number} of the synthetic campus handbook" for number in range(args.chunks)]
+
+    # One event loop for every run, since the pooled HTTP client is bound to it
+    async def run_all():
+        for concurrency in args.concurrency:
+            pipeline = EmbeddingPipeline(batch_size=args.batch_size, concurrency=concurrency, max_retries=20)
+            vectors = await pipeline.embed(texts)
+            assert len(vectors) == len(texts) and all(vectors)
+            print(json.dumps({"concurrency": concurrency, "rate_limit": args.rate_limit, **pipeline.last_stats}))
+
+    server = start_stub(args.latency, args.rate_limit)
+    try:
+        asyncio.run(run_all())
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Deterministic offline stand-ins for the OpenAI embeddings and chat APIs.
+
+Vectors are derived from a hash of the text, so documents and queries embedded by either
+fake land in the same space and every run produces the same indexes.
+"""
+import asyncio
+import hashlib
+from types import SimpleNamespace
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+FAKE_ANSWER = (
+    "### YOUR RESPONSE ###\n"
+    "The **examination fee** deadline is listed in the circular.\n\n"
+    "(Source: benchmark.pdf, Page: 1)\n"
+    "### SUGGESTED QUESTIONS ###\n"
+    "1. When does registration close?\n"
+    "2. Is there a late fee?\n"
+    "3. Where is the fee paid?"
+)
+
+
+def fake_vector(text: str, dimensions: int) -> List[float]:
+    """Unit-length vector seeded by the text, like a real embedding model's output"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FakeEmbeddings(Embeddings):
+    """LangChain embeddings that never leave the process"""
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [fake_vector(text, self.dimensions) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return fake_vector(text, self.dimensions)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.embed_query(text)
+
+
+class _RawResponse:
+    def __init__(self, data):
+        self.headers = {"x-ratelimit-remaining-requests": "10000", "x-ratelimit-remaining-tokens": "10000000"}
+        self._data = data
+
+    def parse(self):
+        return SimpleNamespace(data=self._data)
+
+
+class _Stream:
+    def __init__(self, text: str):
+        self.text = text
+
+    def __aiter__(self):
+        async def chunks():
+            for start in range(0, len(self.text), 8):
+                await asyncio.sleep(0)
+                delta = SimpleNamespace(content=self.text[start:start + 8])
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+        return chunks()
+
+
+class FakeOpenAI:
+    """The parts of AsyncOpenAI the services call: embeddings (raw response) and chat completions"""
+
+    def __init__(self, dimensions: int, embedding_latency: float = 0.0, chat_latency: float = 0.0):
+        self.dimensions = dimensions
+        self.embedding_latency = embedding_latency
+        self.chat_latency = chat_latency
+        self.embedding_requests = 0
+        self.chat_requests = 0
+        self.embeddings = SimpleNamespace(with_raw_response=SimpleNamespace(create=self._create_embeddings))
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+
+    def with_options(self, **kwargs) -> "FakeOpenAI":
+        return self
+
+    async def _create_embeddings(self, model: str, input: List[str], dimensions: Optional[int] = None, **kwargs) -> _RawResponse:
+        self.embedding_requests += 1
+        await asyncio.sleep(self.embedding_latency)
+        width = dimensions or self.dimensions
+        data = [SimpleNamespace(index=index, embedding=fake_vector(text, width)) for index, text in enumerate(input)]
+        return _RawResponse(data)
+
+    async def _create_completion(self, stream: bool = False, **kwargs):
+        self.chat_requests += 1
+        await asyncio.sleep(self.chat_latency)
+        if stream:
+            return _Stream(FAKE_ANSWER)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=FAKE_ANSWER))])
+
+
+def install_fakes(dimensions: int, embedding_latency: float = 0.0, chat_latency: float = 0.0) -> FakeOpenAI:
+    """Point the shared OpenAI clients at the fakes; call before the services are imported"""
+    from services.openai_clients import openai_clients
+    fake = FakeOpenAI(dimensions, embedding_latency, chat_latency)
+    openai_clients._chat = fake
+    openai_clients._embeddings = FakeEmbeddings(openai_clients.embedding_dimensions or dimensions)
+    return fake
@@ -0,0 +1,57 @@
+"""Compare serial and process-pool PDF parsing on large synthetic PDFs.
+
+Run from the ai_pipeline directory:
+    python -m benchmarks.pdf_parse_benchmark --pages 100 300 600
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import settings
+from services.document_processor import DocumentProcessor
+from benchmarks.synthetic_pdf import build_pdf
+
+
+def time_parse(processor: DocumentProcessor, pdf_bytes: bytes, workers: int) -> float:
+    settings.pdf_parse_workers = workers
+    started = time.perf_counter()
+    pages, _ = processor._parse_pdf(pdf_bytes, "benchmark.pdf")
+    elapsed = time.perf_counter() - started
+    assert pages and not pages[0].startswith("[Page"), "synthetic PDF produced no text"
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 300, 600])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    processor = DocumentProcessor()
+    settings.pdf_parallel_min_pages = 1
+    # Start the pool once so process spawn time is not charged to the first run
+    time_parse(processor, build_pdf(args.workers), args.workers)
+
+    results = []
+    for pages in args.pages:
+        pdf_bytes = build_pdf(pages)
+        serial = time_parse(processor, pdf_bytes, 1)
+        parallel = time_parse(processor, pdf_bytes, args.workers)
+        results.append({
+            "pages": pages,
+            "workers": args.workers,
+            "serial_seconds": round(serial, 3),
+            "parallel_seconds": round(parallel, 3),
+            "serial_pages_per_second": round(pages / serial, 1),
+            "parallel_pages_per_second": round(pages / parallel, 1),
+            "speedup": round(serial / parallel, 2),
+        })
+        print(json.dumps(results[-1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""Benchmark ingestion and query paths offline, with fake embeddings and a fake chat model.
+
+Reports PDF parse pages/s, chunking throughput, embedding batches/s, index build time,
+the size, search latency and recall of each FAISS index type, retrieval and answer latency
+against growing document counts, and peak RSS, as one JSON document. Two result files can be compared to catch regressions between commits.
+
+Run from the ai_pipeline directory:
+    python -m benchmarks.pipeline_benchmark --documents 1 10 100 1000 --output head.json
+    python -m benchmarks.pipeline_benchmark --compare base.json head.json --tolerance 0.15
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import subprocess
+from typing import Any, Dict, List, Tuple
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from benchmarks.synthetic_pdf import WORDS, build_pdf
+
+QUERY_TEMPLATES = [
+    "When is the {0} {1} deadline?",
+    "How do I apply for the {0} {1}?",
+    "What are the rules for {0} and {1}?",
+    "Who should I contact about the {0} {1}?",
+]
+
+
+def build_queries(count: int) -> List[str]:
+    """Natural-language questions, so retrieval takes the vector path rather than the identifier fast path"""
+    rng = random.Random(7)
+    words = [word for word in WORDS if not any(ch.isdigit() for ch in word)]
+    return [rng.choice(QUERY_TEMPLATES).format(rng.choice(words), rng.choice(words)) for _ in range(count)]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process; PDF parse workers are separate processes and not included"""
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def current_rss_mb() -> float:
+    """Resident memory of this process right now, from /proc where available"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return 0.0
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True, text=True).stdout.strip()
+    except Exception:
+        return ""
+
+
+async def bench_ingestion_stages(processor, args) -> Dict[str, Any]:
+    """Time each ingestion stage on one large synthetic document"""
+    from services.embedding_pipeline import embedding_pipeline
+    from services.lexical_index import LexicalIndex
+    from services.mapped_vector_store import MappedVectorStore
+
+    pdf_bytes = build_pdf(args.parse_pages)
+    started = time.perf_counter()
+    pages, _ = await asyncio.to_thread(processor._parse_pdf, pdf_bytes, "benchmark.pdf")
+    parse_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    documents = processor._text_to_docs(pages, "benchmark.pdf", LexicalIndex())
+    chunk_seconds = time.perf_counter() - started
+    text_mb = sum(len(page) for page in pages) / (1024 * 1024)
+
+    texts = [document.page_content for document in documents]
+    started = time.perf_counter()
+    vectors = await embedding_pipeline.embed(texts)
+    embed_seconds = time.perf_counter() - started
+    embed_stats = embedding_pipeline.last_stats
+
+    started = time.perf_counter()
+    index, _ = await asyncio.to_thread(processor._build_index, vectors)
+    index_seconds = time.perf_counter() - started
+
+    directory = tempfile.mkdtemp(dir=".")
+    started = time.perf_counter()
+    await asyncio.to_thread(MappedVectorStore.write, directory, documents, index)
+    persist_seconds = time.perf_counter() - started
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    store = await asyncio.to_thread(MappedVectorStore.load, directory)
+    load_seconds = time.perf_counter() - started
+    load_rss_mb = current_rss_mb() - rss_before
+    started = time.perf_counter()
+    store.similarity_search_with_score_by_vector(vectors[0], k=4)
+    first_search_seconds = time.perf_counter() - started
+    del store
+    shutil.rmtree(directory)
+
+    return {
+        "parse": {"pages": len(pages), "seconds": round(parse_seconds, 3), "pages_per_second": round(len(pages) / parse_seconds, 1)},
+        "chunking": {
+            "chunks": len(documents),
+            "seconds": round(chunk_seconds, 4),
+            "chunks_per_second": round(len(documents) / chunk_seconds, 1),
+            "mb_per_second": round(text_mb / chunk_seconds, 2),
+        },
+        "embedding": {
+            "chunks": len(texts),
+            "batches": embed_stats["batches"],
+            "seconds": round(embed_seconds, 3),
+            "batches_per_second": round(embed_stats["batches"] / embed_seconds, 1),
+            "chunks_per_second": round(len(texts) / embed_seconds, 1),
+        },
+        "index": {
+            "chunks": len(documents),
+            "build_seconds": round(index_seconds, 4),
+            "persist_seconds": round(persist_seconds, 4),
+            "load_seconds": round(load_seconds, 4),
+            "load_rss_mb": round(load_rss_mb, 1),
+            "first_search_seconds": round(first_search_seconds, 4),
+        },
+    }
+
+
+def clustered_vectors(count: int, dimensions: int, seed: int):
+    """Unit vectors grouped around topic centres, closer to real embeddings than uniform noise"""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(1, count // 100), dimensions)).astype(np.float32)
+    points = centres[rng.integers(0, len(centres), count)] + 0.6 * rng.standard_normal((count, dimensions)).astype(np.float32)
+    return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+
+def bench_index_types(processor, args) -> Dict[str, Any]:
+    """Build, size, load and search each index type over one synthetic store, with recall against exact search"""
+    import faiss
+    import numpy as np
+    from langchain_core.documents import Document
+    from services.mapped_vector_store import INDEX_FILE, MappedVectorStore
+
+    vectors = clustered_vectors(args.index_vectors, args.dimensions, seed=11)
+    rng = np.random.default_rng(12)
+    queries = vectors[rng.integers(0, len(vectors), args.index_queries)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32) / math.sqrt(args.dimensions)
+    exact = faiss.IndexFlatL2(args.dimensions)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.recall_k)
+    documents = [Document(page_content="", metadata={"source": str(position)}) for position in range(len(vectors))]
+
+    results = {}
+    for index_type in args.index_types:
+        started = time.perf_counter()
+        index, built_type = processor._build_index(vectors, index_type)
+        build_seconds = time.perf_counter() - started
+
+        directory = tempfile.mkdtemp(dir=".")
+        MappedVectorStore.write(directory, documents, index)
+        del index
+        rss_before = current_rss_mb()
+        started = time.perf_counter()
+        store = MappedVectorStore.load(directory)
+        load_seconds = time.perf_counter() - started
+
+        latencies, found = [], []
+        for query in queries:
+            started = time.perf_counter()
+            _, positions = store.index.search(query.reshape(1, -1), args.recall_k)
+            latencies.append(time.perf_counter() - started)
+            found.append(positions[0])
+        recall = np.mean([len(set(row) & set(expected)) / args.recall_k for row, expected in zip(found, truth)])
+
+        results[index_type] = {
+            "built_as": built_type,
+            "build_seconds": round(build_seconds, 3),
+            "index_mb": round(os.path.getsize(os.path.join(directory, INDEX_FILE)) / (1024 * 1024), 2),
+            "load_seconds": round(load_seconds, 4),
+            # Mapped pages the searches touched, on top of the load itself
+            "search_rss_mb": round(current_rss_mb() - rss_before, 1),
+            "search": latency_summary(latencies),
+            "recall": round(float(recall), 4),
+        }
+        del store
+        shutil.rmtree(directory)
+        print(json.dumps({"index_type": index_type, **results[index_type]}), file=sys.stderr)
+    return results
+
+
+async def time_queries(chat_service, document_ids: List[str], queries: List[str]) -> Tuple[List[float], List[float], int]:
+    """Retrieval-only and full answer latency for each query, plus documents dropped by the fan-out"""
+    retrieval, answer, dropped = [], [], 0
+    for query in queries:
+        started = time.perf_counter()
+        if len(document_ids) == 1:
+            await chat_service._retrieve_document(query, document_ids[0])
+        else:
+            _, _, search_info = await chat_service._retrieve_documents(query, document_ids)
+            dropped += len(search_info["late_documents"]) + len(search_info["failed_documents"])
+        retrieval.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        if len(document_ids) == 1:
+            await chat_service.get_response(query, document_ids[0])
+        else:
+            await chat_service.search_multiple_documents(query, document_ids)
+        answer.append(time.perf_counter() - started)
+    return retrieval, answer, dropped
+
+
+async def bench_scaling(processor, chat_service, args) -> List[Dict[str, Any]]:
+    """Ingest documents up to the largest count, measuring query latency at each requested count"""
+    results = []
+    document_ids: List[str] = []
+    pdf_bytes = build_pdf(args.pages_per_document)
+    ingest_seconds: List[float] = []
+    for count in sorted(args.documents):
+        while len(document_ids) < count:
+            started = time.perf_counter()
+            doc_id = await processor.process_document(pdf_bytes, f"document-{len(document_ids)}.pdf")
+            ingest_seconds.append(time.perf_counter() - started)
+            document_ids.append(doc_id)
+
+        queries = build_queries(args.queries + 1)
+        # The first query pays for loading every store; report it apart from the warm ones
+        cold_retrieval, _, _ = await time_queries(chat_service, document_ids, queries[:1])
+        retrieval, answer, dropped = await time_queries(chat_service, document_ids, queries[1:])
+        results.append({
+            "documents": count,
+            "ingest_document_seconds": round(statistics.fmean(ingest_seconds), 4),
+            "cold_retrieval_ms": round(cold_retrieval[0] * 1000, 2),
+            "retrieval": latency_summary(retrieval),
+            "answer": latency_summary(answer),
+            "dropped_document_searches": dropped,
+        })
+        print(json.dumps(results[-1]), file=sys.stderr)
+    return results
+
+
+def configure(args):
+    """Offline API key and no caches, so runs measure the same work and are comparable"""
+    os.environ["OPENAI_API_KEY"] = "offline-benchmark"
+    from config.settings import settings
+    settings.use_corpus_index = args.corpus
+    settings.embedding_dimensions = args.embedding_dimensions
+    settings.embedding_reduction = args.embedding_reduction
+    # Caches would hide the work being measured
+    settings.enable_response_cache = False
+    settings.enable_embedding_cache = False
+    settings.enable_startup_prewarm = False
+    settings.conversation_memory_backend = "memory"
+    settings.openai_api_key = os.environ["OPENAI_API_KEY"]
+    return settings
+
+
+async def run(args) -> Dict[str, Any]:
+    settings = configure(args)
+    from benchmarks.fakes import install_fakes
+    fake = install_fakes(args.dimensions, args.embedding_latency, args.chat_latency)
+    from services.document_processor import document_processor
+    from services.chat_service import chat_service
+
+    stages = await bench_ingestion_stages(document_processor, args)
+    index_types = bench_index_types(document_processor, args) if args.index_vectors else {}
+    scaling = await bench_scaling(document_processor, chat_service, args)
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "dimensions": args.dimensions,
+            "embedding_dimensions": args.embedding_dimensions,
+            "embedding_reduction": args.embedding_reduction,
+            "storage": "corpus" if settings.use_corpus_index else "document",
+            "hybrid_search": settings.enable_hybrid_search,
+            "parse_pages": args.parse_pages,
+            "pages_per_document": args.pages_per_document,
+            "queries": args.queries,
+            "index_vectors": args.index_vectors,
+            "recall_k": args.recall_k,
+            "embedding_latency": args.embedding_latency,
+            "chat_latency": args.chat_latency,
+        },
+        "stages": stages,
+        "index_types": index_types,
+        "scaling": scaling,
+        "requests": {"embedding": fake.embedding_requests, "chat": fake.chat_requests},
+        "memory": {"peak_rss_mb": peak_rss_mb()},
+    }
+
+
+def flatten(results: Dict[str, Any]) -> Dict[str, float]:
+    """Numeric metrics keyed like 'stages.parse.pages_per_second' or 'scaling.100.retrieval.p95_ms'"""
+    metrics = {}
+
+    def walk(prefix: str, value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                walk(f"{prefix}.{key}" if prefix else key, item)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[prefix] = float(value)
+
+    walk("stages", results.get("stages", {}))
+    walk("index_types", results.get("index_types", {}))
+    for row in results.get("scaling", []):
+        walk(f"scaling.{row['documents']}", {key: item for key, item in row.items() if key != "documents"})
+    walk("memory", results.get("memory", {}))
+    return metrics
+
+
+def compare(base_path: str, head_path: str, tolerance: float) -> int:
+    """Print per-metric changes as JSON lines; returns 1 if any timed metric regressed beyond the tolerance"""
+    with open(base_path, 'r') as f:
+        base = flatten(json.load(f))
+    with open(head_path, 'r') as f:
+        head = flatten(json.load(f))
+
+    regressions = 0
+    for metric in sorted(base.keys() & head.keys()):
+        if metric.endswith(("_per_second", ".recall")):
+            higher_is_better = True
+        elif metric.endswith(("_seconds", "_ms", "_mb")):
+            higher_is_better = False
+        else:
+            continue  # Counts describe the workload rather than its speed
+        before, after = base[metric], head[metric]
+        if before <= 0:
+            continue
+        change = (after - before) / before
+        regressed = (change < -tolerance) if higher_is_better else (change > tolerance)
+        regressions += regressed
+        print(json.dumps({"metric": metric, "base": before, "head": after, "change": round(change, 3), "regressed": regressed}))
+    print(json.dumps({"regressions": regressions, "tolerance": tolerance}))
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--pages-per-document", type=int, default=4)
+    parser.add_argument("--parse-pages", type=int, default=200, help="Pages in the document used for the stage timings")
+    parser.add_argument("--queries", type=int, default=20, help="Warm queries per document count")
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--embedding-dimensions", type=int, default=0, help="Reduced vector width, 0 for full width")
+    parser.add_argument("--embedding-reduction", choices=["provider", "pca"], default="provider")
+    parser.add_argument("--index-vectors", type=int, default=20000, help="Vectors in the store used to compare index types, 0 to skip")
+    parser.add_argument("--index-types", nargs="+", default=["flat", "hnsw", "ivf_flat", "ivf_pq", "sq8"])
+    parser.add_argument("--index-queries", type=int, default=200, help="Queries per index type")
+    parser.add_argument("--recall-k", type=int, default=10)
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Seconds per fake embeddings request")
+    parser.add_argument("--chat-latency", type=float, default=0.0, help="Seconds per fake completion")
+    parser.add_argument("--corpus", action="store_true", help="Use the shared corpus index instead of one store per document")
+    parser.add_argument("--output", help="Also write the results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"), help="Compare two result files instead of running")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(args.compare[0], args.compare[1], args.tolerance))
+
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = tempfile.mkdtemp(prefix="pipeline-benchmark-")
+    os.chdir(workdir)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        os.chdir(APP_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Measure time from launching the service to its first healthy /health response.
+
+Each run starts uvicorn in a fresh process, polls /health until it answers, then waits
+for the background prewarm to finish so both numbers can be tracked between changes.
+
+Run from the ai_pipeline directory:
+    python -m benchmarks.startup_benchmark --runs 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+import httpx
+
+STARTUP_PORT = 8766
+
+
+def time_startup(port: int, timeout: float) -> dict:
+    url = f"http://127.0.0.1:{port}/health"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        first_health = None
+        startup = {}
+        while time.perf_counter() - started < timeout:
+            try:
+                response = httpx.get(url, timeout=1.0)
+                if response.status_code == 200:
+                    if first_health is None:
+                        first_health = time.perf_counter() - started
+                    startup = response.json().get("startup", {})
+                    if startup.get("services_loaded_seconds") is not None:
+                        break
+            except httpx.TransportError:
+                pass
+            time.sleep(0.02)
+        if first_health is None:
+            raise Exception(f"Service did not answer /health within {timeout}s")
+        return {"first_health_seconds": round(first_health, 3), "service": startup}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=STARTUP_PORT)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    for run in range(args.runs):
+        print(json.dumps({"run": run, **time_startup(args.port, args.timeout)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+from typing import List
+
+# Vocabulary loosely modelled on campus circulars so chunking and retrieval see realistic text
+WORDS = [
+    "semester", "examination", "fee", "deadline", "hostel", "scholarship", "CS101", "EE204",
+    "form", "16A", "registration", "department", "library", "timetable", "lecture", "credit",
+    "admission", "circular", "notice", "student", "faculty", "portal", "payment", "refund",
+]
+
+
+def page_lines(page_number: int, lines_per_page: int) -> List[str]:
+    """Deterministic text lines for one page"""
+    lines = []
+    for line in range(lines_per_page):
+        seed = page_number * lines_per_page + line
+        words = [WORDS[(seed * 7 + i * 13) % len(WORDS)] for i in range(12)]
+        lines.append(f"{page_number + 1}.{line} " + " ".join(words))
+    return lines
+
+
+def build_pdf(pages: int, lines_per_page: int = 45) -> bytes:
+    """Build a text-only PDF with the given number of pages, without extra dependencies"""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{4 + 2 * i} 0 R" for i in range(pages)), pages),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page in range(pages):
+        text = " ".join(f"({line}) '" for line in page_lines(page, lines_per_page))
+        stream = f"BT /F1 9 Tf 36 806 Td 11 TL {text} ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * page} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    output = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n"
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n"
+    return output.encode("latin-1")
@@ -0,0 +1,47 @@
+"""Ingest every PDF in directories or zip/tar archives in one run.
+
+Files stream through parse, embed and index stages that each run in parallel. Files whose
+content was ingested before are skipped, and registry rows are written in batches as documents
+finish. Prints one JSON line per ingested document and a throughput report:
+    python bulk_ingest.py /data/handbooks-2026 /data/notices.zip
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.document_registry import document_registry
+from services.openai_clients import openai_clients
+
+
+async def ingest(sources) -> dict:
+    from services.bulk_ingestion import BulkIngestion
+    from services.document_processor import document_processor
+
+    return await BulkIngestion(document_processor).run(sources)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sources", nargs="+", help="Directories, .zip/.tar/.tar.gz archives or single PDFs")
+    args = parser.parse_args()
+
+    if not openai_clients.api_key_available:
+        sys.exit("OPENAI_API_KEY is not configured")
+    document_registry.open()
+
+    try:
+        report = asyncio.run(ingest(args.sources))
+    finally:
+        document_registry.flush()
+    for document in report.pop("documents"):
+        print(json.dumps(document))
+    print(json.dumps(report))
+    sys.exit(1 if report["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
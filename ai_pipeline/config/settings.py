@@ -6,12 +6,92 @@ load_dotenv()
 class Settings:
     def __init__(self):
         self.openai_api_key = os.getenv("OPENAI_API_KEY")  # Using same var name as requested
+        self.openai_base_url = os.getenv("OPENAI_BASE_URL")  # Optional, e.g. a local stub for benchmarking
         self.vector_store_path = "vector_stores"
         self.temp_uploads_path = "temp_uploads"
+        self.document_registry_path = os.getenv("DOCUMENT_REGISTRY_PATH", "document_registry.db")  # SQLite file listing every document
         self.max_file_size = 20 * 1024 * 1024  # 20MB
         self.chunk_size = 4000
         self.chunk_overlap = 100  # Reduced overlap for faster processing
+        # PDF page extraction runs across a process pool for larger documents
+        self.pdf_parse_workers = int(os.getenv("PDF_PARSE_WORKERS", os.cpu_count() or 1))
+        self.pdf_parallel_min_pages = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 32))
+        self.pdf_page_timeout_seconds = float(os.getenv("PDF_PAGE_TIMEOUT_SECONDS", 30))
         self.similarity_search_k = 2  # Reduced from 3 to 2 for faster retrieval
+        self.multi_document_top_k = int(os.getenv("MULTI_DOCUMENT_TOP_K", 10))  # Chunks kept across all documents
+        self.min_relevance_score = float(os.getenv("MIN_RELEVANCE_SCORE", 0.0))  # Cutoff on cosine similarity of vector results; 0 keeps everything
+        # Hybrid retrieval: BM25 over per-document inverted indexes fused with vector results
+        self.enable_hybrid_search = os.getenv("ENABLE_HYBRID_SEARCH", "true").lower() == "true"
+        self.hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", 10))  # Per retriever, before fusion
+        self.hybrid_min_score = float(os.getenv("HYBRID_MIN_SCORE", 0.0))  # Cutoff on the fused rank score (1.0 = first in every ranking); 0 keeps everything
+        self.rrf_k = 60  # Reciprocal rank fusion constant
+        self.lexical_index_cache_size = int(os.getenv("LEXICAL_INDEX_CACHE_SIZE", 256))  # Loaded indexes kept in memory
+        # Per-document stores are searched concurrently; a search running longer than the timeout is dropped
+        self.search_fanout_workers = int(os.getenv("SEARCH_FANOUT_WORKERS", 8))
+        self.search_document_timeout_seconds = float(os.getenv("SEARCH_DOCUMENT_TIMEOUT_SECONDS", 5))
+        self.query_embedding_cache_size = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 1024))  # Recent query vectors kept
         self.enable_response_cache = True  # Add caching flag
+        # Conversation memory: idle sessions expire, and older turns are folded into a summary
+        self.conversation_memory_backend = os.getenv("CONVERSATION_MEMORY_BACKEND", "memory").lower()  # or "sqlite"
+        self.conversation_memory_path = "conversation_memory.db"
+        self.conversation_idle_ttl_seconds = float(os.getenv("CONVERSATION_IDLE_TTL_SECONDS", 24 * 60 * 60))  # 1 day
+        self.conversation_memory_max_bytes = int(os.getenv("CONVERSATION_MEMORY_MAX_BYTES", 64 * 1024 * 1024))  # 64MB
+        self.conversation_history_token_budget = int(os.getenv("CONVERSATION_HISTORY_TOKEN_BUDGET", 1500))
+        self.conversation_summary_max_tokens = 300
+        # Response cache storage: "sqlite" is shared by the workers on one host, "redis" across hosts
+        self.response_cache_backend = os.getenv("RESPONSE_CACHE_BACKEND", "sqlite").lower()
+        self.response_cache_path = "response_cache.db"
+        self.response_cache_redis_url = os.getenv("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+        self.response_cache_max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+        self.response_cache_ttl_seconds = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 6 * 60 * 60))  # 6 hours
+        # Reuse answers to differently worded questions about the same documents
+        self.enable_semantic_cache = os.getenv("ENABLE_SEMANTIC_CACHE", "false").lower() == "true"
+        self.semantic_cache_threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))  # Cosine similarity
+        self.embedding_model = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+        # Narrower vectors: "provider" asks text-embedding-3 models for them, "pca" projects inside each document's index
+        self.embedding_dimensions = int(os.getenv("EMBEDDING_DIMENSIONS", 0))  # 0 keeps the model's full width
+        self.embedding_reduction = os.getenv("EMBEDDING_REDUCTION", "provider").lower()
+        self.embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", 100))  # Chunks per embeddings request
+        self.embedding_concurrency = int(os.getenv("EMBEDDING_CONCURRENCY", 4))  # Embedding requests in flight per job
+        self.embedding_max_retries = int(os.getenv("EMBEDDING_MAX_RETRIES", 5))  # Per batch, on 429s and transient errors
+        # Content-addressed cache of chunk embeddings, so re-uploads only embed changed text
+        self.enable_embedding_cache = os.getenv("ENABLE_EMBEDDING_CACHE", "true").lower() == "true"
+        self.embedding_cache_path = "embedding_cache.db"
+        self.embedding_cache_max_bytes = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 1024 * 1024 * 1024))  # 1GB
+        # Background ingestion of uploaded documents
+        self.ingestion_jobs_path = "ingestion_jobs"
+        self.ingestion_workers = int(os.getenv("INGESTION_WORKERS", 2))
+        self.ingestion_poll_seconds = float(os.getenv("INGESTION_POLL_SECONDS", 1))  # How often the job runner looks for new jobs
+        self.ingestion_job_ttl_seconds = int(os.getenv("INGESTION_JOB_TTL_SECONDS", 7 * 24 * 3600))  # Finished jobs are kept this long
+        # Bulk ingestion of directories and archives: files stream through parse, embed and index stages
+        self.bulk_max_upload_bytes = int(os.getenv("BULK_MAX_UPLOAD_BYTES", 1024 * 1024 * 1024))  # 1GB archive
+        self.bulk_embed_documents = int(os.getenv("BULK_EMBED_DOCUMENTS", 4))  # Documents being embedded at once
+        self.bulk_index_workers = int(os.getenv("BULK_INDEX_WORKERS", 2))
+        self.bulk_max_extracted_bytes = int(os.getenv("BULK_MAX_EXTRACTED_BYTES", 10 * 1024 * 1024 * 1024))  # PDFs one archive may unpack to
+        self.bulk_register_every = int(os.getenv("BULK_REGISTER_EVERY", 50))  # Documents per registry write during a run
+        self.bulk_batches_path = "bulk_batches"
+        # OpenAI HTTP pool shared by chat and embedding calls
+        self.openai_timeout_seconds = float(os.getenv("OPENAI_TIMEOUT_SECONDS", 60))
+        self.openai_connect_timeout_seconds = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", 5))
+        self.openai_max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", 100))
+        self.openai_max_concurrency = int(os.getenv("OPENAI_MAX_CONCURRENCY", 32))  # In-flight completions per worker
+        self.openai_max_retries = int(os.getenv("OPENAI_MAX_RETRIES", 2))
+        # Store all documents in one shared index instead of one index per document
+        self.use_corpus_index = os.getenv("USE_CORPUS_INDEX", "false").lower() == "true"
+        self.corpus_index_name = "_corpus"
+        # FAISS index type per document: "auto" picks by chunk count, or one of flat, hnsw, ivf_flat, ivf_pq, sq8
+        self.vector_index_type = os.getenv("VECTOR_INDEX_TYPE", "auto").lower()
+        self.vector_index_sq8_min_chunks = int(os.getenv("VECTOR_INDEX_SQ8_MIN_CHUNKS", 10000))  # Exact flat search below this
+        self.vector_index_ivf_pq_min_chunks = int(os.getenv("VECTOR_INDEX_IVF_PQ_MIN_CHUNKS", 500000))  # int8 codes below this
+        self.vector_index_train_sample = int(os.getenv("VECTOR_INDEX_TRAIN_SAMPLE", 50000))  # Vectors used to train IVF/PQ/SQ
+        self.vector_index_pq_bytes = int(os.getenv("VECTOR_INDEX_PQ_BYTES", 96))  # Code size per chunk for ivf_pq
+        self.vector_index_hnsw_m = 32
+        self.vector_index_nprobe = int(os.getenv("VECTOR_INDEX_NPROBE", 16))  # IVF lists scanned per query
+        self.vector_index_ef_search = int(os.getenv("VECTOR_INDEX_EF_SEARCH", 64))  # HNSW candidates per query
+        # Byte budget for loaded vector stores kept in memory between queries
+        self.vector_store_pool_max_bytes = int(os.getenv("VECTOR_STORE_POOL_MAX_BYTES", 512 * 1024 * 1024))  # 512MB
+        # Background work once the service is answering /health
+        self.enable_startup_prewarm = os.getenv("ENABLE_STARTUP_PREWARM", "true").lower() == "true"
+        self.prewarm_documents = int(os.getenv("PREWARM_DOCUMENTS", 5))  # Most queried indexes loaded ahead of use
 
 settings = Settings()
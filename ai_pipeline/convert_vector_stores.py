@@ -0,0 +1,77 @@
+"""Convert per-document vector stores from the pickle format to the memory-mapped format.
+
+Stores written by older releases hold a LangChain FAISS index plus a pickled docstore
+(index.pkl), and so may the shared corpus index. The service no longer loads them, so run
+this once after upgrading. It also
+moves stores kept in plain directories behind a version link, which updates of the
+document otherwise do on the fly with a brief gap. Run while the service is stopped:
+    python convert_vector_stores.py
+    python convert_vector_stores.py --dry-run
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config.settings import settings
+from services.corpus_index import convert_pickle_corpus
+from services.mapped_vector_store import convert_pickle_store, is_mapped_store, is_pickle_store
+from services.store_versions import adopt_plain_directory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default=settings.vector_store_path, help="Directory holding one store per document")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the stores that would be converted")
+    args = parser.parse_args()
+
+    summary = {"converted": 0, "already_mapped": 0, "versioned": 0, "failed": 0, "chunks": 0}
+    started = time.perf_counter()
+    corpus_path = os.path.join(args.path, settings.corpus_index_name)
+    if is_pickle_store(corpus_path) and not is_mapped_store(corpus_path):
+        if args.dry_run:
+            print(json.dumps({"doc_id": settings.corpus_index_name, "status": "pending"}))
+        else:
+            try:
+                chunks = convert_pickle_corpus(corpus_path)
+                summary["converted"] += 1
+                summary["chunks"] += chunks
+                print(json.dumps({"doc_id": settings.corpus_index_name, "status": "converted", "chunks": chunks}))
+            except Exception as e:
+                summary["failed"] += 1
+                print(json.dumps({"doc_id": settings.corpus_index_name, "status": "failed", "error": str(e)}))
+
+    for doc_id in sorted(os.listdir(args.path)) if os.path.isdir(args.path) else []:
+        doc_path = os.path.join(args.path, doc_id)
+        if doc_id.startswith("_") or not os.path.isdir(doc_path):
+            continue
+        pending = is_pickle_store(doc_path) and not is_mapped_store(doc_path)
+        if is_mapped_store(doc_path):
+            summary["already_mapped"] += 1
+        if args.dry_run:
+            if pending:
+                print(json.dumps({"doc_id": doc_id, "status": "pending"}))
+            continue
+        try:
+            if pending:
+                chunks = convert_pickle_store(doc_path)
+                summary["converted"] += 1
+                summary["chunks"] += chunks
+                print(json.dumps({"doc_id": doc_id, "status": "converted", "chunks": chunks}))
+            # Corpus-backed documents only keep metadata here, but are versioned the same way
+            if adopt_plain_directory(doc_id, args.path):
+                summary["versioned"] += 1
+        except Exception as e:
+            summary["failed"] += 1
+            print(json.dumps({"doc_id": doc_id, "status": "failed", "error": str(e)}))
+
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    print(json.dumps(summary))
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,23 @@
-```python
 # Entry point for FastAPI AI pipeline
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from services.startup import startup_monitor  # First, so startup time covers every import below
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
 import uvicorn
 import os
+import asyncio
+from typing import Optional
 from pathlib import Path
-from utilities import create_directories
 
-from services.document_processor import DocumentProcessor
-from services.chat_service import ChatService
+from services.ingestion_queue import ingestion_queue
+from services.openai_clients import openai_clients
+from services.upload_spool import InvalidUpload, spool_upload
+from services import metrics
+from services.metrics import MetricsMiddleware
 from models.request_models import ChatRequest, MultiDocumentChatRequest
 from models.response_models import DocumentResponse, ChatResponse, StatusResponse
 from config.settings import settings
+from utils.sse_utils import sse_stream
 
 # Create FastAPI app
 app = FastAPI(
@@ -29,23 +35,76 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-document_processor = DocumentProcessor()
-chat_service = ChatService()
+# Request counts, latency and in-flight requests for /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Services are loaded on first use; importing them pulls in langchain, FAISS and the OpenAI SDK
+_services = {}
+_startup_tasks = []  # Keeps background startup work referenced until it finishes
+
+def load_document_processor():
+    from services.document_processor import document_processor
+    return document_processor
+
+def load_bulk_batches():
+    from services.bulk_ingestion import bulk_batches
+    return bulk_batches
+
+def load_chat_service():
+    from services.chat_service import chat_service
+    return chat_service
+
+async def get_document_processor():
+    """Shared document processor, imported in a worker thread on first use so the event loop keeps serving"""
+    if "document_processor" not in _services:
+        _services["document_processor"] = await asyncio.to_thread(load_document_processor)
+    return _services["document_processor"]
+
+async def resume_bulk_batches():
+    """Restart bulk batches interrupted by a restart; imports the ingestion stack, so it runs after startup"""
+    try:
+        bulk_batches = await asyncio.to_thread(load_bulk_batches)
+        await bulk_batches.resume(get_document_processor)
+    except Exception as e:
+        print(f"Warning: Could not resume bulk batches: {e}")
+
+async def get_chat_service():
+    if "chat_service" not in _services:
+        _services["chat_service"] = await asyncio.to_thread(load_chat_service)
+    return _services["chat_service"]
 
 # Create necessary directories
-create_directories(["temp_uploads", "vector_stores"])
+for directory in (settings.temp_uploads_path, settings.vector_store_path):
+    os.makedirs(directory, exist_ok=True)
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize cache and load existing documents on startup"""
+    """Open the document registry and start ingestion; heavy services load in the background"""
     try:
-        from services.cache_service import cache_service
-        print("Loading document cache from disk...")
-        cache_service.rebuild_cache_from_disk()
-        print("Cache initialization completed.")
+        from services.document_registry import document_registry
+        # The registry is read lazily; opening it only imports older layouts the first time
+        print(f"Document registry ready with {document_registry.open()} documents.")
+        document_registry.start_flushing()
     except Exception as e:
-        print(f"Warning: Cache initialization failed: {e}")
+        print(f"Warning: Startup initialization failed: {e}")
+
+    # Start background ingestion workers and resume jobs interrupted by a restart
+    await ingestion_queue.start(load_document_processor)
+
+    # Restart interrupted bulk batches and drop archives no batch needs, without holding up /health
+    _startup_tasks.append(asyncio.create_task(resume_bulk_batches()))
+
+    # Import the processing stack, load the corpus index and the most queried stores after /health is up
+    startup_monitor.start_prewarm(load_document_processor)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop ingestion workers, save search counts and close pooled OpenAI HTTP connections"""
+    from services.document_registry import document_registry
+    await ingestion_queue.stop()
+    await document_registry.stop_flushing()
+    await openai_clients.aclose()
+    metrics.mark_process_dead()
 
 @app.get("/")
 def read_root():
@@ -53,37 +112,105 @@ def read_root():
 
 @app.get("/health")
 async def health_check():
-    return {"success": True, "message": "Service is healthy"}
+    startup_monitor.mark_health()
+    return {"success": True, "message": "Service is healthy", "startup": startup_monitor.stats()}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Pipeline stage latencies, cache hits, errors and in-flight requests in the Prometheus text format"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
 
-@app.post("/api/documents/process")
-async def process_document(file: UploadFile = File(...)):
-    """Process uploaded PDF document and create vector embeddings"""
+# The upload is parsed by hand so it can be streamed to disk; this keeps the file field in the API docs
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"]
+                }
+            }
+        }
+    }
+}
+
+@app.post("/api/documents/process", openapi_extra=UPLOAD_REQUEST_BODY)
+async def process_document(request: Request):
+    """Queue uploaded PDF document for parsing and embedding; returns immediately"""
     try:
-        # Validate file type
-        if not file.filename.lower().endswith('.pdf'):
-            raise HTTPException(status_code=400, detail="Only PDF files are supported")
-        
-        # Validate file size (20MB limit)
-        file_content = await file.read()
-        if len(file_content) > 20 * 1024 * 1024:  # 20MB in bytes
-            raise HTTPException(status_code=400, detail="File size exceeds 20MB limit")
-        
-        # Process document
-        doc_id = await document_processor.process_document(file_content, file.filename)
+        if not openai_clients.api_key_available:
+            raise HTTPException(status_code=500, detail="OpenAI API key is not configured. Please set OPENAI_API_KEY environment variable.")
+
+        # Stream the upload to temp_uploads, enforcing the 20MB limit and the file type as it arrives
+        from utils.pdf_utils import validate_pdf_file
+        try:
+            filename, file_path, _ = await spool_upload(request, accept=validate_pdf_file, unsupported="Only PDF files are supported")
+        except InvalidUpload as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # Hand the document to the background workers
+        job = await ingestion_queue.submit(file_path, filename)
         
         return {
             "success": True,
-            "document_id": doc_id,
-            "message": f"Document {file.filename} processed successfully"
+            "document_id": job["doc_id"],
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "message": f"Document {filename} queued for processing"
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
 
+@app.post("/api/documents/bulk", openapi_extra=UPLOAD_REQUEST_BODY)
+async def bulk_process_documents(request: Request):
+    """Ingest every PDF in an uploaded zip or tar archive as one background batch"""
+    try:
+        if not openai_clients.api_key_available:
+            raise HTTPException(status_code=500, detail="OpenAI API key is not configured. Please set OPENAI_API_KEY environment variable.")
+
+        from services.bulk_ingestion import bulk_batches, is_archive
+        try:
+            filename, file_path, _ = await spool_upload(
+                request,
+                max_bytes=settings.bulk_max_upload_bytes,
+                accept=is_archive,
+                unsupported="Only .zip, .tar, .tar.gz and .tgz archives are supported"
+            )
+        except InvalidUpload as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        batch = bulk_batches.start(file_path, filename, get_document_processor)
+        return {
+            "success": True,
+            "batch_id": batch["batch_id"],
+            "status": batch["status"],
+            "message": f"Archive {filename} queued for bulk processing"
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing archive: {str(e)}")
+
+@app.get("/api/documents/bulk/{batch_id}")
+async def get_bulk_batch(batch_id: str):
+    """Get counts, throughput and ingested document ids of a bulk batch"""
+    from services.bulk_ingestion import bulk_batches
+    batch = bulk_batches.get(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return {"success": True, "batch": batch}
+
 @app.post("/api/chat/query")
 async def chat_query(request: ChatRequest):
     """Process chat query using RAG pipeline"""
     try:
+        chat_service = await get_chat_service()
         response = await chat_service.get_response(request.query, request.document_id)
         return response
     
@@ -94,17 +221,39 @@ async def chat_query(request: ChatRequest):
 async def search_multiple_documents(request: MultiDocumentChatRequest):
     """Search across multiple documents and return the best results"""
     try:
+        chat_service = await get_chat_service()
         response = await chat_service.search_multiple_documents(request.query, request.document_ids)
         return response
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching multiple documents: {str(e)}")
 
+@app.post("/api/chat/query/stream")
+async def chat_query_stream(request: ChatRequest):
+    """Stream a chat answer as Server-Sent Events: sources, tokens, then suggestions"""
+    chat_service = await get_chat_service()
+    return StreamingResponse(
+        sse_stream(chat_service.stream_response(request.query, request.document_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/chat/search-multiple/stream")
+async def search_multiple_documents_stream(request: MultiDocumentChatRequest):
+    """Stream a multi-document answer as Server-Sent Events"""
+    chat_service = await get_chat_service()
+    return StreamingResponse(
+        sse_stream(chat_service.stream_multiple_documents(request.query, request.document_ids)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/documents/list")
-async def list_documents():
-    """List all available documents"""
+async def list_documents(limit: Optional[int] = Query(None, ge=1, le=1000), cursor: Optional[int] = None):
+    """List available documents; pass limit and the returned next_cursor to page through them"""
     try:
-        documents = document_processor.list_documents()
+        document_processor = await get_document_processor()
+        documents, next_cursor = document_processor.list_documents(limit, cursor)
         
         # If no documents found, provide helpful message
         if not documents:
@@ -117,7 +266,8 @@ async def list_documents():
         return {
             "success": True,
             "documents": documents,
-            "count": len(documents)
+            "count": len(documents),
+            "next_cursor": next_cursor
         }
     
     except Exception as e:
@@ -127,20 +277,114 @@ async def list_documents():
             "message": f"Error retrieving documents: {str(e)}"
         }
 
+@app.get("/api/cache/vector-stores")
+async def vector_store_pool_stats():
+    """Report hit, miss and eviction counters of the loaded vector store pool"""
+    from services.vector_store_pool import vector_store_pool
+    return {"success": True, "stats": vector_store_pool.stats()}
+
+@app.get("/api/cache/embeddings")
+async def embedding_cache_stats():
+    """Report size and hit rate of the chunk embedding cache"""
+    from services.embedding_cache import embedding_cache
+    return {"success": True, "stats": embedding_cache.stats()}
+
+@app.get("/api/cache/responses")
+async def response_cache_stats():
+    """Report size and hit rate of the chat response cache"""
+    from services.response_cache import response_cache
+    return {"success": True, "stats": await response_cache.stats()}
+
+@app.get("/api/cache/conversations")
+async def conversation_memory_stats():
+    """Report session count, memory use and evictions of the conversation memory"""
+    from services.conversation_memory import conversation_memory
+    return {"success": True, "stats": conversation_memory.stats()}
+
+@app.get("/api/cache/query-embeddings")
+async def query_embedding_cache_stats():
+    """Report hit rate and embedding calls saved by the query embedding cache"""
+    from services.query_embedding_cache import query_embedding_cache
+    return {"success": True, "stats": query_embedding_cache.stats()}
+
 @app.get("/api/documents/status/{doc_id}")
 async def get_document_status(doc_id: str):
     """Get processing status of a document"""
     try:
+        job = await asyncio.to_thread(ingestion_queue.find_by_document, doc_id)
+        # The previous version keeps serving while an update runs, so only a first ingestion reports the job's status
+        if job and job["status"] != "done" and job.get("mode") != "update":
+            status = ingestion_queue.describe(job)
+            return {
+                "success": True,
+                "status": job["status"],
+                "stage": job["stage"],
+                "progress": job["progress"],
+                "job_id": job["job_id"],
+                "message": f"Document {doc_id} status: {status}"
+            }
+
+        document_processor = await get_document_processor()
         status = document_processor.get_document_status(doc_id)
-        return {"success": True, "message": f"Document {doc_id} status: {status}"}
+        response = {"success": True, "status": status, "message": f"Document {doc_id} status: {status}"}
+        if job and job.get("mode") == "update":
+            response["update"] = {"job_id": job["job_id"], "status": job["status"], "stage": job["stage"], "progress": job["progress"]}
+        return response
     
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Document not found: {str(e)}")
 
+@app.get("/api/documents/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """Get stage and progress of a background ingestion job"""
+    job = ingestion_queue.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return {"success": True, "job": job, "message": ingestion_queue.describe(job)}
+
+@app.delete("/api/documents/jobs/{job_id}")
+async def cancel_ingestion_job(job_id: str):
+    """Cancel a queued or running ingestion job"""
+    if not ingestion_queue.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is not queued or running")
+    return {"success": True, "message": f"Job {job_id} cancelled"}
+
+@app.put("/api/documents/{doc_id}", openapi_extra=UPLOAD_REQUEST_BODY)
+async def update_document(doc_id: str, request: Request):
+    """Queue a new version of a PDF document; it keeps its doc_id and only changed pages are re-embedded"""
+    try:
+        if not openai_clients.api_key_available:
+            raise HTTPException(status_code=500, detail="OpenAI API key is not configured. Please set OPENAI_API_KEY environment variable.")
+
+        from services.document_registry import document_registry
+        if not await asyncio.to_thread(document_registry.get, doc_id):
+            raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
+
+        from utils.pdf_utils import validate_pdf_file
+        try:
+            filename, file_path, _ = await spool_upload(request, accept=validate_pdf_file, unsupported="Only PDF files are supported")
+        except InvalidUpload as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        job = await ingestion_queue.submit(file_path, filename, doc_id=doc_id)
+        return {
+            "success": True,
+            "document_id": doc_id,
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "message": f"Document {filename} queued to replace {doc_id}"
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating document: {str(e)}")
+
 @app.delete("/api/documents/{doc_id}")
 async def delete_document(doc_id: str):
     """Remove document from vector store"""
     try:
+        document_processor = await get_document_processor()
         await document_processor.delete_document(doc_id)
         return {"success": True, "message": f"Document {doc_id} deleted successfully"}
     
@@ -149,4 +393,3 @@ async def delete_document(doc_id: str):
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8001)
-```
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""Re-embed per-document vector stores after the embedding model or width settings change.
+
+Stores record the embedding space they were built in. Queries are embedded in the configured
+space, so stores from another space (or missing a configured PCA projection) are rebuilt
+from their stored chunk text. The shared corpus index is rebuilt the same way, as a whole. Unchanged chunks come from the embedding cache when it holds
+them in the new space. Run while the service is stopped:
+    EMBEDDING_MODEL=text-embedding-3-small EMBEDDING_DIMENSIONS=512 python reembed_vector_stores.py
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config.settings import settings
+from services.document_registry import document_registry
+from services.openai_clients import openai_clients
+
+
+async def reembed(doc_ids) -> dict:
+    from services.document_processor import document_processor
+
+    summary = {"reembedded": 0, "unchanged": 0, "failed": 0}
+    if settings.use_corpus_index:
+        # Corpus-backed documents can only be checked once the shared index is in the new space
+        started = time.perf_counter()
+        changed = await document_processor.reembed_corpus()
+        summary["corpus"] = "reembedded" if changed else "unchanged"
+        if changed:
+            print(json.dumps({"corpus": "reembedded", "seconds": round(time.perf_counter() - started, 3)}))
+    for doc_id in doc_ids:
+        try:
+            started = time.perf_counter()
+            changed = await document_processor.reembed_document(doc_id)
+            summary["reembedded" if changed else "unchanged"] += 1
+            if changed:
+                print(json.dumps({"doc_id": doc_id, "status": "reembedded", "seconds": round(time.perf_counter() - started, 3)}))
+        except Exception as e:
+            summary["failed"] += 1
+            print(json.dumps({"doc_id": doc_id, "status": "failed", "error": str(e)}))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("doc_ids", nargs="*", help="Only these documents; defaults to every registered document")
+    args = parser.parse_args()
+
+    if not openai_clients.api_key_available:
+        sys.exit("OPENAI_API_KEY is not configured")
+    document_registry.open()
+    doc_ids = args.doc_ids or [record["doc_id"] for record in document_registry.list_page()[0]]
+
+    started = time.perf_counter()
+    summary = asyncio.run(reembed(doc_ids))
+    document_registry.flush()
+    summary["embedding_space"] = openai_clients.embedding_space
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    print(json.dumps(summary))
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+import os
+import json
+import time
+import fcntl
+import uuid
+import shutil
+import asyncio
+import tarfile
+import zipfile
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config.settings import settings
+from services.corpus_index import corpus_index
+from services.document_registry import document_registry
+from services.lexical_index import LexicalIndex
+from services.metrics import errors, ingestion_stage_seconds
+from utils.pdf_utils import calculate_path_hash, extract_all_pages
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+
+
+def is_archive(name: str) -> bool:
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _too_large(size: int) -> Optional[str]:
+    """Why a PDF is refused, if it is larger than a single upload may be"""
+    if size > settings.max_file_size:
+        return f"File size exceeds {settings.max_file_size // (1024 * 1024)}MB limit"
+    return None
+
+
+def extract_archive(
+    archive_path: str, directory: str, name: Optional[str] = None, rejected: Optional[List[Tuple[str, str]]] = None
+) -> List[Tuple[str, str]]:
+    """Unpack the PDFs in a zip or tar archive; returns (path, original filename) pairs
+
+    Members are written under generated names, so paths inside the archive never decide where files land.
+    PDFs over the upload size limit are left out and added to rejected as (filename, reason). An archive
+    whose PDFs add up to more than BULK_MAX_EXTRACTED_BYTES is refused before anything is written.
+    """
+    name = (name or archive_path).lower()
+    rejected = rejected if rejected is not None else []
+    files = []
+
+    def select(members: List[Tuple[Any, str, int]]) -> List[Tuple[Any, str, int]]:
+        """Keep the members small enough to unpack, judged by the sizes in the archive's headers"""
+        selected = []
+        for member, member_name, size in members:
+            reason = _too_large(size)
+            if reason:
+                rejected.append((os.path.basename(member_name), reason))
+            else:
+                selected.append((member, member_name, size))
+        total = sum(size for _, _, size in selected)
+        if total > settings.bulk_max_extracted_bytes:
+            raise Exception(
+                f"Archive unpacks to {total // (1024 * 1024)}MB of PDFs, over the "
+                f"{settings.bulk_max_extracted_bytes // (1024 * 1024)}MB limit"
+            )
+        return selected
+
+    def unpack(source, member_name: str, size: int):
+        path = os.path.join(directory, f"{uuid.uuid4()}.pdf")
+        written = 0
+        with open(path, 'wb') as f:
+            while True:
+                data = source.read(1024 * 1024)
+                if not data:
+                    break
+                written += len(data)
+                # Never write more than the header declared, whatever the compressed stream holds
+                if written > size:
+                    raise Exception(f"{member_name} is larger than its archive entry says")
+                f.write(data)
+        files.append((path, os.path.basename(member_name)))
+
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(archive_path) as archive:
+            members = [
+                (member, member.filename, member.file_size) for member in archive.infolist()
+                if not member.is_dir() and member.filename.lower().endswith(".pdf")
+            ]
+            for member, member_name, size in select(members):
+                with archive.open(member) as source:
+                    unpack(source, member_name, size)
+    else:
+        with tarfile.open(archive_path) as archive:
+            members = [
+                (member, member.name, member.size) for member in archive.getmembers()
+                if member.isfile() and member.name.lower().endswith(".pdf")
+            ]
+            for member, member_name, size in select(members):
+                with archive.extractfile(member) as source:
+                    unpack(source, member_name, size)
+    return files
+
+
+def discover_files(sources: List[str], work_dir: str, rejected: Optional[List[Tuple[str, str]]] = None) -> List[Tuple[str, str]]:
+    """PDFs under each directory, inside each archive, or named directly; returns (path, filename) pairs
+
+    PDFs over the upload size limit are left out and added to rejected as (filename, reason).
+    """
+    rejected = rejected if rejected is not None else []
+    found = []
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, names in os.walk(source):
+                dirs.sort()
+                found.extend((os.path.join(root, name), name) for name in sorted(names) if name.lower().endswith(".pdf"))
+        elif is_archive(source):
+            found.extend(extract_archive(source, work_dir, rejected=rejected))
+        elif source.lower().endswith(".pdf") and os.path.isfile(source):
+            found.append((source, os.path.basename(source)))
+        else:
+            raise Exception(f"Not a directory, archive or PDF: {source}")
+
+    files = []
+    for path, filename in found:
+        reason = _too_large(os.path.getsize(path))
+        if reason:
+            rejected.append((filename, reason))
+        else:
+            files.append((path, filename))
+    return files
+
+
+class BulkIngestion:
+    """One bulk run: files stream through parse, embed and index stages, each with its own workers
+
+    Finished documents are registered BULK_REGISTER_EVERY at a time, one transaction each, so a
+    crash leaves at most that many stored but unregistered documents behind.
+    """
+
+    def __init__(self, document_processor, checkpoint: Optional[Callable[[], None]] = None):
+        self.processor = document_processor
+        self.checkpoint = checkpoint  # Called after each registry write, e.g. to save the report
+        self.records: List[Dict[str, Any]] = []
+        self._unregistered: List[Dict[str, Any]] = []
+        self.report: Dict[str, Any] = {
+            "files": 0, "ingested": 0, "skipped_existing": 0, "skipped_duplicate": 0, "failed": 0,
+            "pages": 0, "chunks": 0, "stage_seconds": {}, "failures": [],
+        }
+
+    def _count_stage(self, stage: str, seconds: float):
+        stages = self.report["stage_seconds"]
+        stages[stage] = round(stages.get(stage, 0.0) + seconds, 3)
+
+    def _fail(self, item: Dict[str, Any], error: Exception):
+        print(f"Bulk ingestion of {item['filename']} failed: {error}")
+        errors.labels(source="ingestion").inc()
+        self.report["failed"] += 1
+        self.report["failures"].append({"filename": item["filename"], "error": str(error)})
+
+    async def _feed(self, files: List[Tuple[str, str]], outbox: asyncio.Queue, workers: int):
+        """Hash each file and pass on the ones not ingested before"""
+        seen = set()
+        for path, filename in files:
+            started = time.perf_counter()
+            content_hash = await asyncio.to_thread(calculate_path_hash, path)
+            existing = await asyncio.to_thread(document_registry.find_by_hashes, [content_hash])
+            self._count_stage("hash", time.perf_counter() - started)
+            if content_hash in existing:
+                self.report["skipped_existing"] += 1
+            elif content_hash in seen:
+                self.report["skipped_duplicate"] += 1
+            else:
+                seen.add(content_hash)
+                await outbox.put({"path": path, "filename": filename, "content_hash": content_hash, "doc_id": str(uuid.uuid4())})
+        for _ in range(workers):
+            await outbox.put(None)
+
+    async def _stage(
+        self,
+        workers: int,
+        inbox: asyncio.Queue,
+        outbox: Optional[asyncio.Queue],
+        next_workers: int,
+        handler: Callable[[Dict[str, Any]], Awaitable[None]]
+    ):
+        """Run `workers` copies of handler over inbox, passing each finished item on to outbox"""
+        async def worker():
+            while True:
+                item = await inbox.get()
+                if item is None:
+                    return
+                try:
+                    await handler(item)
+                except Exception as e:
+                    self._fail(item, e)
+                    continue
+                if outbox is not None:
+                    await outbox.put(item)
+
+        await asyncio.gather(*[worker() for _ in range(workers)])
+        if outbox is not None:
+            for _ in range(next_workers):
+                await outbox.put(None)
+
+    async def _parse(self, item: Dict[str, Any]):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            # One whole document per parse process, so several documents parse side by side
+            with ingestion_stage_seconds.labels(stage="parse").time():
+                pages = await loop.run_in_executor(
+                    self.processor._get_parse_pool(), extract_all_pages, item["path"], settings.pdf_page_timeout_seconds
+                )
+        except BrokenProcessPool:
+            type(self.processor)._parse_pool = None
+            raise
+        self._count_stage("parse", time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ingestion_stage_seconds.labels(stage="split").time():
+            item["lexical_index"] = LexicalIndex()
+            item["documents"] = await asyncio.to_thread(self.processor._text_to_docs, pages, item["filename"], item["lexical_index"])
+            item["page_hashes"] = self.processor._page_hashes(pages)
+        self._count_stage("split", time.perf_counter() - started)
+        self.report["pages"] += len(pages)
+
+    async def _embed(self, item: Dict[str, Any]):
+        started = time.perf_counter()
+        with ingestion_stage_seconds.labels(stage="embed").time():
+            item["vectors"] = await self.processor._embed_documents(item["documents"])
+        self._count_stage("embed", time.perf_counter() - started)
+
+    async def _index(self, item: Dict[str, Any]):
+        started = time.perf_counter()
+        record = await self.processor._store_document(
+            item["doc_id"], item["filename"], item["documents"], item["vectors"], item["lexical_index"],
+            item["content_hash"], register=False, page_hashes=item["page_hashes"]
+        )
+        self._count_stage("index", time.perf_counter() - started)
+        self.records.append(record)
+        self._unregistered.append(record)
+        self.report["ingested"] += 1
+        self.report["chunks"] += len(item["documents"])
+        # Chunks and vectors are on disk now; let them go while the rest of the run continues
+        item.clear()
+        if len(self._unregistered) >= settings.bulk_register_every:
+            await self._register()
+
+    async def _register(self):
+        """Write the registry rows of documents stored since the last call, in one transaction"""
+        records, self._unregistered = self._unregistered, []
+        if not records:
+            return
+        started = time.perf_counter()
+        if settings.use_corpus_index:
+            # Register documents only once the corpus index holding their chunks is on disk
+            await asyncio.to_thread(corpus_index.flush)
+        await asyncio.to_thread(document_registry.register_many, records)
+        self._count_stage("registry", time.perf_counter() - started)
+        if self.checkpoint:
+            self.checkpoint()
+
+    async def run(self, sources: List[str]) -> Dict[str, Any]:
+        """Ingest every PDF found in sources; returns the throughput report"""
+        if not self.processor.api_key_available:
+            raise Exception("OpenAI API key is not configured. Please set OPENAI_API_KEY environment variable.")
+        started = time.perf_counter()
+        os.makedirs(settings.temp_uploads_path, exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix="bulk-", dir=settings.temp_uploads_path)
+        try:
+            rejected = []
+            files = await asyncio.to_thread(discover_files, sources, work_dir, rejected)
+            self.report["files"] = len(files) + len(rejected)
+            for filename, reason in rejected:
+                self._fail({"filename": filename}, Exception(reason))
+
+            parse_workers = max(1, settings.pdf_parse_workers)
+            embed_workers = max(1, settings.bulk_embed_documents)
+            index_workers = max(1, settings.bulk_index_workers)
+            # Bounded queues keep only a few parsed or embedded documents in memory at a time
+            to_parse = asyncio.Queue(maxsize=parse_workers * 2)
+            to_embed = asyncio.Queue(maxsize=embed_workers * 2)
+            to_index = asyncio.Queue(maxsize=index_workers * 2)
+            if settings.use_corpus_index:
+                # One corpus index save for the whole run instead of one per document
+                corpus_index.defer_saves()
+            try:
+                await asyncio.gather(
+                    self._feed(files, to_parse, parse_workers),
+                    self._stage(parse_workers, to_parse, to_embed, embed_workers, self._parse),
+                    self._stage(embed_workers, to_embed, to_index, index_workers, self._embed),
+                    self._stage(index_workers, to_index, None, 0, self._index),
+                )
+            finally:
+                if settings.use_corpus_index:
+                    await asyncio.to_thread(corpus_index.resume_saves)
+                # Documents stored before a failure are complete, so they are registered either way
+                await self._register()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        seconds = time.perf_counter() - started
+        self.report.update({
+            "seconds": round(seconds, 3),
+            "files_per_second": round(self.report["ingested"] / seconds, 2) if seconds else 0.0,
+            "pages_per_second": round(self.report["pages"] / seconds, 1) if seconds else 0.0,
+            "chunks_per_second": round(self.report["chunks"] / seconds, 1) if seconds else 0.0,
+            "documents": [{"doc_id": record["doc_id"], "filename": record["filename"]} for record in self.records],
+        })
+        return self.report
+
+
+class BulkBatches:
+    """Bulk runs started over HTTP from an uploaded archive
+
+    Batches live in bulk_batches/<batch_id>.json, so any worker can report on them and they survive
+    restarts. The worker running a batch holds bulk_batches/<batch_id>.lock; a batch whose worker
+    exited mid-run is started again by resume, and files it already ingested are skipped by content hash.
+    """
+
+    def __init__(self):
+        self.batches: Dict[str, Dict[str, Any]] = {}  # Batches this worker runs
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._locks: Dict[str, Any] = {}  # batch_id -> lock file held while this worker runs it
+
+    def _batch_file(self, batch_id: str) -> str:
+        return os.path.join(settings.bulk_batches_path, f"{batch_id}.json")
+
+    def _lock_path(self, batch_id: str) -> str:
+        return os.path.join(settings.bulk_batches_path, f"{batch_id}.lock")
+
+    def _read(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._batch_file(batch_id), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error loading bulk batch {batch_id}: {e}")
+            return None
+
+    def _persist(self, batch: Dict[str, Any]):
+        batch["updated_at"] = time.time()
+        temp_file = f"{self._batch_file(batch['batch_id'])}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(batch, f)
+        os.replace(temp_file, self._batch_file(batch["batch_id"]))
+
+    def _try_lock(self, batch_id: str) -> bool:
+        """Claim a batch unless another worker is running it; the lock goes with the process"""
+        f = open(self._lock_path(batch_id), 'a')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._locks[batch_id] = f
+        return True
+
+    def _unlock(self, batch_id: str):
+        f = self._locks.pop(batch_id, None)
+        if f is not None:
+            if os.path.exists(self._lock_path(batch_id)):
+                os.remove(self._lock_path(batch_id))
+            f.close()
+
+    def start(self, archive_path: str, filename: str, get_document_processor: Callable[[], Awaitable[Any]]) -> Dict[str, Any]:
+        """Run a bulk ingestion of the archive in the background; the batch takes over the file"""
+        batch_id = str(uuid.uuid4())
+        suffix = next(suffix for suffix in ARCHIVE_SUFFIXES[::-1] if filename.lower().endswith(suffix))
+        path = os.path.join(settings.temp_uploads_path, f"batch-{batch_id}{suffix}")
+        os.makedirs(settings.bulk_batches_path, exist_ok=True)
+        self._try_lock(batch_id)
+        batch = {
+            "batch_id": batch_id, "filename": filename, "archive_path": path, "status": "running",
+            "report": None, "error": None, "created_at": time.time()
+        }
+        # Recorded before the archive moves into place, so resume never takes it for an orphan
+        self._persist(batch)
+        os.replace(archive_path, path)
+        self._launch(batch, get_document_processor)
+        return batch
+
+    def _launch(self, batch: Dict[str, Any], get_document_processor: Callable[[], Awaitable[Any]]):
+        self.batches[batch["batch_id"]] = batch
+        self._tasks[batch["batch_id"]] = asyncio.create_task(self._run(batch, get_document_processor))
+
+    async def _run(self, batch: Dict[str, Any], get_document_processor: Callable[[], Awaitable[Any]]):
+        try:
+            bulk = BulkIngestion(await get_document_processor(), checkpoint=lambda: self._persist(batch))
+            batch["report"] = bulk.report  # Live counts while the run is in progress
+            await bulk.run([batch["archive_path"]])
+            batch["status"] = "done"
+        except Exception as e:
+            print(f"Bulk ingestion batch {batch['batch_id']} failed: {e}")
+            errors.labels(source="ingestion").inc()
+            batch.update({"status": "failed", "error": str(e)})
+        finally:
+            self._tasks.pop(batch["batch_id"], None)
+            self._persist(batch)
+            # A batch stopped by shutdown keeps its archive, so resume can run it again
+            if batch["status"] != "running" and os.path.exists(batch["archive_path"]):
+                os.remove(batch["archive_path"])
+            self._unlock(batch["batch_id"])
+
+    async def resume(self, get_document_processor: Callable[[], Awaitable[Any]]) -> int:
+        """Restart batches left running by a worker that exited; returns the number restarted in this worker"""
+        batches = await asyncio.to_thread(self._claim_interrupted)
+        for batch in batches:
+            print(f"Resuming bulk batch {batch['batch_id']} ({batch['filename']})")
+            self._launch(batch, get_document_processor)
+        return len(batches)
+
+    def _claim_interrupted(self) -> List[Dict[str, Any]]:
+        """Lock the batches whose worker exited mid-run, prune old ones and remove orphaned archives"""
+        os.makedirs(settings.bulk_batches_path, exist_ok=True)
+        cutoff = time.time() - settings.ingestion_job_ttl_seconds
+        claimed = []
+        for name in sorted(os.listdir(settings.bulk_batches_path)):
+            if not name.endswith(".json"):
+                continue
+            batch_id = name[:-len(".json")]
+            batch = self._read(batch_id)
+            if batch is None:
+                continue
+            if batch["status"] != "running":
+                if batch.get("updated_at", batch["created_at"]) < cutoff:
+                    os.remove(self._batch_file(batch_id))
+                continue
+            if batch_id in self.batches or not self._try_lock(batch_id):
+                continue  # Still running here or in another worker
+            # Read again under the lock; the batch may have finished in the meantime
+            batch = self._read(batch_id)
+            if batch is None or batch["status"] != "running":
+                self._unlock(batch_id)
+                continue
+            if not os.path.exists(batch["archive_path"]):
+                batch.update({"status": "failed", "error": "The uploaded archive is no longer available"})
+                self._persist(batch)
+                self._unlock(batch_id)
+                continue
+            claimed.append(batch)
+
+        if os.path.exists(settings.temp_uploads_path):
+            for name in os.listdir(settings.temp_uploads_path):
+                if not name.startswith("batch-"):
+                    continue
+                batch = self._read(name[len("batch-"):].split(".", 1)[0])
+                if batch is None or batch["status"] != "running":
+                    os.remove(os.path.join(settings.temp_uploads_path, name))
+        return claimed
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        return self.batches.get(batch_id) or self._read(batch_id)
+
+
+# Global bulk batch tracker instance
+bulk_batches = BulkBatches()
@@ -1,27 +1,47 @@
-from openai import OpenAI
-from typing import Optional, List, Dict, Any
-import re
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
+import asyncio
+import heapq
+from concurrent.futures import ThreadPoolExecutor
 
 from config.settings import settings
-from services.document_processor import DocumentProcessor
-from services.cache_service import cache_service
+from services.document_processor import document_processor
+from services.document_registry import document_registry
+from services.openai_clients import openai_clients
+from services.response_cache import response_cache
+from services.conversation_memory import conversation_memory, NO_HISTORY
+from services.query_embedding_cache import query_embedding_cache
+from services.lexical_index import is_identifier_query
+from services.metrics import chat_stage_seconds, errors
+from utils.pdf_utils import calculate_file_hash
+from services.response_parser import parse_response, StreamingResponseParser
 
 class ChatService:
+    # Per-document store loads and searches fan out here; FAISS releases the GIL while searching
+    _search_pool: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def _get_search_pool(cls) -> ThreadPoolExecutor:
+        if cls._search_pool is None:
+            cls._search_pool = ThreadPoolExecutor(max_workers=settings.search_fanout_workers, thread_name_prefix="document-search")
+        return cls._search_pool
+
     def __init__(self):
-        if not settings.openai_api_key or settings.openai_api_key == "your_openai_api_key_here":
+        if not openai_clients.api_key_available:
             self.api_key_available = False
             self.client = None
         else:
             self.api_key_available = True
-            self.client = OpenAI(api_key=settings.openai_api_key)
+            self.client = openai_clients.chat
         
-        self.document_processor = DocumentProcessor()
+        # One processor and embeddings client for the whole service
+        self.document_processor = document_processor
         
-        # Add response cache to prevent repeated API calls for the same query
-        self.response_cache = {}
+        # Bounded LRU/TTL cache shared with the document processor, which invalidates it
+        self.response_cache = response_cache
         
-        # Simple conversation memory storage (in production, use Redis or database)
-        self.conversation_memory = {}
+        # Bounded session memory, optionally persisted to SQLite
+        self.conversation_memory = conversation_memory
+        self._background_tasks = set()
         
         # Define the RAG prompt template
         self.prompt_template = """
@@ -54,46 +74,359 @@ class ChatService:
         3. [Third relevant question]
         """
         
-        # Add periodic cache cleanup
-        self._cleanup_cache()
-    
-    def _cleanup_cache(self):
-        """Clean up old cache entries to prevent memory bloat"""
-        if len(self.response_cache) > 100:  # Arbitrary threshold
-            print(f"Cleaning up response cache ({len(self.response_cache)} entries)")
-            # Just reset the cache completely for simplicity
-            self.response_cache = {}
-
-    def _get_conversation_history(self, session_id: str, max_turns: int = 3) -> str:
-        """Get recent conversation history for context"""
-        if session_id not in self.conversation_memory:
-            return "No previous conversation context."
-        
-        history = self.conversation_memory[session_id]
-        recent_history = history[-max_turns*2:]  # Last few Q&A pairs
-        
-        if not recent_history:
-            return "No previous conversation context."
-        
-        formatted_history = []
-        for i in range(0, len(recent_history), 2):
-            if i + 1 < len(recent_history):
-                formatted_history.append(f"Previous Question: {recent_history[i]}")
-                formatted_history.append(f"Previous Answer: {recent_history[i+1]}")
-        
-        return "\n".join(formatted_history) if formatted_history else "No previous conversation context."
+        self.single_document_system_prompt = "You are a helpful assistant that can maintain conversation context and search documents."
+        self.multi_document_system_prompt = "You are a helpful assistant that can search across multiple documents and maintain conversation context."
+
+        self.general_model = "gpt-3.5-turbo"  # Faster and cheaper model for simple queries
+        self.rag_model = "gpt-4o-mini"  # Better reasoning with documents
+
+        # Cached answers are keyed on the prompts too, so editing them retires old answers
+        self.prompt_version = calculate_file_hash(
+            "\n".join([self.prompt_template, self.single_document_system_prompt, self.multi_document_system_prompt]).encode("utf-8")
+        )[:12]
+
+    async def _get_conversation_history(self, session_id: str) -> str:
+        """Get recent conversation history for context, packed to the token budget"""
+        with chat_stage_seconds.labels(stage="history").time():
+            return await asyncio.to_thread(self.conversation_memory.get_history, session_id)
     
-    def _update_conversation_memory(self, session_id: str, question: str, response: str):
+    async def _update_conversation_memory(self, session_id: str, question: str, response: str):
         """Update conversation memory with latest Q&A"""
-        if session_id not in self.conversation_memory:
-            self.conversation_memory[session_id] = []
-        
-        # Add question and response
-        self.conversation_memory[session_id].extend([question, response])
-        
-        # Keep only last 10 exchanges (20 items) to prevent memory overflow
-        if len(self.conversation_memory[session_id]) > 20:
-            self.conversation_memory[session_id] = self.conversation_memory[session_id][-20:]
+        needs_summary = await asyncio.to_thread(self.conversation_memory.add_turn, session_id, question, response)
+        if needs_summary:
+            # Summarize off the request path; the answer has already been produced
+            task = asyncio.create_task(self.conversation_memory.compact(session_id, self._summarize_conversation))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+
+    async def _summarize_conversation(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        """Fold older exchanges into the running summary of a conversation"""
+        transcript = "\n".join(f"User: {question}\nAssistant: {answer}" for question, answer in turns)
+        prompt = (
+            "Update the summary of this conversation between a student and the campus assistant. "
+            "Keep facts, names, dates and open questions; drop pleasantries. Reply with the summary only.\n\n"
+            f"CURRENT SUMMARY:\n{summary or 'None'}\n\nNEW EXCHANGES:\n{transcript}"
+        )
+        async with openai_clients.semaphore:
+            response = await self.client.chat.completions.create(
+                model=self.general_model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=settings.conversation_summary_max_tokens
+            )
+        return response.choices[0].message.content.strip()
+
+    async def _embed_query(self, query: str) -> List[float]:
+        """Query vector from the shared LRU, embedding it only if this question is new"""
+        with chat_stage_seconds.labels(stage="embed").time():
+            return await query_embedding_cache.embed(query, self.document_processor.embeddings)
+
+    async def _search_document(self, document_id: str, query: str, k: int, query_vector: Optional[List[float]] = None):
+        """Load and search the store in a worker thread; returns (chunk, distance) pairs"""
+        if query_vector is None:
+            query_vector = await self._embed_query(query)
+        with chat_stage_seconds.labels(stage="load").time():
+            vector_store = await asyncio.to_thread(self.document_processor.get_vector_store, document_id)
+        with chat_stage_seconds.labels(stage="search").time():
+            return await asyncio.to_thread(vector_store.similarity_search_with_score_by_vector, query_vector, k=k)
+
+    def _load_and_search(self, document_id: str, query_vector: List[float], k: int):
+        """Blocking load and search of one document's store, run on the search pool"""
+        with chat_stage_seconds.labels(stage="load").time():
+            vector_store = self.document_processor.get_vector_store(document_id)
+        with chat_stage_seconds.labels(stage="search").time():
+            return vector_store.similarity_search_with_score_by_vector(query_vector, k=k)
+
+    async def _fan_out_search(self, document_ids: List[str], query_vector: List[float], k: int):
+        """Search every document concurrently; stores that miss their deadline or fail are left out
+
+        Each search gets SEARCH_DOCUMENT_TIMEOUT_SECONDS of its own once a pool thread picks it up, but no
+        search waits longer than the whole fan-out deadline, so threads stuck on hung stores cannot stall it.
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._get_search_pool()
+        timeout = settings.search_document_timeout_seconds
+        # Enough for every search to run its full timeout after queueing behind the others
+        rounds = -(-len(document_ids) // max(1, settings.search_fanout_workers))
+        deadline = loop.time() + timeout * max(1, rounds)
+
+        async def search_one(doc_id: str):
+            started = asyncio.Event()
+
+            def run():
+                loop.call_soon_threadsafe(started.set)
+                return self._load_and_search(doc_id, query_vector, k)
+
+            future = loop.run_in_executor(pool, run)
+            try:
+                # The per-search timeout starts once a pool thread picks the search up, within the overall deadline
+                await asyncio.wait_for(started.wait(), max(0.0, deadline - loop.time()))
+                return doc_id, "done", await asyncio.wait_for(future, min(timeout, max(0.0, deadline - loop.time())))
+            except asyncio.TimeoutError:
+                # A queued search is cancelled; a running thread cannot be interrupted, so its result is dropped
+                future.cancel()
+                return doc_id, "late", None
+            except Exception as e:
+                print(f"Error searching document {doc_id}: {str(e)}")
+                return doc_id, "failed", None
+
+        results, late, failed = [], [], []
+        for doc_id, outcome, result in await asyncio.gather(*(search_one(doc_id) for doc_id in document_ids)):
+            if outcome == "done":
+                results.append((doc_id, result))
+            else:
+                (late if outcome == "late" else failed).append(doc_id)
+        if late:
+            print(f"Dropped {len(late)} document searches that missed their deadline")
+
+        # Keep the caller's document order so distance ties resolve deterministically
+        order = {doc_id: position for position, doc_id in enumerate(document_ids)}
+        results.sort(key=lambda item: order[item[0]])
+        return results, {"late_documents": sorted(late, key=order.get), "failed_documents": sorted(failed, key=order.get)}
+
+    @staticmethod
+    def _relevance(distance: float) -> float:
+        """Cosine similarity from a squared L2 distance between unit-length embeddings, clamped to [0, 1]
+
+        Exact for flat, HNSW and IVF-flat stores and for the corpus index. SQ8 and IVF-PQ stores
+        score hits against their decoded vectors, and PCA-projected stores add back an estimate of
+        what the projection dropped. For those the score, and so MIN_RELEVANCE_SCORE, is approximate.
+        """
+        return round(max(0.0, min(1.0, 1.0 - float(distance) / 2.0)), 4)
+
+    def _above_cutoff(self, scored_results: List[Tuple[Any, float]]) -> List[Tuple[Any, float]]:
+        """Drop chunks less relevant than the configured cutoff"""
+        return [(result, distance) for result, distance in scored_results if self._relevance(distance) >= settings.min_relevance_score]
+
+    def _format_source(self, result, document_id: Optional[str], relevance_score: float) -> Dict[str, Any]:
+        """Build the source entry shown to the user for a retrieved chunk"""
+        source = {
+            "filename": result.metadata.get("filename", "unknown"),
+            "page": result.metadata.get("page", 0),
+            "chunk": result.metadata.get("chunk", 0),
+            "content_preview": result.page_content[:100] + "..." if len(result.page_content) > 100 else result.page_content,
+            "relevance_score": relevance_score,
+            "title": f"{result.metadata.get('filename', 'Document')} - Page {result.metadata.get('page', 0)}"
+        }
+        if document_id:
+            source["document_id"] = document_id
+        return source
+
+    def _fuse(self, vector_ranked: List[Tuple[str, Any]], lexical_hits: List[Tuple[float, str, Any]], k: int) -> List[Tuple[float, str, Any]]:
+        """Reciprocal rank fusion of the vector and BM25 rankings; returns (relevance, doc_id, chunk), best first
+
+        Fused scores come from ranks, not similarity, so they have their own cutoff; vector
+        results are held to the cosine cutoff before they get here.
+        """
+        fused = {}
+        rankings = [ranking for ranking in (vector_ranked, [(doc_id, chunk) for _, doc_id, chunk in lexical_hits]) if ranking]
+        for ranking in rankings:
+            for rank, (doc_id, chunk) in enumerate(ranking):
+                entry = fused.setdefault((doc_id, chunk.metadata.get("source")), [0.0, doc_id, chunk])
+                entry[0] += 1.0 / (settings.rrf_k + rank + 1)
+        if not fused:
+            return []
+        # Scale so a chunk ranked first by every retriever that returned anything scores 1.0
+        best_possible = len(rankings) / (settings.rrf_k + 1)
+        best = heapq.nlargest(k, fused.values(), key=lambda entry: entry[0])
+        scored = [(round(score / best_possible, 4), doc_id, chunk) for score, doc_id, chunk in best]
+        return [entry for entry in scored if entry[0] >= settings.hybrid_min_score]
+
+    async def _lexical_search(self, query: str, document_ids: List[str], k: int):
+        if not settings.enable_hybrid_search:
+            return []
+        try:
+            with chat_stage_seconds.labels(stage="lexical_search").time():
+                return await asyncio.to_thread(self.document_processor.lexical_search, query, document_ids, k)
+        except Exception as e:
+            print(f"Error in lexical search: {str(e)}")
+            return []
+
+    async def _retrieve_document(self, query: str, document_id: str, query_vector: Optional[List[float]] = None):
+        """Retrieve context and sources for a single document"""
+        # Search counts decide which indexes are prewarmed after a restart
+        document_registry.record_queries([document_id])
+        k = settings.similarity_search_k
+        candidates = max(k, settings.hybrid_candidates)
+        lexical_hits = await self._lexical_search(query, [document_id], candidates)
+
+        if lexical_hits and query_vector is None and is_identifier_query(query):
+            # Exact lookups such as a course code are answered from the inverted index without embedding the query
+            ranked = self._fuse([], lexical_hits, k)
+        else:
+            if query_vector is None:
+                query_vector = await self._embed_query(query)
+            query_embedding_cache.count_searches(1)
+            vector_k = candidates if lexical_hits else k
+            if settings.use_corpus_index:
+                with chat_stage_seconds.labels(stage="search").time():
+                    search_results = await self.document_processor.search_corpus(query, [document_id], vector_k, query_vector)
+            else:
+                # Keep the event loop free while the store is loaded and searched
+                search_results = await self._search_document(document_id, query, vector_k, query_vector)
+
+            search_results = self._above_cutoff(search_results)
+            if lexical_hits:
+                ranked = self._fuse([(document_id, result) for result, _ in search_results], lexical_hits, k)
+            else:
+                ranked = [(self._relevance(distance), document_id, result) for result, distance in search_results]
+
+        # Extract relevant text and metadata
+        pdf_extract = "\n".join([result.page_content for _, _, result in ranked])
+        sources = [self._format_source(result, None, relevance) for relevance, _, result in ranked]
+
+        return pdf_extract, sources
+
+    async def _retrieve_documents(self, query: str, document_ids: List[str], query_vector: Optional[List[float]] = None):
+        """Retrieve the globally best chunks across several documents, most relevant first
+
+        Also returns which documents were skipped because their search failed or missed the deadline.
+        """
+        document_registry.record_queries(document_ids)
+        top_k = settings.multi_document_top_k
+        search_info = {"late_documents": [], "failed_documents": []}
+        lexical_hits = await self._lexical_search(query, document_ids, max(top_k, settings.hybrid_candidates))
+
+        if lexical_hits and query_vector is None and is_identifier_query(query):
+            # Exact lookups skip the embedding call and the vector fan-out entirely
+            ranked = self._fuse([], lexical_hits, top_k)
+        else:
+            # Embed the question once and reuse the vector for every document searched
+            if query_vector is None:
+                query_vector = await self._embed_query(query)
+
+            if settings.use_corpus_index:
+                query_embedding_cache.count_searches(1)
+                # One search over the shared index, restricted to the requested documents
+                k = min(settings.similarity_search_k * len(document_ids), top_k)
+                with chat_stage_seconds.labels(stage="search").time():
+                    search_results = await self.document_processor.search_corpus(query, document_ids, k, query_vector)
+                # Results come back ordered by distance across all documents
+                scored = [(distance, order, result.metadata.get("doc_id"), result) for order, (result, distance) in enumerate(search_results)]
+            else:
+                query_embedding_cache.count_searches(len(document_ids))
+                scored = []
+                # Scatter the searches across the pool and gather whatever finishes in time
+                document_results, search_info = await self._fan_out_search(document_ids, query_vector, settings.similarity_search_k)
+                for doc_id, search_results in document_results:
+                    for result, distance in search_results:
+                        # The counter breaks distance ties without comparing documents
+                        scored.append((distance, len(scored), doc_id, result))
+
+            # Keep the best chunks overall rather than whichever documents were listed first
+            best = heapq.nsmallest(top_k, scored)
+            best = [entry for entry in best if self._relevance(entry[0]) >= settings.min_relevance_score]
+            if lexical_hits:
+                ranked = self._fuse([(doc_id, result) for _, _, doc_id, result in best], lexical_hits, top_k)
+            else:
+                ranked = [(self._relevance(distance), doc_id, result) for distance, _, doc_id, result in best]
+
+        extracts = [result.page_content for _, _, result in ranked]
+        sources = [self._format_source(result, doc_id, relevance) for relevance, doc_id, result in ranked]
+        return extracts, sources, search_info
+
+    def _general_messages(self, query: str, conversation_history: str) -> List[Dict[str, str]]:
+        """Messages for a question that is not tied to any document"""
+        messages = [{"role": "user", "content": query}]
+
+        # Add conversation context if available
+        if conversation_history and conversation_history != NO_HISTORY:
+            context_prompt = f"Previous conversation context:\n{conversation_history}\n\nCurrent question: {query}"
+            messages = [{"role": "user", "content": context_prompt}]
+        return messages
+
+    def _rag_messages(self, system_prompt: str, conversation_history: str, pdf_extract: str, query: str) -> List[Dict[str, str]]:
+        """Messages for a question answered from retrieved document context"""
+        # Create prompt with context and conversation history
+        with chat_stage_seconds.labels(stage="prompt").time():
+            full_prompt = self.prompt_template.format(
+                conversation_history=conversation_history,
+                pdf_extract=pdf_extract,
+                question=query
+            )
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": full_prompt}
+        ]
+
+    def _cache_key(self, kind: str, model: str, document_ids: List[str], query: str) -> str:
+        return self.response_cache.key(kind, model, self.prompt_version, document_ids, query)
+
+    async def _cached_result(self, cache_key: str, document_ids: List[str], query: str):
+        """Look up a cached answer by exact key, then by query similarity; returns (result, query_vector)"""
+        if not settings.enable_response_cache:
+            return None, None
+        cached_response = await self.response_cache.get(cache_key)
+        query_vector = None
+        if cached_response is None and settings.enable_semantic_cache:
+            # The embedding is needed for retrieval on a miss anyway, so it is not wasted. It counts as an
+            # embedding call but not as a search: without the semantic cache there was no lookup to save a call on
+            query_vector = await self._embed_query(query)
+            cached_response = await self.response_cache.find_similar(document_ids, query_vector)
+        if cached_response is None:
+            return None, query_vector
+        return {
+            "success": True,
+            "response": cached_response["response"],
+            "content_type": "markdown",
+            "sources": cached_response["sources"],
+            "top_source_suggestions": cached_response.get("top_source_suggestions", [])
+        }, query_vector
+
+    async def _finish_rag_response(
+        self,
+        cache_key: str,
+        document_ids: List[str],
+        query: str,
+        query_vector: Optional[List[float]],
+        response_text: str,
+        sources,
+        session_id: Optional[str],
+        cacheable: bool = True
+    ) -> Dict[str, Any]:
+        """Clean the model output, remember the exchange and cache the result"""
+        with chat_stage_seconds.labels(stage="postprocess").time():
+            # Extract suggestions from the AI response and clean the main response
+            main_response, suggestions = parse_response(response_text)
+
+            # Update conversation memory
+            if session_id:
+                await self._update_conversation_memory(session_id, query, main_response)
+
+            # Cache the final response
+            result = {
+                "success": True,
+                "response": main_response,
+                "content_type": "markdown",
+                "sources": sources,
+                "top_source_suggestions": suggestions
+            }
+            if settings.enable_response_cache and cacheable:
+                await self.response_cache.put(cache_key, result, document_ids, query_vector)
+            return result
+
+    async def _complete(self, **kwargs):
+        """One chat completion under the shared concurrency cap"""
+        async with openai_clients.semaphore:
+            with chat_stage_seconds.labels(stage="llm").time():
+                return await self.client.chat.completions.create(**kwargs)
+
+    async def _stream_completion(self, parser: Optional[StreamingResponseParser], **kwargs) -> AsyncIterator[str]:
+        """Stream a chat completion, yielding answer text as it arrives, cleaned when a parser is given"""
+        async with openai_clients.semaphore:
+            # Timed until the last token, including time the client takes to read each one
+            with chat_stage_seconds.labels(stage="llm").time():
+                stream = await self.client.chat.completions.create(stream=True, **kwargs)
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    token = chunk.choices[0].delta.content
+                    if token:
+                        text = parser.feed(token) if parser else token
+                        if text:
+                            yield text
+        text = parser.finish() if parser else ""
+        if text:
+            yield text
 
     async def get_response(self, query: str, document_id: Optional[str] = None, session_id: Optional[str] = None) -> Dict[str, Any]:
         """Get RAG-based response for user query with conversation context"""
@@ -110,26 +443,23 @@ class ChatService:
             # Get conversation history for context
             conversation_history = ""
             if session_id:
-                conversation_history = self._get_conversation_history(session_id)
+                conversation_history = await self._get_conversation_history(session_id)
             
             if not document_id:
                 # If no document ID provided, give a general response with conversation context
-                messages = [{"role": "user", "content": query}]
-                
-                # Add conversation context if available
-                if conversation_history and conversation_history != "No previous conversation context.":
-                    context_prompt = f"Previous conversation context:\n{conversation_history}\n\nCurrent question: {query}"
-                    messages = [{"role": "user", "content": context_prompt}]
+                messages = self._general_messages(query, conversation_history)
                 
                 # Check response cache first (only for simple queries without context)
-                cache_key = f"simple_response_{query}"
-                if not conversation_history and cache_key in self.response_cache:
+                cache_key = self._cache_key("simple_response", self.general_model, [], query)
+                response_text = None
+                if not conversation_history and settings.enable_response_cache:
+                    response_text = await self.response_cache.get(cache_key)
+                if response_text is not None:
                     print(f"Using cached response for query: {query[:30]}...")
-                    response_text = self.response_cache[cache_key]
                 else:
                     # Call OpenAI API - use a smaller, faster model by default
-                    response = self.client.chat.completions.create(
-                        model="gpt-3.5-turbo",  # Faster and cheaper model for simple queries
+                    response = await self._complete(
+                        model=self.general_model,
                         messages=messages,
                         max_tokens=1024,  # Limit tokens to improve response time
                     )
@@ -137,12 +467,12 @@ class ChatService:
                     response_text = response.choices[0].message.content
                     
                     # Cache the response if it's a simple query
-                    if not conversation_history:
-                        self.response_cache[cache_key] = response_text
+                    if not conversation_history and settings.enable_response_cache:
+                        await self.response_cache.put(cache_key, response_text)
                 
                 # Update conversation memory
                 if session_id:
-                    self._update_conversation_memory(session_id, query, response_text)
+                    await self._update_conversation_memory(session_id, query, response_text)
                 
                 return {
                     "success": True,
@@ -151,130 +481,31 @@ class ChatService:
                     "sources": None
                 }
             
-            # Load vector store for the document
-            vector_store = self.document_processor.get_vector_store(document_id)
-            
-            # Perform similarity search
-            search_results = vector_store.similarity_search(query, k=settings.similarity_search_k)
-            
-            # Extract relevant text and metadata
-            pdf_extract = "\n".join([result.page_content for result in search_results])
-            sources = []
-            
-            for idx, result in enumerate(search_results):
-                # Calculate relevance score based on position in search results (higher = more relevant)
-                relevance_score = 1.0 - (idx * 0.1)  # First result gets 1.0, second gets 0.9, etc.
-                
-                sources.append({
-                    "filename": result.metadata.get("filename", "unknown"),
-                    "page": result.metadata.get("page", 0),
-                    "chunk": result.metadata.get("chunk", 0),
-                    "content_preview": result.page_content[:100] + "..." if len(result.page_content) > 100 else result.page_content,
-                    "relevance_score": relevance_score,
-                    "title": f"{result.metadata.get('filename', 'Document')} - Page {result.metadata.get('page', 0)}"
-                })
-            
-            # Create prompt with context and conversation history
-            full_prompt = self.prompt_template.format(
-                conversation_history=conversation_history,
+            usage = query_embedding_cache.track_request()
 
-                pdf_extract=pdf_extract,
-                question=query
-            )
-            
             # Generate a cache key for this specific query and document
-            cache_key = f"rag_response_{document_id}_{hash(query)}"
+            cache_key = self._cache_key("rag_response", self.rag_model, [document_id], query)
             
-            # Check if we have a cached response
-            if cache_key in self.response_cache:
+            # Check if we have a cached response before searching the document
+            cached_result, query_vector = await self._cached_result(cache_key, [document_id], query)
+            if cached_result:
                 print(f"Using cached RAG response for document {document_id}")
-                cached_response = self.response_cache[cache_key]
-                return {
-                    "success": True,
-                    "response": cached_response["response"],
-                    "content_type": "markdown",
-                    "sources": cached_response["sources"],
-                    "top_source_suggestions": cached_response.get("top_source_suggestions", [])
-                }
+                return {**cached_result, "retrieval": query_embedding_cache.report(usage)}
+            
+            pdf_extract, sources = await self._retrieve_document(query, document_id, query_vector)
             
             # Generate response using OpenAI - use gpt-4o-mini for better reasoning with documents
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that can maintain conversation context and search documents."},
-                    {"role": "user", "content": full_prompt}
-                ],
+            response = await self._complete(
+                model=self.rag_model,
+                messages=self._rag_messages(self.single_document_system_prompt, conversation_history, pdf_extract, query),
                 max_tokens=1500  # Limit token count for faster responses
             )
             
-            response_text = response.choices[0].message.content
-            
-            # Extract suggestions from the AI response and clean the main response
-            suggestions = []
-            main_response = response_text
-            
-            # First, clean any unwanted section headers from the response
-            unwanted_headers = [
-                "### YOUR RESPONSE ###",
-                "### INSTRUCTIONS FOR THE ASSISTANT ###", 
-                "### CONVERSATION CONTEXT ###",
-                "### PDF CONTENT ###",
-                "### USER QUESTION ###"
-            ]
-            
-            # Remove unwanted headers and clean the response
-            for header in unwanted_headers:
-                main_response = main_response.replace(header, "")
-            
-            # Look for suggestions in multiple formats and extract them
-            suggestion_markers = [
-                "### SUGGESTED QUESTIONS ###",
-                "SUGGESTED QUESTIONS:",
-                "### Suggested Questions", 
-                "##Suggested Questions", 
-                "Suggested Questions",
-                "[Title: SUGGESTED QUESTIONS:]"
-            ]
-            
-            for marker in suggestion_markers:
-                if marker in main_response:
-                    parts = main_response.split(marker)
-                    main_response = parts[0].strip()
-                    if len(parts) > 1:
-                        suggestion_lines = parts[1].strip().split('\n')
-                        for line in suggestion_lines:
-                            line = line.strip()
-                            # Extract numbered questions (1., 2., 3.)
-                            if line and (line.startswith('1.') or line.startswith('2.') or line.startswith('3.')):
-                                suggestion = line[2:].strip()  # Remove "1. " or "2. " etc.
-                                if suggestion and not suggestion.startswith('[') and not suggestion.startswith('#'):
-                                    suggestions.append(suggestion)
-                    break  # Found suggestions, stop looking
-            
-            # Final cleanup of main response - remove any remaining ### symbols and empty lines
-            main_response = main_response.replace("###", "").strip()
-            
-            # Remove multiple consecutive newlines and clean up spacing
-            main_response = re.sub(r'\n\s*\n\s*\n', '\n\n', main_response)
-            main_response = main_response.strip()
-            
-            # Update conversation memory
-            if session_id:
-                self._update_conversation_memory(session_id, query, main_response)
-            
-            # Cache the final response
-            result = {
-                "success": True,
-                "response": main_response,
-                "content_type": "markdown",
-                "sources": sources,
-                "top_source_suggestions": suggestions
-            }
-            self.response_cache[cache_key] = result
-            
-            return result
+            result = await self._finish_rag_response(cache_key, [document_id], query, query_vector, response.choices[0].message.content, sources, session_id)
+            return {**result, "retrieval": query_embedding_cache.report(usage)}
             
         except Exception as e:
+            errors.labels(source="chat").inc()
             return {
                 "success": False,
                 "response": f"Error generating response: {str(e)}",
@@ -293,39 +524,21 @@ class ChatService:
             }
         
         try:
-            all_sources = []
-            all_extracts = []
+            usage = query_embedding_cache.track_request()
+
+            # Generate a cache key for this specific multi-document query
+            # Document order does not change the key
+            cache_key = self._cache_key("multi_doc_response", self.rag_model, document_ids, query)
             
-            # Search each document and collect results
-            for doc_id in document_ids:
-                try:
-                    # Load vector store for the document
-                    vector_store = self.document_processor.get_vector_store(doc_id)
-                    
-                    # Perform similarity search
-                    search_results = vector_store.similarity_search(query, k=settings.similarity_search_k)
-                    
-                    # Add results to combined collection with relevance scoring
-                    for idx, result in enumerate(search_results):
-                        # Calculate relevance score based on position in search results
-                        relevance_score = 1.0 - (idx * 0.1)
-                        
-                        all_extracts.append(result.page_content)
-                        all_sources.append({
-                            "filename": result.metadata.get("filename", "unknown"),
-                            "page": result.metadata.get("page", 0),
-                            "chunk": result.metadata.get("chunk", 0),
-                            "content_preview": result.page_content[:100] + "..." if len(result.page_content) > 100 else result.page_content,
-                            "document_id": doc_id,
-                            "relevance_score": relevance_score,
-                            "title": f"{result.metadata.get('filename', 'Document')} - Page {result.metadata.get('page', 0)}"
-                        })
-                        
-                except Exception as doc_error:
-                    print(f"Error searching document {doc_id}: {str(doc_error)}")
-                    continue
+            # Check if we have a cached response before searching the documents
+            cached_result, query_vector = await self._cached_result(cache_key, document_ids, query)
+            if cached_result:
+                print(f"Using cached multi-document response")
+                return {**cached_result, "retrieval": query_embedding_cache.report(usage)}
+            
+            extracts, sources, search_info = await self._retrieve_documents(query, document_ids, query_vector)
             
-            if not all_extracts:
+            if not extracts:
                 return {
                     "success": False,
                     "response": "No content found in any of the documents for your query.",
@@ -333,122 +546,31 @@ class ChatService:
                     "sources": [],
                     "top_source_suggestions": []
                 }
-            
-            # Sort sources by relevance score for display only
-            all_sources.sort(key=lambda x: x['relevance_score'], reverse=True)
 
             # Get conversation history for context
             conversation_history = ""
             if session_id:
-                conversation_history = self._get_conversation_history(session_id)
-            
-
-            # Combine all extracts (limit to prevent token overflow)
-            max_extracts = 10  # Limit to top results
-            combined_extract = "\n".join(all_extracts[:max_extracts])
-            
-            # Create prompt with combined context and conversation history
-            full_prompt = self.prompt_template.format(
-                conversation_history=conversation_history,
-                pdf_extract=combined_extract,
-                question=query
-            )
-            
-            # Generate a cache key for this specific multi-document query
-            # Sort document IDs to ensure consistent cache key regardless of order
-            sorted_doc_ids = sorted(document_ids)
-            cache_key = f"multi_doc_response_{'_'.join(sorted_doc_ids)}_{hash(query)}"
-            
-            # Check if we have a cached response
-            if cache_key in self.response_cache:
-                print(f"Using cached multi-document response")
-                cached_response = self.response_cache[cache_key]
-                return {
-                    "success": True,
-                    "response": cached_response["response"],
-                    "content_type": "markdown",
-                    "sources": cached_response["sources"],
-                    "top_source_suggestions": cached_response.get("top_source_suggestions", [])
-                }
+                conversation_history = await self._get_conversation_history(session_id)
             
             # Generate response using OpenAI
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that can search across multiple documents and maintain conversation context."},
-                    {"role": "user", "content": full_prompt}
-                ],
+            response = await self._complete(
+                model=self.rag_model,
+                messages=self._rag_messages(self.multi_document_system_prompt, conversation_history, "\n".join(extracts), query),
                 max_tokens=1500  # Limit token count for faster responses
             )
             
-            response_text = response.choices[0].message.content
-            
-            # Extract suggestions from the AI response and clean the main response
-            suggestions = []
-            main_response = response_text
-            
-            # First, clean any unwanted section headers from the response
-            unwanted_headers = [
-                "### YOUR RESPONSE ###",
-                "### INSTRUCTIONS FOR THE ASSISTANT ###", 
-                "### CONVERSATION CONTEXT ###",
-                "### PDF CONTENT ###",
-                "### USER QUESTION ###"
-            ]
-            
-            # Remove unwanted headers and clean the response
-            for header in unwanted_headers:
-                main_response = main_response.replace(header, "")
-            
-            # Look for suggestions in multiple formats and extract them
-            suggestion_markers = [
-                "### SUGGESTED QUESTIONS ###",
-                "SUGGESTED QUESTIONS:",
-                "### Suggested Questions", 
-                "##Suggested Questions", 
-                "Suggested Questions",
-                "[Title: SUGGESTED QUESTIONS:]"
-            ]
-            
-            for marker in suggestion_markers:
-                if marker in main_response:
-                    parts = main_response.split(marker)
-                    main_response = parts[0].strip()
-                    if len(parts) > 1:
-                        suggestion_lines = parts[1].strip().split('\n')
-                        for line in suggestion_lines:
-                            line = line.strip()
-                            # Extract numbered questions (1., 2., 3.)
-                            if line and (line.startswith('1.') or line.startswith('2.') or line.startswith('3.')):
-                                suggestion = line[2:].strip()  # Remove "1. " or "2. " etc.
-                                if suggestion and not suggestion.startswith('[') and not suggestion.startswith('#'):
-                                    suggestions.append(suggestion)
-                    break  # Found suggestions, stop looking
-            
-            # Final cleanup of main response - remove any remaining ### symbols and empty lines
-            main_response = main_response.replace("###", "").strip()
-            
-            # Remove multiple consecutive newlines and clean up spacing
-            main_response = re.sub(r'\n\s*\n\s*\n', '\n\n', main_response)
-            main_response = main_response.strip()
-            
-            # Update conversation memory
-            if session_id:
-                self._update_conversation_memory(session_id, query, main_response)
-                
-            # Cache the final response
-            result = {
-                "success": True,
-                "response": main_response,
-                "content_type": "markdown",
-                "sources": all_sources[:max_extracts],
-                "top_source_suggestions": suggestions
-            }
-            self.response_cache[cache_key] = result
-
-            return result
+            # An answer missing some documents is not cached, so the next ask can include them
+            complete = not (search_info["late_documents"] or search_info["failed_documents"])
+            result = await self._finish_rag_response(
+                cache_key, document_ids, query, query_vector, response.choices[0].message.content, sources, session_id, cacheable=complete
+            )
+            retrieval = {**query_embedding_cache.report(usage), **search_info}
+            print(f"Searched {len(document_ids)} documents with {retrieval['embedding_calls']} query embedding call(s), "
+                  f"{retrieval['embedding_calls_saved']} saved")
+            return {**result, "retrieval": retrieval}
             
         except Exception as e:
+            errors.labels(source="chat").inc()
             return {
                 "success": False,
                 "response": f"Error searching multiple documents: {str(e)}",
@@ -456,3 +578,126 @@ class ChatService:
                 "sources": None,
                 "top_source_suggestions": []
             }
+
+    async def stream_response(self, query: str, document_id: Optional[str] = None, session_id: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """Stream a RAG answer as (event, data) pairs: sources, token..., done"""
+        if not self.api_key_available:
+            yield "error", {"message": "OpenAI API key is not configured. Please set OPENAI_API_KEY environment variable."}
+            return
+
+        try:
+            conversation_history = ""
+            if session_id:
+                conversation_history = await self._get_conversation_history(session_id)
+
+            if not document_id:
+                yield "sources", []
+                # General answers are not post-processed, so tokens go out exactly as the model wrote them
+                tokens = []
+                async for text in self._stream_completion(
+                    None,
+                    model=self.general_model,
+                    messages=self._general_messages(query, conversation_history),
+                    max_tokens=1024
+                ):
+                    tokens.append(text)
+                    yield "token", text
+                response_text = "".join(tokens)
+                if session_id:
+                    await self._update_conversation_memory(session_id, query, response_text)
+                yield "done", {"response": response_text, "top_source_suggestions": []}
+                return
+
+            usage = query_embedding_cache.track_request()
+            cache_key = self._cache_key("rag_response", self.rag_model, [document_id], query)
+            cached_result, query_vector = await self._cached_result(cache_key, [document_id], query)
+            if cached_result:
+                yield "sources", cached_result["sources"]
+                yield "token", cached_result["response"]
+                yield "done", {
+                    "response": cached_result["response"],
+                    "top_source_suggestions": cached_result["top_source_suggestions"],
+                    "retrieval": query_embedding_cache.report(usage)
+                }
+                return
+
+            pdf_extract, sources = await self._retrieve_document(query, document_id, query_vector)
+            yield "sources", sources
+
+            parser = StreamingResponseParser()
+            async for text in self._stream_completion(
+                parser,
+                model=self.rag_model,
+                messages=self._rag_messages(self.single_document_system_prompt, conversation_history, pdf_extract, query),
+                max_tokens=1500
+            ):
+                yield "token", text
+
+            result = await self._finish_rag_response(cache_key, [document_id], query, query_vector, parser.raw_text, sources, session_id)
+            yield "done", {
+                "response": result["response"],
+                "top_source_suggestions": result["top_source_suggestions"],
+                "retrieval": query_embedding_cache.report(usage)
+            }
+
+        except Exception as e:
+            errors.labels(source="chat").inc()
+            yield "error", {"message": f"Error generating response: {str(e)}"}
+
+    async def stream_multiple_documents(self, query: str, document_ids: List[str], session_id: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """Stream a multi-document answer as (event, data) pairs: sources, token..., done"""
+        if not self.api_key_available:
+            yield "error", {"message": "OpenAI API key is not configured. Please set OPENAI_API_KEY environment variable."}
+            return
+
+        try:
+            usage = query_embedding_cache.track_request()
+            cache_key = self._cache_key("multi_doc_response", self.rag_model, document_ids, query)
+            cached_result, query_vector = await self._cached_result(cache_key, document_ids, query)
+            if cached_result:
+                yield "sources", cached_result["sources"]
+                yield "token", cached_result["response"]
+                yield "done", {
+                    "response": cached_result["response"],
+                    "top_source_suggestions": cached_result["top_source_suggestions"],
+                    "retrieval": query_embedding_cache.report(usage)
+                }
+                return
+
+            extracts, sources, search_info = await self._retrieve_documents(query, document_ids, query_vector)
+            yield "sources", sources
+
+            if not extracts:
+                yield "error", {"message": "No content found in any of the documents for your query."}
+                return
+
+            conversation_history = ""
+            if session_id:
+                conversation_history = await self._get_conversation_history(session_id)
+
+            parser = StreamingResponseParser()
+            async for text in self._stream_completion(
+                parser,
+                model=self.rag_model,
+                messages=self._rag_messages(self.multi_document_system_prompt, conversation_history, "\n".join(extracts), query),
+                max_tokens=1500
+            ):
+                yield "token", text
+
+            complete = not (search_info["late_documents"] or search_info["failed_documents"])
+            result = await self._finish_rag_response(
+                cache_key, document_ids, query, query_vector, parser.raw_text, sources, session_id, cacheable=complete
+            )
+            yield "done", {
+                "response": result["response"],
+                "top_source_suggestions": result["top_source_suggestions"],
+                "retrieval": {**query_embedding_cache.report(usage), **search_info}
+            }
+
+        except Exception as e:
+            errors.labels(source="chat").inc()
+            yield "error", {"message": f"Error searching multiple documents: {str(e)}"}
+
+
+# Global chat service instance
+chat_service = ChatService()
@@ -0,0 +1,241 @@
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config.settings import settings
+
+NO_HISTORY = "No previous conversation context."
+
+_encoding = None
+_encoding_failed = False
+
+
+def count_tokens(text: str) -> int:
+    """Token count with the chat models' tokenizer, or roughly four characters per token without it"""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # The encoding is downloaded on first use, which fails on offline hosts
+            _encoding_failed = True
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    if count_tokens(text) <= tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:tokens]) + "..."
+    return text[:tokens * 4] + "..."
+
+
+def format_turn(question: str, answer: str) -> str:
+    return f"Previous Question: {question}\nPrevious Answer: {answer}"
+
+
+class ConversationMemory:
+    """Per-session chat history with idle expiry, a global size cap and a rolling summary of older turns"""
+
+    def __init__(self, persist_path: Optional[str] = None):
+        self.persist_path = persist_path if persist_path is not None else (
+            settings.conversation_memory_path if settings.conversation_memory_backend == "sqlite" else None
+        )
+        self.idle_ttl_seconds = settings.conversation_idle_ttl_seconds
+        self.max_bytes = settings.conversation_memory_max_bytes
+        self.token_budget = settings.conversation_history_token_budget
+        self._sessions = OrderedDict()  # session_id -> session dict, least recently active first
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._compacting = set()
+        self.evictions = 0
+        self.expirations = 0
+        self.summaries = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the session database on first use (caller holds the lock)"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.persist_path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, summary TEXT NOT NULL, turns TEXT NOT NULL, last_active REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions (last_active)")
+            self._conn.commit()
+        return self._conn
+
+    def _load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Read a session evicted from memory or written before a restart (caller holds the lock)"""
+        if not self.persist_path:
+            return None
+        row = self._connection().execute(
+            "SELECT summary, turns, last_active FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"summary": row[0], "turns": [tuple(turn) for turn in json.loads(row[1])], "last_active": row[2]}
+
+    def _save(self, session_id: str, session: Dict[str, Any]):
+        """Write a session through to disk (caller holds the lock)"""
+        if not self.persist_path:
+            return
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, summary, turns, last_active) VALUES (?, ?, ?, ?)",
+            (session_id, session["summary"], json.dumps(session["turns"]), session["last_active"])
+        )
+        conn.commit()
+
+    @staticmethod
+    def _size(session: Dict[str, Any]) -> int:
+        return len(session["summary"]) + sum(len(question) + len(answer) for question, answer in session["turns"])
+
+    def _get(self, session_id: str, now: float) -> Optional[Dict[str, Any]]:
+        """Live session from memory or disk, or None if it never existed or sat idle too long"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._load(session_id)
+            if session is None:
+                return None
+            self._store(session_id, session)
+        if now - session["last_active"] > self.idle_ttl_seconds:
+            self._drop(session_id, expired=True)
+            return None
+        return session
+
+    def _store(self, session_id: str, session: Dict[str, Any]):
+        self._drop(session_id)
+        session["size"] = self._size(session)
+        self._sessions[session_id] = session
+        self.total_bytes += session["size"]
+
+    def _drop(self, session_id: str, expired: bool = False):
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self.total_bytes -= session["size"]
+        if expired:
+            self.expirations += 1
+            if self.persist_path:
+                self._connection().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._connection().commit()
+
+    def _evict(self, now: float):
+        """Expire idle sessions, then drop the least recently active ones while over the memory cap"""
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session["last_active"] > self.idle_ttl_seconds:
+                self._drop(session_id, expired=True)
+            elif self.total_bytes > self.max_bytes and len(self._sessions) > 1:
+                # Persisted sessions are only unloaded and come back from disk on the next message
+                self._drop(session_id)
+                self.evictions += 1
+            else:
+                break
+        if self.persist_path:
+            self._connection().execute("DELETE FROM sessions WHERE last_active < ?", (now - self.idle_ttl_seconds,))
+            self._connection().commit()
+
+    def _pack(self, session: Dict[str, Any]) -> Tuple[List[str], int]:
+        """Newest turns that fit in the token budget after the summary, and how many turns that is"""
+        budget = self.token_budget - (count_tokens(session["summary"]) if session["summary"] else 0)
+        packed = []
+        for question, answer in reversed(session["turns"]):
+            text = format_turn(question, answer)
+            tokens = count_tokens(text)
+            if tokens > budget:
+                if not packed and budget > 0:
+                    # Always keep some of the latest exchange, even if it alone is over budget
+                    packed.append(truncate_to_tokens(text, budget))
+                break
+            packed.append(text)
+            budget -= tokens
+        packed.reverse()
+        return packed, len(packed)
+
+    def get_history(self, session_id: str) -> str:
+        """Rolling summary plus as many recent exchanges as fit in the token budget"""
+        with self._lock:
+            session = self._get(session_id, time.time())
+            if session is None:
+                return NO_HISTORY
+            packed, _ = self._pack(session)
+            parts = []
+            if session["summary"]:
+                parts.append(f"Summary of earlier conversation: {session['summary']}")
+            parts.extend(packed)
+            return "\n".join(parts) if parts else NO_HISTORY
+
+    def add_turn(self, session_id: str, question: str, answer: str) -> bool:
+        """Record an exchange; returns True when older turns no longer fit and should be summarized"""
+        now = time.time()
+        with self._lock:
+            session = self._get(session_id, now) or {"summary": "", "turns": [], "last_active": now}
+            session["turns"].append((question, answer))
+            session["last_active"] = now
+            self._store(session_id, session)
+            self._save(session_id, session)
+            self._evict(now)
+            _, fitting = self._pack(session)
+            return fitting < len(session["turns"])
+
+    async def compact(self, session_id: str, summarize: Callable[[str, List[Tuple[str, str]]], Awaitable[str]]):
+        """Fold turns that fall outside the token budget into the session's rolling summary"""
+        if session_id in self._compacting:
+            return
+        self._compacting.add(session_id)
+        try:
+            with self._lock:
+                session = self._sessions.get(session_id)
+                if session is None:
+                    return
+                _, fitting = self._pack(session)
+                folded = session["turns"][:len(session["turns"]) - fitting]
+                previous_summary = session["summary"]
+            if not folded:
+                return
+
+            try:
+                summary = await summarize(previous_summary, folded)
+            except Exception as e:
+                print(f"Error summarizing conversation {session_id}: {e}")
+                # Keep at least the topics of the folded questions
+                topics = "; ".join(question for question, _ in folded)
+                summary = f"{previous_summary} Earlier the user asked: {topics}".strip()
+            summary = truncate_to_tokens(summary, settings.conversation_summary_max_tokens)
+
+            with self._lock:
+                session = self._sessions.get(session_id)
+                if session is None:
+                    return
+                # New turns may have arrived meanwhile; only the folded prefix is replaced
+                session["turns"] = session["turns"][len(folded):]
+                session["summary"] = summary
+                self._store(session_id, session)
+                self._save(session_id, session)
+                self.summaries += 1
+        finally:
+            self._compacting.discard(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "persistent": bool(self.persist_path),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "summaries": self.summaries,
+            }
+
+
+# Global conversation memory instance
+conversation_memory = ConversationMemory()
@@ -0,0 +1,414 @@
+import os
+import json
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from config.settings import settings
+from services import store_versions
+from services.mapped_vector_store import (
+    INDEX_FILE, LEGACY_DOCSTORE_FILE, MappedVectorStore, base_index, is_mapped_store, is_pickle_store, open_store,
+    read_documents, read_pickle_store
+)
+
+
+# Embedding model and width the corpus vectors were made with
+SPACE_FILE = "space.json"
+# Docstore id of each chunk, in index order
+IDS_FILE = "ids.json"
+
+
+def write_corpus(directory: str, index: faiss.Index, documents: List[Document], ids: List[str], embedding_space: Optional[str]):
+    """Write a corpus index in the per-document store format (index plus mapped chunk files) with its id map"""
+    MappedVectorStore.write(directory, documents, index)
+    with open(os.path.join(directory, IDS_FILE), 'w') as f:
+        json.dump(ids, f)
+    if embedding_space is not None:
+        with open(os.path.join(directory, SPACE_FILE), 'w') as f:
+            json.dump({"embedding_space": embedding_space}, f)
+
+
+def convert_pickle_corpus(path: str) -> int:
+    """Rewrite a corpus index saved with a pickled docstore in the mapped format, in place; returns its chunk count
+
+    Only runs from convert_vector_stores.py while the service is stopped; the service never reads the pickle.
+    """
+    path = os.path.realpath(path)
+    index, documents = read_pickle_store(path)
+    write_corpus(path, index, documents, [CorpusIndex.chunk_id(document.metadata["doc_id"], document) for document in documents], None)
+    os.remove(os.path.join(path, LEGACY_DOCSTORE_FILE))
+    return len(documents)
+
+
+class CorpusIndex:
+    """Single FAISS index shared by all documents, with chunks tagged by doc_id
+
+    Every uvicorn worker keeps its own copy in memory. Changes are made under a file lock shared by
+    all workers, on top of the latest published version, and each save publishes a new version behind
+    the _corpus link that the other workers reload when they next use the index. A save writes the
+    whole index and every chunk again, so its cost grows with the corpus: bulk runs and migrations
+    defer saves to pay it once per batch, and a worker pays one full reload per version another publishes.
+    """
+
+    def __init__(self):
+        self.path = os.path.join(settings.vector_store_path, settings.corpus_index_name)
+        self._store: Optional[FAISS] = None
+        self.embedding_space: Optional[str] = None
+        self._embeddings = None
+        self._loaded = False
+        self._version: Optional[str] = None  # Published version the in-memory index was read from
+        self._positions: Dict[str, np.ndarray] = {}  # doc_id -> index positions of its chunks
+        self._lock = threading.RLock()  # Guards the in-memory index; searches take it
+        self._write_lock = threading.RLock()  # One change, save or reload at a time in this worker
+        self._lock_file = None  # Open while this worker holds the write lock shared by all workers
+        self._pending: List[Tuple[Callable, tuple]] = []  # Changes applied in memory but not yet published
+        self._dirty = False
+        self._deferred = 0
+
+    @staticmethod
+    def chunk_id(doc_id: str, document: Document) -> str:
+        """Stable docstore id for a chunk, prefixed with its document id"""
+        return f"{doc_id}:{document.metadata.get('source', '')}"
+
+    def _rebuild_positions(self):
+        """Recompute the doc_id -> index positions map after the index changed"""
+        positions = {}
+        if self._store is not None:
+            for position, chunk_id in self._store.index_to_docstore_id.items():
+                positions.setdefault(chunk_id.split(":", 1)[0], []).append(position)
+        self._positions = {doc_id: np.array(ids, dtype="int64") for doc_id, ids in positions.items()}
+
+    def _read(self) -> Tuple[Optional[FAISS], Optional[str]]:
+        """The published index and its embedding space; (None, None) before the first save"""
+        # Resolve the version link once, so all files come from the same save
+        path = os.path.realpath(self.path)
+        if not is_mapped_store(path):
+            if is_pickle_store(path):
+                raise Exception(f"{path} is still in the pickle format; convert it with convert_vector_stores.py")
+            return None, None
+        with open(os.path.join(path, IDS_FILE), 'r') as f:
+            ids = json.load(f)
+        # Read into memory rather than mapped, since changes are applied to it in place
+        index = faiss.read_index(os.path.join(path, INDEX_FILE))
+        documents = read_documents(path)
+        store = FAISS(
+            self._embeddings, index, InMemoryDocstore(dict(zip(ids, documents))), dict(enumerate(ids))
+        )
+        # Indexes saved before the space was recorded hold vectors from the original model
+        embedding_space = "text-embedding-ada-002"
+        if os.path.exists(os.path.join(path, SPACE_FILE)):
+            with open(os.path.join(path, SPACE_FILE), 'r') as f:
+                embedding_space = json.load(f)["embedding_space"]
+        return store, embedding_space
+
+    def load(self, embeddings):
+        """Load the corpus index from disk and fold in any per-document stores"""
+        if self._loaded:
+            return
+        with self._write_lock:
+            if self._loaded:
+                return
+            self._embeddings = embeddings
+            self._version = store_versions.current_version(self.path)
+            store, embedding_space = self._read()
+            with self._lock:
+                self._store, self.embedding_space = store, embedding_space
+                self._rebuild_positions()
+            self._loaded = True
+            self._migrate_per_document_stores(embeddings)
+
+    def _refresh(self):
+        """Reload the index if another worker published a newer version, then reapply this worker's unpublished changes"""
+        version = store_versions.current_version(self.path)
+        if version == self._version:
+            return
+        # Read outside the search lock; searches keep using the old copy meanwhile
+        store, embedding_space = self._read()
+        with self._lock:
+            self._store, self.embedding_space = store, embedding_space
+            self._rebuild_positions()
+            for apply, args in self._pending:
+                apply(*args)
+                self._rebuild_positions()
+            self._version = version
+
+    def _catch_up(self, embeddings):
+        """Load the index, or reload it if another worker has published a newer version since"""
+        self.load(embeddings)
+        if store_versions.current_version(self.path) != self._version:
+            with self._write_lock:
+                self._refresh()
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the write lock shared by all workers, with the in-memory index at the latest published version"""
+        with self._write_lock:
+            owner = self._lock_file is None
+            if owner:
+                os.makedirs(settings.vector_store_path, exist_ok=True)
+                self._lock_file = open(os.path.join(settings.vector_store_path, f"{settings.corpus_index_name}.lock"), 'a')
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield
+            finally:
+                if owner:
+                    self._lock_file.close()  # Releases the lock
+                    self._lock_file = None
+
+    def _change(self, apply: Callable, *args) -> Any:
+        """Apply a change on top of the latest published version, then save it unless saves are deferred
+
+        apply runs with the search lock held and returns False when there was nothing to change. It is
+        kept until the change is published, to be applied again if another worker publishes first.
+        """
+        with self._exclusive():
+            with self._lock:
+                result = apply(*args)
+                if result is False:
+                    return result
+                self._rebuild_positions()
+                self._pending.append((apply, args))
+                self._dirty = True
+            if not self._deferred:
+                self.flush()
+        return result
+
+    def defer_saves(self):
+        """Keep changes in memory until resume_saves, for runs that change many documents"""
+        with self._lock:
+            self._deferred += 1
+
+    def resume_saves(self):
+        """End a defer_saves and write everything changed since"""
+        with self._lock:
+            self._deferred -= 1
+        self.flush()
+
+    def flush(self):
+        """Write unsaved changes as a new version of the index and switch to it in one rename
+
+        Only the in-memory copy of the index holds the search lock; the files are written outside it.
+        """
+        with self._exclusive():
+            with self._lock:
+                if not self._dirty or self._store is None:
+                    return
+                # Snapshot under the search lock; the files are written from the copy outside it
+                index = faiss.clone_index(self._store.index)
+                ids = [self._store.index_to_docstore_id[position] for position in range(index.ntotal)]
+                documents = [self._store.docstore.search(chunk_id) for chunk_id in ids]
+                space = self.embedding_space
+                self._dirty = False
+            try:
+                version_path = store_versions.new_version_dir(settings.corpus_index_name)
+                write_corpus(version_path, index, documents, ids, space)
+                store_versions.publish(settings.corpus_index_name, version_path)
+            except BaseException:
+                with self._lock:
+                    self._dirty = True
+                raise
+            self._version = store_versions.current_version(self.path)
+            self._pending.clear()
+
+    def _apply_replace(self, doc_id: str, documents: List[Document], vectors: List[List[float]]):
+        """Drop a document's chunks, if any, and add the given ones (search lock held)"""
+        positions = self._positions.get(doc_id)
+        if positions is not None and self._store is not None:
+            self._store.delete([self._store.index_to_docstore_id[int(position)] for position in positions])
+        text_embeddings = [(document.page_content, vector) for document, vector in zip(documents, vectors)]
+        metadatas = [document.metadata for document in documents]
+        ids = [self.chunk_id(doc_id, document) for document in documents]
+        if self._store is None:
+            self._store = FAISS.from_embeddings(text_embeddings, self._embeddings, metadatas=metadatas, ids=ids)
+        else:
+            self._store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        # Later changes to the same document look its chunks up here
+        self._rebuild_positions()
+
+    def _apply_delete(self, doc_id: str) -> bool:
+        """Drop every chunk of a document (search lock held); False if it had none"""
+        positions = self._positions.get(doc_id)
+        if positions is None or self._store is None:
+            return False
+        self._store.delete([self._store.index_to_docstore_id[int(position)] for position in positions])
+        self._rebuild_positions()
+        return True
+
+    def _apply_rebuild(self, store: FAISS, embedding_space: str):
+        """Swap in a whole new index (search lock held)"""
+        self._store = store
+        self.embedding_space = embedding_space
+
+    def require_space(self, embedding_space: str, embeddings):
+        """Fail clearly, instead of on a dimension mismatch, when the index was built with another embedding model or width"""
+        self._catch_up(embeddings)
+        with self._lock:
+            if self._store is None:
+                self.embedding_space = embedding_space  # An empty index takes the space of its first chunks
+            elif self.embedding_space != embedding_space:
+                raise Exception(
+                    f"The corpus index holds {self.embedding_space} vectors but {embedding_space} is configured; "
+                    "re-embed it with reembed_vector_stores.py"
+                )
+
+    def all_chunks(self, embeddings) -> List[Document]:
+        """Every chunk in the index, in index order"""
+        self._catch_up(embeddings)
+        with self._lock:
+            if self._store is None:
+                return []
+            return [self._store.docstore.search(self._store.index_to_docstore_id[position]) for position in range(self._store.index.ntotal)]
+
+    def rebuild(self, documents: List[Document], vectors: List[List[float]], embedding_space: str, embeddings):
+        """Replace the whole index with the same chunks embedded in another space"""
+        self.load(embeddings)
+        store = FAISS.from_embeddings(
+            [(document.page_content, vector) for document, vector in zip(documents, vectors)],
+            embeddings,
+            metadatas=[document.metadata for document in documents],
+            ids=[self.chunk_id(document.metadata["doc_id"], document) for document in documents]
+        )
+        self._change(self._apply_rebuild, store, embedding_space)
+
+    def replace_document(self, doc_id: str, documents: List[Document], vectors: List[List[float]], embeddings):
+        """Swap all chunks of a document for new ones in one step; searches see either version, never both"""
+        self.load(embeddings)
+        for document in documents:
+            document.metadata["doc_id"] = doc_id
+        self._change(self._apply_replace, doc_id, documents, vectors)
+
+    def get_vectors(self, doc_id: str, sources: List[str], embeddings) -> Dict[str, List[float]]:
+        """Stored vectors of a document's chunks with the given source ids, by source id"""
+        self._catch_up(embeddings)
+        with self._lock:
+            if self._store is None:
+                return {}
+            wanted = {f"{doc_id}:{source}": source for source in sources}
+            vectors = {}
+            for position in self._positions.get(doc_id, []):
+                source = wanted.get(self._store.index_to_docstore_id[int(position)])
+                if source is not None:
+                    vectors[source] = self._store.index.reconstruct(int(position)).tolist()
+            return vectors
+
+    def delete_document(self, doc_id: str, embeddings) -> bool:
+        """Remove every chunk of a document from the corpus index"""
+        self.load(embeddings)
+        return self._change(self._apply_delete, doc_id)
+
+    def get_chunks(self, doc_id: str, sources: Optional[List[str]], embeddings) -> List[Document]:
+        """Stored chunks of a document, either all of them or those with the given source ids"""
+        self._catch_up(embeddings)
+        with self._lock:
+            if self._store is None:
+                return []
+            if sources is None:
+                chunk_ids = [self._store.index_to_docstore_id[int(position)] for position in self._positions.get(doc_id, [])]
+            else:
+                chunk_ids = [f"{doc_id}:{source}" for source in sources]
+            documents = [self._store.docstore.search(chunk_id) for chunk_id in chunk_ids]
+            return [document for document in documents if isinstance(document, Document)]
+
+    def search(self, query_vector: List[float], doc_ids: List[str], k: int, embeddings) -> List[Tuple[Document, float]]:
+        """Run one similarity search restricted to the chunks of the given documents; returns (chunk, distance) pairs"""
+        self._catch_up(embeddings)
+        vector = np.array([query_vector], dtype=np.float32)
+
+        with self._lock:
+            selected = [self._positions[doc_id] for doc_id in doc_ids if doc_id in self._positions]
+            if self._store is None or not selected:
+                return []
+            store = self._store
+            selector = faiss.IDSelectorBatch(np.concatenate(selected))
+            distances, indices = store.index.search(vector, k, params=faiss.SearchParameters(sel=selector))
+            results = []
+            for distance, position in zip(distances[0], indices[0]):
+                if position == -1:
+                    continue
+                document = store.docstore.search(store.index_to_docstore_id[int(position)])
+                if isinstance(document, Document):
+                    results.append((document, float(distance)))
+            return results
+
+    def _migrate_per_document_stores(self, embeddings):
+        """Copy existing vector_stores/<doc_id> indexes into the corpus index without re-embedding
+
+        The per-document index files are left in place, so turning USE_CORPUS_INDEX off again serves
+        those documents as they were when migrated. Changes made in corpus mode exist only in the corpus index.
+        """
+        if not os.path.exists(settings.vector_store_path):
+            return
+        migrated = []
+        # Workers starting together migrate one after another; the later ones find the documents merged
+        with self._exclusive():
+            self.defer_saves()
+            try:
+                for doc_id in sorted(os.listdir(settings.vector_store_path)):
+                    doc_path = os.path.join(settings.vector_store_path, doc_id)
+                    if doc_id.startswith("_") or not os.path.isdir(doc_path):
+                        continue
+                    if doc_id in self._positions:
+                        # Merged by an earlier run that stopped before marking it
+                        if self._storage(doc_path) != "corpus":
+                            migrated.append((doc_id, None))
+                        continue
+                    if not is_mapped_store(doc_path):
+                        if is_pickle_store(doc_path):
+                            print(f"Not migrating {doc_id} into the corpus index until convert_vector_stores.py has converted it")
+                        continue
+                    try:
+                        store = open_store(doc_path)
+                        index, documents = store.index, store.documents()
+                        if isinstance(base_index(index), faiss.IndexIVF):
+                            base_index(index).make_direct_map()  # IVF indexes need it to reconstruct vectors by position
+                        vectors = index.reconstruct_n(0, index.ntotal)
+                        for document in documents:
+                            document.metadata["doc_id"] = doc_id
+                        self._change(self._apply_replace, doc_id, documents, [vector.tolist() for vector in vectors])
+                        migrated.append((doc_id, len(documents)))
+                    except Exception as e:
+                        print(f"Error migrating vector store {doc_id} into corpus index: {e}")
+            finally:
+                # One save for the whole migration
+                self.resume_saves()
+
+        # Documents are marked corpus-backed only once the index holding them is on disk
+        for doc_id, chunks in migrated:
+            try:
+                self._mark_corpus_backed(os.path.join(settings.vector_store_path, doc_id), doc_id, chunks)
+            except Exception as e:
+                print(f"Error marking {doc_id} as migrated into the corpus index: {e}")
+        if migrated:
+            print(f"Migrated {len(migrated)} per-document vector stores into the corpus index")
+
+    @staticmethod
+    def _storage(doc_path: str) -> Optional[str]:
+        metadata_file = os.path.join(doc_path, "metadata.json")
+        if not os.path.exists(metadata_file):
+            return None
+        with open(metadata_file, 'r') as f:
+            return json.load(f).get("storage")
+
+    @staticmethod
+    def _mark_corpus_backed(doc_path: str, doc_id: str, chunks: Optional[int]):
+        metadata_file = os.path.join(doc_path, "metadata.json")
+        metadata = {"doc_id": doc_id, "filename": "Unknown Document", "chunks": chunks or 0}
+        if os.path.exists(metadata_file):
+            with open(metadata_file, 'r') as f:
+                metadata.update(json.load(f))
+        metadata["storage"] = "corpus"
+        with open(f"{metadata_file}.tmp", 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(f"{metadata_file}.tmp", metadata_file)
+
+
+# Global corpus index instance
+corpus_index = CorpusIndex()
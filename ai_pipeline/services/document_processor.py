@@ -1,65 +1,179 @@
-import re
 import os
+import math
+import asyncio
 import pickle
 import hashlib
 import shutil
+import tempfile
+import multiprocessing
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
-from typing import List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import uuid
 
+import faiss
+import numpy as np
 from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
 from pypdf import PdfReader
 
 from config.settings import settings
-from services.cache_service import cache_service
+from services.document_registry import document_registry
+from services.vector_store_pool import vector_store_pool
+from services.mapped_vector_store import MappedVectorStore, base_index, open_store
+from services import store_versions
+from services.store_versions import new_version_dir
+from services.corpus_index import corpus_index
+from services.response_cache import response_cache
+from services.query_embedding_cache import query_embedding_cache
+from services.lexical_index import LexicalIndex, lexical_index_store, bm25_search
+from services.openai_clients import openai_clients
+from services.ingestion_queue import IngestionCancelled
+from services.embedding_cache import embedding_cache
+from services.embedding_pipeline import embedding_pipeline
+from services.metrics import ingestion_stage_seconds
+from utils.pdf_utils import calculate_file_hash, calculate_path_hash, extract_page_texts, extract_page_range, open_mapped_pdf
 
 class DocumentProcessor:
     def __init__(self):
-        if not settings.openai_api_key or settings.openai_api_key == "your_openai_api_key_here":
+        if not openai_clients.api_key_available:
             self.api_key_available = False
             self.embeddings = None
         else:
             self.api_key_available = True
-            self.embeddings = OpenAIEmbeddings(
-                openai_api_key=settings.openai_api_key
-            )
+            self.embeddings = openai_clients.embeddings
+        self._update_locks: Dict[str, asyncio.Lock] = {}
+        self._writes: Dict[str, asyncio.Future] = {}  # doc_id -> store write still running in a thread
         
-    def _parse_pdf(self, file_content: bytes, filename: str) -> Tuple[List[str], str]:
-        """Parse PDF content and extract text"""
+    # Process pool shared by every processor for CPU-bound page extraction
+    _parse_pool: Optional[ProcessPoolExecutor] = None
+
+    @classmethod
+    def _get_parse_pool(cls) -> ProcessPoolExecutor:
+        if cls._parse_pool is None:
+            # Spawn rather than fork: parsing is started from worker threads
+            cls._parse_pool = ProcessPoolExecutor(
+                max_workers=settings.pdf_parse_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return cls._parse_pool
+
+    def _parse_pages_parallel(self, file_content: bytes, total_pages: int, progress: Optional[Callable] = None, file_path: Optional[str] = None) -> List[str]:
+        """Extract page ranges across the process pool, keeping results in page order"""
+        spooled_path = None
+        if file_path is None:
+            # Workers read the PDF from disk instead of each receiving a pickled copy
+            os.makedirs(settings.temp_uploads_path, exist_ok=True)
+            fd, spooled_path = tempfile.mkstemp(suffix=".pdf", dir=settings.temp_uploads_path)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(file_content)
+            file_path = spooled_path
+
+        # Several ranges per worker keeps the pool busy when some pages are slower than others
+        range_size = max(1, math.ceil(total_pages / (settings.pdf_parse_workers * 4)))
+        ranges = [(start, min(start + range_size, total_pages)) for start in range(0, total_pages, range_size)]
+        pool = self._get_parse_pool()
+        futures = {
+            pool.submit(extract_page_range, file_path, start, end, settings.pdf_page_timeout_seconds): n
+            for n, (start, end) in enumerate(ranges)
+        }
+        results = [None] * len(ranges)
+        parsed_pages = 0
         try:
-            pdf = PdfReader(BytesIO(file_content))
-            output = []
-            
-            if not pdf.pages:
-                raise Exception("PDF file appears to be empty or corrupted")
-            
-            for i, page in enumerate(pdf.pages):
-                try:
-                    text = page.extract_text()
-                    if text:  # Only process if text was extracted
-                        text = re.sub(r"(\w+)-\n(\w+)", r"\1\2", text)
-                        text = re.sub(r"(?<!\n\s)\n(?!\s\n)", " ", text.strip())
-                        text = re.sub(r"\n\s*\n", "\n\n", text)
-                        output.append(text)
-                    else:
-                        # Add placeholder for empty pages
-                        output.append(f"[Page {i+1} - No extractable text]")
-                except Exception as page_error:
-                    print(f"Error processing page {i+1}: {str(page_error)}")
-                    output.append(f"[Page {i+1} - Error extracting text: {str(page_error)}]")
+            for future in as_completed(futures):
+                n = futures[future]
+                results[n] = future.result()
+                parsed_pages += len(results[n])
+                if progress:
+                    progress("parsing", parsed_pages, total_pages)
+        except BrokenProcessPool:
+            DocumentProcessor._parse_pool = None
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+            if spooled_path:
+                os.remove(spooled_path)
+        return [text for texts in results for text in texts]
+
+    def _parse_pdf(self, file_content: Optional[bytes], filename: str, progress: Optional[Callable] = None, file_path: Optional[str] = None) -> Tuple[List[str], str]:
+        """Parse PDF content and extract text, mapping the spooled file at file_path when there is one"""
+        try:
+            opened = open_mapped_pdf(file_path) if file_path else nullcontext(PdfReader(BytesIO(file_content)))
+            with opened as pdf:
+                if not pdf.pages:
+                    raise Exception("PDF file appears to be empty or corrupted")
+                
+                total_pages = len(pdf.pages)
+                if settings.pdf_parse_workers > 1 and total_pages >= settings.pdf_parallel_min_pages:
+                    output = self._parse_pages_parallel(file_content, total_pages, progress, file_path)
+                else:
+                    output = []
+                    for i in range(total_pages):
+                        if progress:
+                            progress("parsing", i + 1, total_pages)
+                        output.extend(extract_page_texts(pdf, i, i + 1))
             
             if not output:
                 raise Exception("No text could be extracted from the PDF")
                 
             return output, filename
+        except IngestionCancelled:
+            raise
         except Exception as e:
             raise Exception(f"PDF parsing failed: {str(e)}")
 
-    def _text_to_docs(self, text: List[str], filename: str) -> List[Document]:
-        """Convert text to document chunks"""
+    @staticmethod
+    def _page_hashes(text: List[str]) -> List[str]:
+        """SHA256 of each non-empty page's text, in the order chunks number their pages"""
+        return [hashlib.sha256(page.encode("utf-8")).hexdigest() for page in text if page.strip()]
+
+    def _split_page(self, page: str, page_number: int, filename: str) -> List[Document]:
+        """Chunks of one page, each with the source id <page>-<chunk>"""
+        doc_chunks = []
+        try:
+            text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=settings.chunk_size,
+                separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""],
+                chunk_overlap=settings.chunk_overlap,
+            )
+            chunks = text_splitter.split_text(page)
+            
+            if not chunks:
+                # If no chunks created, use the whole page content
+                chunks = [page]
+            
+            for i, chunk in enumerate(chunks):
+                if chunk.strip():  # Only add non-empty chunks
+                    chunk_doc = Document(
+                        page_content=chunk, 
+                        metadata={
+                            "page": page_number, 
+                            "chunk": i,
+                            "filename": filename
+                        }
+                    )
+                    chunk_doc.metadata["source"] = f"{chunk_doc.metadata['page']}-{chunk_doc.metadata['chunk']}"
+                    doc_chunks.append(chunk_doc)
+        except Exception as chunk_error:
+            print(f"Error processing page {page_number}: {str(chunk_error)}")
+            # Add the page as a single chunk if chunking fails
+            chunk_doc = Document(
+                page_content=page, 
+                metadata={
+                    "page": page_number, 
+                    "chunk": 0,
+                    "filename": filename
+                }
+            )
+            chunk_doc.metadata["source"] = f"{chunk_doc.metadata['page']}-0"
+            doc_chunks.append(chunk_doc)
+        return doc_chunks
+
+    def _text_to_docs(self, text: List[str], filename: str, lexical_index: Optional[LexicalIndex] = None) -> List[Document]:
+        """Convert text to document chunks, adding each to the lexical index when one is given"""
         if isinstance(text, str):
             text = [text]
         
@@ -71,123 +185,407 @@ class DocumentProcessor:
         if not valid_pages:
             raise Exception("All pages appear to be empty")
         
-        page_docs = [Document(page_content=page) for page in valid_pages]
-        for i, doc in enumerate(page_docs):
-            doc.metadata["page"] = i + 1
-
         doc_chunks = []
-        for doc in page_docs:
-            try:
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=settings.chunk_size,
-                    separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""],
-                    chunk_overlap=settings.chunk_overlap,
-                )
-                chunks = text_splitter.split_text(doc.page_content)
-                
-                if not chunks:
-                    # If no chunks created, use the whole page content
-                    chunks = [doc.page_content]
-                
-                for i, chunk in enumerate(chunks):
-                    if chunk.strip():  # Only add non-empty chunks
-                        chunk_doc = Document(
-                            page_content=chunk, 
-                            metadata={
-                                "page": doc.metadata["page"], 
-                                "chunk": i,
-                                "filename": filename
-                            }
-                        )
-                        chunk_doc.metadata["source"] = f"{chunk_doc.metadata['page']}-{chunk_doc.metadata['chunk']}"
-                        doc_chunks.append(chunk_doc)
-            except Exception as chunk_error:
-                print(f"Error processing page {doc.metadata['page']}: {str(chunk_error)}")
-                # Add the page as a single chunk if chunking fails
-                chunk_doc = Document(
-                    page_content=doc.page_content, 
-                    metadata={
-                        "page": doc.metadata["page"], 
-                        "chunk": 0,
-                        "filename": filename
-                    }
-                )
-                chunk_doc.metadata["source"] = f"{chunk_doc.metadata['page']}-0"
-                doc_chunks.append(chunk_doc)
+        for page_number, page in enumerate(valid_pages, 1):
+            doc_chunks.extend(self._split_page(page, page_number, filename))
         
         if not doc_chunks:
             raise Exception("No valid document chunks could be created")
+
+        if lexical_index is not None:
+            for chunk_doc in doc_chunks:
+                lexical_index.add(chunk_doc)
             
         return doc_chunks
 
-    def _create_vector_store(self, documents: List[Document]) -> FAISS:
-        """Create FAISS vector store from documents"""
+    async def _embed_documents(self, documents: List[Document], progress: Optional[Callable] = None) -> List[List[float]]:
+        """Embed chunk texts in batches, reusing cached vectors for unchanged text"""
+        texts = [document.page_content for document in documents]
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+
+        # Only chunks that were never embedded with this model go to the API
+        if settings.enable_embedding_cache:
+            cached = await asyncio.to_thread(embedding_cache.get_many, openai_clients.embedding_space, texts)
+            for position, vector in cached.items():
+                vectors[position] = vector
+        missing = [position for position, vector in enumerate(vectors) if vector is None]
+        if len(missing) < len(texts):
+            print(f"Embedding cache: reused {len(texts) - len(missing)} of {len(texts)} chunks")
+
+        if not missing:
+            return vectors
+
+        async def store_batch(batch_texts: List[str], batch_vectors: List[List[float]]):
+            if settings.enable_embedding_cache:
+                await asyncio.to_thread(embedding_cache.put_many, openai_clients.embedding_space, batch_texts, batch_vectors)
+
+        # Batches run concurrently and are cached as they land, so a failed job keeps its progress
+        missing_vectors = await embedding_pipeline.embed(
+            [texts[position] for position in missing],
+            progress=progress,
+            on_batch=store_batch
+        )
+        for position, vector in zip(missing, missing_vectors):
+            vectors[position] = vector
+        return vectors
+
+    # FAISS index types the factory can build for a per-document store
+    INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq8")
+
+    def _choose_index_type(self, chunks: int) -> str:
+        """The configured index type, or for "auto" the most compact one that keeps recall high at this size"""
+        index_type = settings.vector_index_type
+        if index_type == "auto":
+            if chunks < settings.vector_index_sq8_min_chunks:
+                return "flat"
+            if chunks < settings.vector_index_ivf_pq_min_chunks:
+                return "sq8"
+            return "ivf_pq"
+        if index_type not in self.INDEX_TYPES:
+            raise Exception(f"Unknown vector index type: {index_type}")
+        return index_type
+
+    def _index_factory_string(self, index_type: str, chunks: int, dimensions: int) -> str:
+        """faiss.index_factory description of an index type sized for this many chunks"""
+        # About 4 * sqrt(n) inverted lists, keeping at least 39 training vectors per list
+        nlist = max(1, min(int(4 * math.sqrt(chunks)), min(chunks, settings.vector_index_train_sample) // 39))
+        if index_type == "hnsw":
+            return f"HNSW{settings.vector_index_hnsw_m}"
+        if index_type == "ivf_flat":
+            return f"IVF{nlist},Flat"
+        if index_type == "ivf_pq":
+            # One byte per sub-quantizer, and the sub-quantizers have to split the dimensions evenly
+            sub_quantizers = max(m for m in range(1, min(settings.vector_index_pq_bytes, dimensions) + 1) if dimensions % m == 0)
+            return f"IVF{nlist},PQ{sub_quantizers}"
+        if index_type == "sq8":
+            return "SQ8"
+        return "Flat"
+
+    def _pca_dimensions(self, chunks: int, width: int) -> int:
+        """Width a PCA projection in front of the index reduces vectors to, or 0 to keep them as embedded"""
+        dimensions = settings.embedding_dimensions
+        if settings.embedding_reduction != "pca" or not 0 < dimensions < width:
+            return 0
+        # The projection matrix costs as much as `dimensions` chunks, so small documents keep full width
+        if chunks < 4 * dimensions:
+            return 0
+        return dimensions
+
+    def _build_index(self, vectors: List[List[float]], index_type: Optional[str] = None) -> Tuple[faiss.Index, str]:
+        """Build the FAISS index for one document's chunk vectors, in chunk order; returns it with its type"""
         if not self.api_key_available:
             raise Exception("Cannot create vector store without OpenAI API key")
-        return FAISS.from_documents(documents, self.embeddings)
+        matrix = np.asarray(vectors, dtype=np.float32)
+        index_type = index_type or self._choose_index_type(len(matrix))
+        if index_type == "ivf_pq" and len(matrix) < 256:
+            # Each PQ codebook has 256 centroids and needs at least that many training vectors
+            print(f"Too few chunks ({len(matrix)}) to train ivf_pq, using sq8")
+            index_type = "sq8"
+        pca_dimensions = self._pca_dimensions(len(matrix), matrix.shape[1])
+        description = self._index_factory_string(index_type, len(matrix), pca_dimensions or matrix.shape[1])
+        if pca_dimensions:
+            # Queries go through the same stored projection when the index is searched
+            description = f"PCA{pca_dimensions},{description}"
+        index = faiss.index_factory(matrix.shape[1], description, faiss.METRIC_L2)
+        if index_type == "ivf_pq":
+            # Polysemous codes are never used when searching, and training them dominates build time
+            base_index(index).do_polysemous_training = False
+        if not index.is_trained:
+            sample = matrix
+            if len(matrix) > settings.vector_index_train_sample:
+                rows = np.random.default_rng(0).choice(len(matrix), settings.vector_index_train_sample, replace=False)
+                sample = matrix[np.sort(rows)]
+            index.train(sample)
+        index.add(matrix)
+        return index, index_type
 
-    async def process_document(self, file_content: bytes, filename: str) -> str:
+    async def process_document(self, file_content: Optional[bytes], filename: str, doc_id: Optional[str] = None, progress: Optional[Callable] = None, file_path: Optional[str] = None) -> str:
         """Process document and store in vector database"""
         if not self.api_key_available:
             raise Exception("OpenAI API key is not configured. Please set OPENAI_API_KEY environment variable.")
         
         try:
-            # Generate unique document ID
-            doc_id = str(uuid.uuid4())
+            # Generate unique document ID unless the caller already reserved one
+            doc_id = doc_id or str(uuid.uuid4())
             
-            # Parse PDF
-            text_pages, _ = self._parse_pdf(file_content, filename)
+            # Parse PDF in a worker thread so chat traffic keeps flowing
+            with ingestion_stage_seconds.labels(stage="parse").time():
+                text_pages, _ = await asyncio.to_thread(self._parse_pdf, file_content, filename, progress, file_path)
+                # Lets bulk ingestion recognise the same file later
+                content_hash = await asyncio.to_thread(calculate_path_hash, file_path) if file_path else calculate_file_hash(file_content)
             
             # Convert to document chunks
-            documents = self._text_to_docs(text_pages, filename)
+            if progress:
+                progress("chunking")
+            with ingestion_stage_seconds.labels(stage="split").time():
+                lexical_index = LexicalIndex()
+                documents = self._text_to_docs(text_pages, filename, lexical_index)
+                page_hashes = self._page_hashes(text_pages)
+
+            with ingestion_stage_seconds.labels(stage="embed").time():
+                vectors = await self._embed_documents(documents, progress)
+
+            if progress:
+                progress("indexing")
+            await self._store_document(doc_id, filename, documents, vectors, lexical_index, content_hash, page_hashes=page_hashes, progress=progress)
+            return doc_id
             
+        except IngestionCancelled:
+            raise
+        except Exception as e:
+            raise Exception(f"Document processing failed: {str(e)}")
+
+    async def _store_document(
+        self,
+        doc_id: str,
+        filename: str,
+        documents: List[Document],
+        vectors: List[List[float]],
+        lexical_index: LexicalIndex,
+        content_hash: Optional[str] = None,
+        register: bool = True,
+        page_hashes: Optional[List[str]] = None,
+        progress: Optional[Callable] = None
+    ) -> Dict[str, Any]:
+        """Index and persist embedded chunks; returns the registry record, written here unless register is False
+
+        An existing document with the same doc_id is replaced as a whole while reads continue.
+        """
+        vector_store_path = os.path.join(settings.vector_store_path, doc_id)
+        os.makedirs(settings.vector_store_path, exist_ok=True)
+
+        if settings.use_corpus_index:
+            # Swap the document's chunks in the shared index (which saves it); the document directory only keeps metadata
+            with ingestion_stage_seconds.labels(stage="index").time():
+                await asyncio.to_thread(corpus_index.require_space, openai_clients.embedding_space, self.embeddings)
+                await self._write(doc_id, corpus_index.replace_document, doc_id, documents, vectors, self.embeddings)
+            index, index_type = None, "flat"
+        else:
             # Create vector store
-            vector_store = self._create_vector_store(documents)
-            
-            # Save vector store to disk using FAISS native save method
-            vector_store_path = os.path.join(settings.vector_store_path, doc_id)
-            os.makedirs(settings.vector_store_path, exist_ok=True)
-            
-            # Save FAISS index and docstore separately
-            vector_store.save_local(vector_store_path)
-            
+            with ingestion_stage_seconds.labels(stage="index").time():
+                index, index_type = await asyncio.to_thread(self._build_index, vectors)
+
+        with ingestion_stage_seconds.labels(stage="persist").time():
             # Save metadata to disk for persistence
             metadata = {
                 "filename": filename,
                 "doc_id": doc_id,
                 "status": "processed",
                 "chunks": len(documents),
+                "storage": "corpus" if settings.use_corpus_index else "document",
+                "index_type": index_type,
+                "embedding_space": openai_clients.embedding_space,
+                "dimensions": base_index(index).d if index is not None else len(vectors[0]) if vectors else 0,
+                "page_hashes": page_hashes or [],  # Lets update_document find the pages that changed
                 "created_at": str(uuid.uuid4().hex[:8])  # Simple timestamp
             }
-            
-            metadata_file = os.path.join(vector_store_path, "metadata.json")
-            with open(metadata_file, 'w') as f:
-                import json
+            # One thread call writes and swaps in the whole directory, so a cancelled job never leaves it half replaced
+            await self._write(doc_id, self._persist_document, doc_id, documents, index, lexical_index, metadata, progress)
+
+            record = {
+                "doc_id": doc_id, "filename": filename, "chunks": len(documents), "path": vector_store_path, "content_hash": content_hash
+            }
+            if register:
+                # Register the document; only its own row is written
+                await asyncio.to_thread(document_registry.register_many, [record])
+
+        # A re-processed document must not keep serving answers or stores built from its old content
+        vector_store_pool.invalidate(doc_id)
+        lexical_index_store.invalidate(doc_id)
+        await response_cache.invalidate_document(doc_id)
+        return record
+
+    async def _write(self, doc_id: str, func: Callable, *args):
+        """Run a store write in a thread that finishes even if its job is cancelled; delete_document waits for it"""
+        future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        self._writes[doc_id] = future
+
+        def forget(_):
+            if self._writes.get(doc_id) is future:
+                del self._writes[doc_id]
+
+        future.add_done_callback(forget)
+        return await asyncio.shield(future)
+
+    def _persist_document(
+        self,
+        doc_id: str,
+        documents: List[Document],
+        index: Optional[faiss.Index],
+        lexical_index: LexicalIndex,
+        metadata: Dict[str, Any],
+        progress: Optional[Callable] = None
+    ):
+        """Write a new version of a document's directory, then switch the document over to it in one rename
+
+        Searches see either the old or the new version and never a mix; every worker notices the
+        switch on its next pool or lexical cache lookup.
+        """
+        import json
+        version_path = new_version_dir(doc_id)
+        try:
+            if index is not None:
+                # FAISS index plus offset-indexed chunk records, both memory-mapped when loaded
+                MappedVectorStore.write(version_path, documents, index)
+
+            # Inverted index for BM25 lookups of exact terms such as course codes
+            lexical_index.save(version_path)
+
+            with open(os.path.join(version_path, "metadata.json"), 'w') as f:
                 json.dump(metadata, f, indent=2)
+            if progress:
+                # Last chance for a cancelled job to stop before its document goes live
+                progress("indexing")
+        except BaseException:
+            shutil.rmtree(version_path, ignore_errors=True)
+            raise
+        store_versions.publish(doc_id, version_path)
 
-            # Cache document info
-            cache_service.set(f"doc_info_{doc_id}", {
-                "filename": filename,
-                "status": "processed",
-                "chunks": len(documents),
-                "path": vector_store_path
-            })
-            
-            return doc_id
-            
-        except Exception as e:
-            raise Exception(f"Document processing failed: {str(e)}")
+    def _stored_vectors(self, doc_id: str, sources: List[str]) -> Dict[str, List[float]]:
+        """Exact stored vectors of a document's chunks by source id; chunks stored compressed or projected are left out"""
+        if settings.use_corpus_index:
+            return corpus_index.get_vectors(doc_id, sources, self.embeddings)
+        return self.get_vector_store(doc_id).vectors(sources)
+
+    async def update_document(self, doc_id: str, file_content: Optional[bytes], filename: str, progress: Optional[Callable] = None, file_path: Optional[str] = None) -> Dict[str, Any]:
+        """Replace a document with a new version under the same doc_id, re-embedding only the pages whose text changed
+
+        Unchanged pages keep their chunks, even if they moved. Their vectors are read back from the
+        index when it stores them exactly, otherwise they go through the embedding cache. Documents indexed
+        before page hashes were recorded count every page as changed. Returns page and chunk counts.
+        """
+        import json
+        if not self.api_key_available:
+            raise Exception("OpenAI API key is not configured. Please set OPENAI_API_KEY environment variable.")
+        doc_info = document_registry.get(doc_id)
+        if not doc_info:
+            raise Exception(f"Document {doc_id} not found")
+
+        # Updates of one document run one at a time, each starting from the version the last one swapped in
+        async with self._update_locks.setdefault(doc_id, asyncio.Lock()):
+            try:
+                with open(os.path.join(doc_info["path"], "metadata.json"), 'r') as f:
+                    metadata = json.load(f)
+
+                with ingestion_stage_seconds.labels(stage="parse").time():
+                    text_pages, _ = await asyncio.to_thread(self._parse_pdf, file_content, filename, progress, file_path)
+                    content_hash = await asyncio.to_thread(calculate_path_hash, file_path) if file_path else calculate_file_hash(file_content)
+
+                if progress:
+                    progress("chunking")
+                with ingestion_stage_seconds.labels(stage="split").time():
+                    pages = [page for page in text_pages if page.strip()]
+                    if not pages:
+                        raise Exception("All pages appear to be empty")
+                    page_hashes = self._page_hashes(text_pages)
+                    old_pages = {page_hash: page_number for page_number, page_hash in enumerate(metadata.get("page_hashes", []), 1)}
+                    # Vectors from another embedding space cannot be mixed with new ones
+                    if metadata.get("embedding_space", "text-embedding-ada-002") != openai_clients.embedding_space:
+                        old_pages = {}
+                    old_chunks: Dict[int, List[Document]] = {}
+                    if any(page_hash in old_pages for page_hash in page_hashes):
+                        for document in await asyncio.to_thread(self._stored_chunks, doc_id):
+                            old_chunks.setdefault(document.metadata.get("page"), []).append(document)
+
+                    documents: List[Document] = []
+                    reused: Dict[int, str] = {}  # position in documents -> source id of the stored chunk
+                    changed_pages = 0
+                    for page_number, (page, page_hash) in enumerate(zip(pages, page_hashes), 1):
+                        stored = old_chunks.get(old_pages.get(page_hash))
+                        if not stored:
+                            changed_pages += 1
+                            documents.extend(self._split_page(page, page_number, filename))
+                            continue
+                        for position, chunk in enumerate(stored):
+                            reused[len(documents)] = chunk.metadata["source"]
+                            chunk_number = chunk.metadata.get("chunk", position)
+                            documents.append(Document(
+                                page_content=chunk.page_content,
+                                metadata={"page": page_number, "chunk": chunk_number, "filename": filename, "source": f"{page_number}-{chunk_number}"}
+                            ))
+                    lexical_index = LexicalIndex.from_documents(documents)
+
+                with ingestion_stage_seconds.labels(stage="embed").time():
+                    stored_vectors = await asyncio.to_thread(self._stored_vectors, doc_id, list(set(reused.values()))) if reused else {}
+                    vectors: List[Optional[List[float]]] = [stored_vectors.get(reused.get(position)) for position in range(len(documents))]
+                    missing = [position for position, vector in enumerate(vectors) if vector is None]
+                    if missing:
+                        for position, vector in zip(missing, await self._embed_documents([documents[position] for position in missing], progress)):
+                            vectors[position] = vector
+
+                if progress:
+                    progress("indexing")
+                await self._store_document(doc_id, filename, documents, vectors, lexical_index, content_hash, page_hashes=page_hashes, progress=progress)
+                return {
+                    "doc_id": doc_id,
+                    "pages": len(pages),
+                    "changed_pages": changed_pages,
+                    "chunks": len(documents),
+                    "embedded_chunks": len(missing),
+                }
+
+            except IngestionCancelled:
+                raise
+            except Exception as e:
+                raise Exception(f"Document update failed: {str(e)}")
 
-    def get_vector_store(self, doc_id: str) -> FAISS:
+    async def reembed_document(self, doc_id: str) -> bool:
+        """Rebuild a document's store in the configured embedding space from its stored chunks; False if it already matches"""
+        import json
+        doc_info = document_registry.get(doc_id)
+        if not doc_info:
+            raise Exception(f"Document {doc_id} not found")
+        vector_store_path = doc_info["path"]
+        metadata_file = os.path.join(vector_store_path, "metadata.json")
+        with open(metadata_file, 'r') as f:
+            metadata = json.load(f)
+        if metadata.get("storage") == "corpus":
+            # Its vectors live in the shared index, which reembed_corpus rebuilds as a whole
+            await asyncio.to_thread(corpus_index.require_space, openai_clients.embedding_space, self.embeddings)
+            return False
+
+        store = await asyncio.to_thread(open_store, vector_store_path)
+        # Stores written before the space was recorded hold full-width vectors from the original model
+        same_space = metadata.get("embedding_space", "text-embedding-ada-002") == openai_clients.embedding_space
+        projected = base_index(store.index).d if isinstance(store.index, faiss.IndexPreTransform) else 0
+        if same_space and projected == self._pca_dimensions(len(store), store.index.d):
+            return False
+
+        documents = await asyncio.to_thread(store.documents)
+        del store
+        vectors = await self._embed_documents(documents)
+        index, index_type = await asyncio.to_thread(self._build_index, vectors)
+        metadata.update({"index_type": index_type, "embedding_space": openai_clients.embedding_space, "dimensions": base_index(index).d})
+        # Written as a new version and swapped in whole, like a fresh ingestion
+        await self._write(doc_id, self._persist_document, doc_id, documents, index, LexicalIndex.from_documents(documents), metadata)
+
+        vector_store_pool.invalidate(doc_id)
+        lexical_index_store.invalidate(doc_id)
+        await response_cache.invalidate_document(doc_id)
+        return True
+
+    async def reembed_corpus(self) -> bool:
+        """Rebuild the shared corpus index in the configured embedding space from its chunks; False if it already matches"""
+        await asyncio.to_thread(corpus_index.load, self.embeddings)
+        if corpus_index.embedding_space in (None, openai_clients.embedding_space):
+            return False
+        documents = await asyncio.to_thread(corpus_index.all_chunks, self.embeddings)
+        vectors = await self._embed_documents(documents)
+        await asyncio.to_thread(corpus_index.rebuild, documents, vectors, openai_clients.embedding_space, self.embeddings)
+        for doc_id in {document.metadata["doc_id"] for document in documents}:
+            await response_cache.invalidate_document(doc_id)
+        return True
+
+    def get_vector_store(self, doc_id: str) -> MappedVectorStore:
         """Load vector store for a document"""
         if not self.api_key_available:
             raise Exception("Cannot load vector store without OpenAI API key")
             
-        doc_info = cache_service.get(f"doc_info_{doc_id}")
+        doc_info = document_registry.get(doc_id)
         if doc_info:
             vector_store_path = doc_info["path"]
         else:
-            # Try to find document on disk even if not in cache
+            # Try to find document on disk even if it was never registered
             vector_store_path = os.path.join(settings.vector_store_path, doc_id)
             if os.path.exists(vector_store_path):
                 # Try to load metadata and rebuild cache entry
@@ -197,14 +595,11 @@ class DocumentProcessor:
                         import json
                         with open(metadata_file, 'r') as f:
                             metadata = json.load(f)
-                        # Rebuild cache entry
-                        cache_service.set(f"doc_info_{doc_id}", {
-                            "filename": metadata.get("filename", "Unknown Document"),
-                            "status": "processed",
-                            "chunks": metadata.get("chunks", 0),
-                            "path": vector_store_path
-                        })
-                        print(f"Rebuilt cache entry for document {doc_id}")
+                        # Register the document
+                        document_registry.register(
+                            doc_id, metadata.get("filename", "Unknown Document"), metadata.get("chunks", 0), vector_store_path
+                        )
+                        print(f"Registered document {doc_id} found on disk")
                     except Exception as e:
                         print(f"Error loading metadata for {doc_id}: {e}")
             else:
@@ -213,59 +608,103 @@ class DocumentProcessor:
         if not os.path.exists(vector_store_path):
             raise Exception(f"Vector store directory not found: {vector_store_path}")
         
-        # Load FAISS index using native method
-        return FAISS.load_local(vector_store_path, self.embeddings, allow_dangerous_deserialization=True)
+        # Map the store's files, reusing the pooled copy when possible
+        return vector_store_pool.get(doc_id, vector_store_path, lambda: open_store(vector_store_path))
+
+    async def search_corpus(self, query: str, doc_ids: List[str], k: int, query_vector: Optional[List[float]] = None) -> List[Tuple[Document, float]]:
+        """Search the shared corpus index, restricted to the given documents; returns (chunk, distance) pairs"""
+        if not self.api_key_available:
+            raise Exception("Cannot search vector store without OpenAI API key")
+        await asyncio.to_thread(corpus_index.require_space, openai_clients.embedding_space, self.embeddings)
+        if query_vector is None:
+            query_vector = await query_embedding_cache.embed(query, self.embeddings)
+        return await asyncio.to_thread(corpus_index.search, query_vector, doc_ids, k, self.embeddings)
+
+    def _stored_chunks(self, doc_id: str, sources: Optional[List[str]] = None) -> List[Document]:
+        """Chunks of an indexed document, optionally only those with the given source ids"""
+        if settings.use_corpus_index:
+            return corpus_index.get_chunks(doc_id, sources, self.embeddings)
+        return self.get_vector_store(doc_id).documents(sources)
+
+    def lexical_search(self, query: str, doc_ids: List[str], k: int) -> List[Tuple[float, str, Document]]:
+        """BM25 search over the documents' inverted indexes; returns (score, doc_id, chunk), best first"""
+        indexes = []
+        for doc_id in doc_ids:
+            try:
+                index = lexical_index_store.get(doc_id, build=lambda: self._stored_chunks(doc_id))
+            except Exception as e:
+                print(f"Error loading lexical index for {doc_id}: {str(e)}")
+                continue
+            if index is not None:
+                indexes.append((doc_id, index))
+        hits = bm25_search(indexes, query, k)
+
+        # Resolve the winning chunk ids to their stored text
+        wanted: Dict[str, List[str]] = {}
+        for _, doc_id, source in hits:
+            wanted.setdefault(doc_id, []).append(source)
+        chunks = {}
+        for doc_id, sources in wanted.items():
+            for document in self._stored_chunks(doc_id, sources):
+                chunks[(doc_id, document.metadata.get("source"))] = document
+        return [(score, doc_id, chunks[(doc_id, source)]) for score, doc_id, source in hits if (doc_id, source) in chunks]
 
     def get_document_status(self, doc_id: str) -> str:
         """Get processing status of a document"""
-        doc_info = cache_service.get(f"doc_info_{doc_id}")
+        doc_info = document_registry.get(doc_id)
         if not doc_info:
             return "not_found"
         return doc_info["status"]
 
-    def list_documents(self):
-        """List all available documents"""
-        documents = []
-        
-        # Get documents from cache
-        for key in list(cache_service.cache.keys()):
-            if key.startswith("doc_info_"):
-                doc_id = key.replace("doc_info_", "")
-                doc_info = cache_service.get(key)
-                if doc_info:
-                    documents.append({
-                        "doc_id": doc_id,
-                        "filename": doc_info.get("filename", "Unknown"),
-                        "status": doc_info.get("status", "unknown"),
-                        "chunks": doc_info.get("chunks", 0),
-                        "path": doc_info.get("path", "")
-                    })
-        
-        return documents
+    def list_documents(self, limit: Optional[int] = None, cursor: Optional[int] = None) -> Tuple[List[Dict], Optional[int]]:
+        """List available documents, a page at a time when a limit is given"""
+        records, next_cursor = document_registry.list_page(limit, cursor)
+        documents = [{
+            "doc_id": record["doc_id"],
+            "filename": record["filename"],
+            "status": record["status"],
+            "chunks": record["chunks"],
+            "path": record["path"]
+        } for record in records]
+        return documents, next_cursor
 
     async def delete_document(self, doc_id: str):
         """Delete document and its vector store"""
-        doc_info = cache_service.get(f"doc_info_{doc_id}")
+        doc_info = document_registry.get(doc_id)
         
-        # Check if document exists in cache
+        # Check if document is registered
         if doc_info:
             vector_store_path = doc_info["path"]
         else:
-            # Try to find document on disk even if not in cache
+            # Try to find document on disk even if it was never registered
             vector_store_path = os.path.join(settings.vector_store_path, doc_id)
             
-        # Check if vector store directory exists
-        if os.path.exists(vector_store_path):
-            try:
-                shutil.rmtree(vector_store_path)
-                print(f"Deleted vector store directory: {vector_store_path}")
-            except Exception as e:
-                raise Exception(f"Error deleting vector store directory: {str(e)}")
-        else:
+        # A cancelled job's last write may still be running; let it land so it is deleted too
+        pending = self._writes.get(doc_id)
+        if pending is not None:
+            await asyncio.wait([pending])
+
+        # Stop serving the pooled copy and cached answers before the files disappear
+        vector_store_pool.invalidate(doc_id)
+        lexical_index_store.invalidate(doc_id)
+        await response_cache.invalidate_document(doc_id)
+        if settings.use_corpus_index and self.api_key_available:
+            await asyncio.to_thread(corpus_index.delete_document, doc_id, self.embeddings)
+
+        # Remove the document's directory, or its link and every version it points at
+        try:
+            removed = await asyncio.to_thread(store_versions.remove_document, doc_id)
+        except Exception as e:
+            raise Exception(f"Error deleting vector store directory: {str(e)}")
+        if not removed:
             # Document doesn't exist on disk
             raise Exception(f"Document {doc_id} not found")
+        print(f"Deleted vector store directory: {vector_store_path}")
             
-        # Remove from cache if it exists
-        if doc_info:
-            cache_service.delete(f"doc_info_{doc_id}")
-            print(f"Removed document {doc_id} from cache")
+        # Remove from the registry if it is registered
+        if document_registry.remove(doc_id):
+            print(f"Removed document {doc_id} from registry")
+
+
+# Global document processor instance, shared by the chat service and ingestion workers
+document_processor = DocumentProcessor()
@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import settings
+
+LEGACY_CACHE_FILE = "cache_data.json"
+QUERY_COUNT_FLUSH_SECONDS = 30
+
+_COLUMNS = "seq, doc_id, filename, status, chunks, path, created_at, updated_at"
+
+
+def is_document_dir(doc_dir: Path) -> bool:
+    """A document either has its own FAISS files or lives in the corpus index"""
+    if (doc_dir / "index.faiss").exists() and ((doc_dir / "chunks.idx").exists() or (doc_dir / "index.pkl").exists()):
+        return True
+    metadata_file = doc_dir / "metadata.json"
+    if metadata_file.exists():
+        try:
+            with open(metadata_file, 'r') as f:
+                return json.load(f).get("storage") == "corpus"
+        except Exception:
+            return False
+    return False
+
+
+def read_document_metadata(doc_dir: Path) -> Dict[str, Any]:
+    """Filename and chunk count from a document's metadata.json, if it has one"""
+    try:
+        with open(doc_dir / "metadata.json", 'r') as f:
+            metadata = json.load(f)
+        return {"filename": metadata.get("filename", "Unknown Document"), "chunks": metadata.get("chunks", 0)}
+    except Exception:
+        return {"filename": "Unknown Document", "chunks": 0}
+
+
+class DocumentRegistry:
+    """Durable record of every ingested document, one SQLite row each, kept apart from volatile caches"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path if path is not None else settings.document_registry_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._pending_queries = Counter()  # doc_id -> searches not yet written to disk
+        self._flusher: Optional[asyncio.Task] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the registry on first use, importing documents from older layouts once (caller holds the lock)"""
+        if self._conn is None:
+            # Every uvicorn worker opens the same file, so wait for their locks instead of failing
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT NOT NULL UNIQUE, filename TEXT NOT NULL, "
+                "status TEXT NOT NULL, chunks INTEGER NOT NULL, path TEXT NOT NULL, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, query_count INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(documents)")}
+            if "query_count" not in columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN query_count INTEGER NOT NULL DEFAULT 0")
+            if "content_hash" not in columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN content_hash TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_query_count ON documents (query_count)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents (content_hash)")
+            conn.execute("CREATE TABLE IF NOT EXISTS registry_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.commit()
+            self._conn = conn
+            if conn.execute("SELECT 1 FROM registry_meta WHERE key = 'migrated'").fetchone() is None:
+                self._migrate(conn)
+        return self._conn
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """Import cache_data.json and any existing vector stores; runs once, not on every startup"""
+        now = time.time()
+        records: Dict[str, Tuple] = {}
+        try:
+            if os.path.exists(LEGACY_CACHE_FILE):
+                with open(LEGACY_CACHE_FILE, 'r') as f:
+                    for key, info in json.load(f).items():
+                        if key.startswith("doc_info_"):
+                            doc_id = key[len("doc_info_"):]
+                            records[doc_id] = (doc_id, info.get("filename", "Unknown Document"), info.get("status", "processed"),
+                                               info.get("chunks", 0), info.get("path", ""), now, now)
+        except Exception as e:
+            print(f"Error importing {LEGACY_CACHE_FILE}: {e}")
+
+        vector_stores_dir = Path(settings.vector_store_path)
+        if vector_stores_dir.exists():
+            for doc_dir in sorted(vector_stores_dir.iterdir(), key=lambda entry: entry.stat().st_mtime):
+                # Directories starting with "_" hold shared indexes, not documents
+                if doc_dir.name in records or doc_dir.name.startswith("_") or not doc_dir.is_dir() or not is_document_dir(doc_dir):
+                    continue
+                metadata = read_document_metadata(doc_dir)
+                created_at = doc_dir.stat().st_mtime
+                records[doc_dir.name] = (doc_dir.name, metadata["filename"], "processed", metadata["chunks"], str(doc_dir), created_at, created_at)
+
+        conn.executemany(
+            "INSERT OR IGNORE INTO documents (doc_id, filename, status, chunks, path, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            list(records.values())
+        )
+        conn.execute("INSERT OR REPLACE INTO registry_meta (key, value) VALUES ('migrated', ?)", (str(now),))
+        conn.commit()
+        if records:
+            print(f"Imported {len(records)} documents into the document registry")
+
+    @staticmethod
+    def _record(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "doc_id": row["doc_id"],
+            "filename": row["filename"],
+            "status": row["status"],
+            "chunks": row["chunks"],
+            "path": row["path"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def open(self) -> int:
+        """Open the registry ahead of the first request; returns the number of documents"""
+        return self.count()
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection().execute(f"SELECT {_COLUMNS} FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return self._record(row) if row is not None else None
+
+    def register(self, doc_id: str, filename: str, chunks: int, path: str, status: str = "processed", content_hash: Optional[str] = None):
+        """Insert or update one document; a re-processed document keeps its place in the listing"""
+        self.register_many([{
+            "doc_id": doc_id, "filename": filename, "chunks": chunks, "path": path, "status": status, "content_hash": content_hash
+        }])
+
+    def register_many(self, records: List[Dict[str, Any]]):
+        """Insert or update several documents in one transaction"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO documents (doc_id, filename, status, chunks, path, content_hash, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(doc_id) DO UPDATE SET filename = excluded.filename, status = excluded.status, "
+                    "chunks = excluded.chunks, path = excluded.path, "
+                    "content_hash = COALESCE(excluded.content_hash, content_hash), updated_at = excluded.updated_at",
+                    [
+                        (record["doc_id"], record["filename"], record.get("status", "processed"), record["chunks"],
+                         record["path"], record.get("content_hash"), now, now)
+                        for record in records
+                    ]
+                )
+
+    def find_by_hashes(self, content_hashes: List[str]) -> Dict[str, str]:
+        """Documents already ingested from files with these SHA-256 hashes; returns hash -> doc_id"""
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(content_hashes), 500):  # Stay under SQLite's variable limit
+                batch = content_hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for row in conn.execute(
+                    f"SELECT content_hash, doc_id FROM documents WHERE content_hash IN ({placeholders})", batch
+                ):
+                    found[row["content_hash"]] = row["doc_id"]
+        return found
+
+    def remove(self, doc_id: str) -> bool:
+        with self._lock:
+            conn = self._connection()
+            removed = conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,)).rowcount
+            conn.commit()
+        return removed > 0
+
+    def list_page(self, limit: Optional[int] = None, cursor: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Documents in registration order after `cursor`; returns the page and the cursor of the next one"""
+        with self._lock:
+            conn = self._connection()
+            if limit is None:
+                rows = conn.execute(f"SELECT {_COLUMNS} FROM documents WHERE seq > ? ORDER BY seq", (cursor or 0,)).fetchall()
+            else:
+                # Keyset pagination: one index seek per page however deep the page is
+                rows = conn.execute(
+                    f"SELECT {_COLUMNS} FROM documents WHERE seq > ? ORDER BY seq LIMIT ?", (cursor or 0, limit + 1)
+                ).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1]["seq"]
+        return [self._record(row) for row in rows], next_cursor
+
+    def record_queries(self, doc_ids: List[str]):
+        """Count searches per document in memory; called on the event loop, so it never touches SQLite"""
+        self._pending_queries.update(doc_ids)
+
+    def start_flushing(self):
+        """Write search counts to disk every QUERY_COUNT_FLUSH_SECONDS from a worker thread"""
+        async def flush_periodically():
+            while True:
+                await asyncio.sleep(QUERY_COUNT_FLUSH_SECONDS)
+                try:
+                    await asyncio.to_thread(self.flush)
+                except Exception as e:
+                    print(f"Error saving search counts: {e}")
+
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(flush_periodically())
+
+    async def stop_flushing(self):
+        """Stop the periodic flush and save the counts still in memory"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await asyncio.to_thread(self.flush)
+
+    def flush(self):
+        # Swap in a fresh counter so searches keep counting without waiting for the write
+        pending, self._pending_queries = self._pending_queries, Counter()
+        if not pending:
+            return
+        pending = list(pending.items())
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("UPDATE documents SET query_count = query_count + ? WHERE doc_id = ?", [(n, doc_id) for doc_id, n in pending])
+            conn.commit()
+
+    def most_queried(self, limit: int) -> List[str]:
+        """Ids of the most searched documents, for prewarming their indexes"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT doc_id FROM documents WHERE query_count > 0 ORDER BY query_count DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [row["doc_id"] for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"documents": self.count(), "path": self.path}
+
+
+# Global document registry instance
+document_registry = DocumentRegistry()
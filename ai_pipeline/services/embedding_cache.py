@@ -0,0 +1,124 @@
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config.settings import settings
+from services.metrics import cache_hits, cache_misses
+from utils.pdf_utils import calculate_file_hash
+
+
+class EmbeddingCache:
+    """On-disk cache of chunk embeddings keyed by a hash of (model, text)"""
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.path = path or settings.embedding_cache_path
+        self.max_bytes = max_bytes if max_bytes is not None else settings.embedding_cache_max_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.entries = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the cache database on first use (caller holds the lock)"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+            self.entries, self.total_bytes = count, total
+        return self._conn
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return calculate_file_hash(f"{model}\n{text}".encode("utf-8"))
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, List[float]]:
+        """Return cached vectors by position in texts; positions missing from the result are misses"""
+        keys = [self.key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(keys), 500):  # Stay under SQLite's variable limit
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for key, vector in conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch):
+                    found[key] = vector
+            if found:
+                now = time.time()
+                conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found])
+                conn.commit()
+
+            result = {}
+            for position, key in enumerate(keys):
+                if key in found:
+                    result[position] = np.frombuffer(found[key], dtype=np.float32).tolist()
+            self.hits += len(result)
+            self.misses += len(keys) - len(result)
+            cache_hits.labels(cache="embedding").inc(len(result))
+            cache_misses.labels(cache="embedding").inc(len(keys) - len(result))
+            return result
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        """Store freshly computed vectors, then evict least recently used entries over budget"""
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((self.key(model, text), blob, len(blob), now))
+        with self._lock:
+            conn = self._connection()
+            for key, blob, size, _ in rows:
+                existing = conn.execute("SELECT size FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if existing:
+                    self.total_bytes -= existing[0]
+                    self.entries -= 1
+                self.total_bytes += size
+                self.entries += 1
+            conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)", rows)
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop least recently used vectors until the cache is back under 90% of its budget"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        while self.total_bytes > target:
+            rows = conn.execute("SELECT key, size FROM embeddings ORDER BY last_access LIMIT 1000").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self.total_bytes <= target:
+                    break
+                conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.entries -= 1
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._connection()
+            lookups = self.hits + self.misses
+            return {
+                "entries": self.entries,
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Global embedding cache instance
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,195 @@
+import re
+import time
+import asyncio
+import random
+from typing import Any, Callable, Dict, List, Optional
+
+import openai
+
+from config.settings import settings
+from services.openai_clients import openai_clients
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset headers such as '1s', '6m0s' or '20ms' into seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+class EmbeddingPipeline:
+    """Embeds chunk batches concurrently, backing off adaptively when the API rate limits us"""
+
+    def __init__(self, batch_size: Optional[int] = None, concurrency: Optional[int] = None, max_retries: Optional[int] = None):
+        self.batch_size = batch_size or settings.embedding_batch_size
+        self.max_concurrency = concurrency or settings.embedding_concurrency
+        self.max_retries = max_retries if max_retries is not None else settings.embedding_max_retries
+        self.last_stats: Dict[str, Any] = {}
+        # Adaptive concurrency: halve on 429, grow back by one after a run of successes
+        self._limit = self.max_concurrency
+        self._active = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind_to_loop(self):
+        """Limiter state is shared by concurrent jobs, but belongs to one event loop"""
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+            self._active = 0
+
+    def _client(self):
+        # Retries are handled per batch here, so the SDK must not retry on its own
+        return openai_clients.chat.with_options(max_retries=0)
+
+    async def _acquire(self):
+        async with self._condition:
+            while self._active >= self._limit:
+                await self._condition.wait()
+            self._active += 1
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _release(self, throttled: bool, wait_seconds: float = 0.0):
+        async with self._condition:
+            self._active -= 1
+            if throttled:
+                self._limit = max(1, self._limit // 2)
+                self._successes = 0
+                self._paused_until = max(self._paused_until, time.monotonic() + wait_seconds)
+            else:
+                self._successes += 1
+                if self._successes >= self._limit and self._limit < self.max_concurrency:
+                    self._limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+    def _respect_headers(self, headers, next_batch_chars: int):
+        """Pause before the next request if the remaining quota says it would be rejected"""
+        try:
+            remaining_requests = int(headers.get("x-ratelimit-remaining-requests", -1))
+            remaining_tokens = int(headers.get("x-ratelimit-remaining-tokens", -1))
+        except ValueError:
+            return
+        wait = 0.0
+        if remaining_requests == 0:
+            wait = max(wait, parse_reset_duration(headers.get("x-ratelimit-reset-requests")) or 1.0)
+        # Roughly four characters per token
+        if 0 <= remaining_tokens < next_batch_chars // 4:
+            wait = max(wait, parse_reset_duration(headers.get("x-ratelimit-reset-tokens")) or 1.0)
+        if wait:
+            self._paused_until = max(self._paused_until, time.monotonic() + wait)
+
+    @staticmethod
+    def _retry_after(error: openai.APIStatusError, attempt: int) -> float:
+        headers = error.response.headers if error.response is not None else {}
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            return float(retry_after_ms) / 1000.0
+        retry_after = parse_reset_duration(headers.get("retry-after"))
+        if retry_after is not None:
+            return retry_after
+        return min(60.0, (2 ** attempt) + random.random())
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        kwargs = {"model": settings.embedding_model, "input": texts}
+        if openai_clients.embedding_dimensions:
+            kwargs["dimensions"] = openai_clients.embedding_dimensions
+        raw = await self._client().embeddings.with_raw_response.create(**kwargs)
+        self._respect_headers(raw.headers, sum(len(text) for text in texts))
+        response = raw.parse()
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def embed(
+        self,
+        texts: List[str],
+        progress: Optional[Callable] = None,
+        on_batch: Optional[Callable] = None
+    ) -> List[List[float]]:
+        """Embed texts in order; only batches that fail are retried"""
+        self._bind_to_loop()
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        batches = [(start, texts[start:start + self.batch_size]) for start in range(0, len(texts), self.batch_size)]
+        queue: asyncio.Queue = asyncio.Queue()
+        for number, batch in enumerate(batches):
+            queue.put_nowait((number, 0))
+
+        stats = {"chunks": len(texts), "batches": len(batches), "retries": 0, "rate_limited": 0}
+        completed = 0
+        started = time.perf_counter()
+
+        async def worker():
+            nonlocal completed
+            while True:
+                try:
+                    number, attempt = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start, batch = batches[number]
+                await self._acquire()
+                try:
+                    batch_vectors = await self._embed_batch(batch)
+                except openai.RateLimitError as e:
+                    wait = self._retry_after(e, attempt)
+                    stats["rate_limited"] += 1
+                    await self._release(throttled=True, wait_seconds=wait)
+                    self._requeue(queue, number, attempt, e, stats)
+                    continue
+                except (openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError) as e:
+                    await self._release(throttled=False)
+                    await asyncio.sleep(min(30.0, (2 ** attempt) + random.random()))
+                    self._requeue(queue, number, attempt, e, stats)
+                    continue
+                except BaseException:
+                    await self._release(throttled=False)
+                    raise
+                await self._release(throttled=False)
+
+                for offset, vector in enumerate(batch_vectors):
+                    vectors[start + offset] = vector
+                if on_batch:
+                    await on_batch(batch, batch_vectors)
+                completed += 1
+                if progress:
+                    progress("embedding", completed, len(batches))
+
+        # Workers exit when the queue drains; requeued batches keep at least one worker busy
+        while not queue.empty():
+            tasks = [asyncio.create_task(worker()) for _ in range(min(self.max_concurrency, queue.qsize()))]
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in done:
+                if task.exception():
+                    raise task.exception()
+
+        elapsed = time.perf_counter() - started
+        stats["seconds"] = round(elapsed, 3)
+        stats["chunks_per_second"] = round(len(texts) / elapsed, 1) if elapsed > 0 else 0.0
+        self.last_stats = stats
+        print(f"Embedded {len(texts)} chunks in {len(batches)} batches: {stats['chunks_per_second']} chunks/s, "
+              f"{stats['retries']} retries, {stats['rate_limited']} rate limited")
+        return vectors
+
+    def _requeue(self, queue: asyncio.Queue, number: int, attempt: int, error: Exception, stats: Dict[str, Any]):
+        if attempt + 1 > self.max_retries:
+            raise Exception(f"Embedding batch {number + 1} failed after {attempt + 1} attempts: {error}")
+        stats["retries"] += 1
+        queue.put_nowait((number, attempt + 1))
+
+
+# Global embedding pipeline instance
+embedding_pipeline = EmbeddingPipeline()
@@ -0,0 +1,364 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import asyncio
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from config.settings import settings
+from services.metrics import errors
+
+
+class IngestionCancelled(Exception):
+    """Raised inside a running job once it has been cancelled"""
+
+
+class IngestionQueue:
+    """Bounded pool of background workers that turn uploaded PDFs into vector stores
+
+    Jobs live in ingestion_jobs/<job_id>.json, shared by every uvicorn worker, and
+    <doc_id>.job names the latest job for a document. Any worker accepts uploads and
+    answers job lookups; the one holding the ingestion lock runs the jobs.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[str, Dict[str, Any]] = {}  # Jobs this worker runs, when it holds the lock
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._poller: Optional[asyncio.Task] = None
+        self._lock_file = None  # Open while this worker is the job runner
+        self._running: Dict[str, asyncio.Task] = {}  # job_id -> task processing it
+        self._lock = threading.Lock()
+        self._last_persisted: Dict[str, float] = {}
+        self._stopping = False
+        self.document_processor = None
+        self._get_document_processor: Optional[Callable[[], Any]] = None
+
+    def _job_file(self, job_id: str) -> str:
+        return os.path.join(settings.ingestion_jobs_path, f"{job_id}.json")
+
+    def _cancel_file(self, job_id: str) -> str:
+        return os.path.join(settings.ingestion_jobs_path, f"{job_id}.cancel")
+
+    def _pointer_file(self, doc_id: str) -> str:
+        return os.path.join(settings.ingestion_jobs_path, f"{doc_id}.job")
+
+    @property
+    def is_runner(self) -> bool:
+        return self._lock_file is not None
+
+    def _read_job(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(settings.ingestion_jobs_path, name), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None  # Pruned in the meantime
+        except Exception as e:
+            print(f"Error loading ingestion job {name}: {e}")
+            return None
+
+    def _read_jobs(self) -> List[Dict[str, Any]]:
+        jobs = []
+        for name in sorted(os.listdir(settings.ingestion_jobs_path)):
+            if name.endswith(".json"):
+                job = self._read_job(name)
+                if job is not None:
+                    jobs.append(job)
+        return jobs
+
+    def _try_lock(self) -> bool:
+        """Become the job runner unless another worker already is; the lock goes with the process"""
+        f = open(os.path.join(settings.ingestion_jobs_path, "runner.lock"), 'a')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f
+        return True
+
+    def _persist(self, job: Dict[str, Any], force: bool = True):
+        """Write a job to disk so it survives restarts (progress updates are throttled)"""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_persisted.get(job["job_id"], 0) < 1.0:
+                return
+            self._last_persisted[job["job_id"]] = now
+            job["updated_at"] = now
+            temp_file = f"{self._job_file(job['job_id'])}.tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(job, f)
+            os.replace(temp_file, self._job_file(job["job_id"]))
+
+    def _point_to(self, job: Dict[str, Any]):
+        """Make a job the one find_by_document returns for its document"""
+        temp_file = f"{self._pointer_file(job['doc_id'])}.{job['job_id']}.tmp"
+        with open(temp_file, 'w') as f:
+            f.write(job["job_id"])
+        os.replace(temp_file, self._pointer_file(job["doc_id"]))
+
+    def _load_jobs(self) -> List[str]:
+        """Load persisted jobs and return the ids of those that still need to run"""
+        pending = []
+        latest: Dict[str, Dict[str, Any]] = {}
+        for job in self._read_jobs():
+            self.jobs[job["job_id"]] = job
+            if job["doc_id"] not in latest or job["created_at"] > latest[job["doc_id"]]["created_at"]:
+                latest[job["doc_id"]] = job
+            if job["status"] in ("queued", "running"):
+                if os.path.exists(job["file_path"]):
+                    # Interrupted jobs start over from parsing
+                    job.update({"status": "queued", "stage": "queued", "progress": None})
+                    pending.append(job["job_id"])
+                else:
+                    job.update({"status": "failed", "stage": "failed", "error": "Uploaded file is no longer available"})
+                self._persist(job)
+        for job in latest.values():
+            if not os.path.exists(self._pointer_file(job["doc_id"])):
+                self._point_to(job)  # Jobs persisted before documents had pointers
+        pending.sort(key=lambda job_id: self.jobs[job_id]["created_at"])
+        return pending
+
+    async def start(self, get_document_processor: Callable[[], Any]):
+        """Start watching for jobs; the processor is only loaded once a job runs
+
+        Only the worker that takes the ingestion lock resumes unfinished jobs and runs new ones.
+        The others keep trying, so one of them takes over if that worker exits.
+        """
+        if self._queue is not None:
+            return
+        self._get_document_processor = get_document_processor
+        os.makedirs(settings.ingestion_jobs_path, exist_ok=True)
+        os.makedirs(settings.temp_uploads_path, exist_ok=True)
+        self._queue = asyncio.Queue()
+        self._poller = asyncio.create_task(self._poll())
+
+    def _become_runner(self):
+        for job_id in self._load_jobs():
+            print(f"Resuming ingestion job {job_id} ({self.jobs[job_id]['filename']})")
+            self._queue.put_nowait(job_id)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(settings.ingestion_workers)]
+
+    async def _poll(self):
+        """Take over as job runner when possible; as runner, pick up jobs and cancellations from other workers"""
+        while True:
+            try:
+                if not self.is_runner and await asyncio.to_thread(self._try_lock):
+                    self._become_runner()
+                if self.is_runner:
+                    for job in await asyncio.to_thread(self._read_jobs):
+                        if job["job_id"] not in self.jobs and job["status"] == "queued":
+                            # Uploaded through another worker
+                            self.jobs[job["job_id"]] = job
+                            await self._queue.put(job["job_id"])
+                    for job_id in list(self.jobs):
+                        if os.path.exists(self._cancel_file(job_id)):
+                            self.cancel(job_id)
+                            os.remove(self._cancel_file(job_id))
+                    await asyncio.to_thread(self._prune)
+            except Exception as e:
+                print(f"Error polling ingestion jobs: {e}")
+            await asyncio.sleep(settings.ingestion_poll_seconds)
+
+    def _prune(self):
+        """Forget finished, failed and cancelled jobs once they are older than the job TTL"""
+        cutoff = time.time() - settings.ingestion_job_ttl_seconds
+        for job_id, job in list(self.jobs.items()):
+            if job["status"] in ("done", "failed", "cancelled") and job.get("updated_at", job["created_at"]) < cutoff:
+                for path in (self._job_file(job_id), self._cancel_file(job_id), job["file_path"]):
+                    if os.path.exists(path):
+                        os.remove(path)
+                if self._read_pointer(job["doc_id"]) == job_id:
+                    os.remove(self._pointer_file(job["doc_id"]))
+                self.jobs.pop(job_id, None)
+                self._last_persisted.pop(job_id, None)
+
+    async def stop(self):
+        self._stopping = True
+        tasks = self._workers + ([self._poller] if self._poller else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._poller = None
+        self._queue = None
+        if self._lock_file is not None:
+            self._lock_file.close()  # Lets another worker take over
+            self._lock_file = None
+        self._stopping = False
+
+    async def submit(self, spooled_path: str, filename: str, doc_id: Optional[str] = None) -> Dict[str, Any]:
+        """Queue an upload already spooled to disk; the job takes over the file
+
+        With a doc_id the upload is a new version of that document and replaces it in place.
+        """
+        job_id = str(uuid.uuid4())
+        file_path = os.path.join(settings.temp_uploads_path, f"{job_id}.pdf")
+        os.replace(spooled_path, file_path)
+
+        job = {
+            "job_id": job_id,
+            "doc_id": doc_id or str(uuid.uuid4()),
+            "mode": "update" if doc_id else "create",
+            "filename": filename,
+            "file_path": file_path,
+            "status": "queued",
+            "stage": "queued",
+            "progress": None,
+            "error": None,
+            "created_at": time.time(),
+        }
+        self._persist(job)
+        self._point_to(job)
+        if self.is_runner:
+            self.jobs[job_id] = job
+            await self._queue.put(job_id)
+        # Otherwise the job runner picks it up from disk on its next poll
+        return job
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job as its runner last saw it, whichever worker that is"""
+        if job_id in self.jobs:
+            return self.jobs[job_id]
+        return self._read_job(f"{job_id}.json")
+
+    def _read_pointer(self, doc_id: str) -> Optional[str]:
+        if os.path.basename(doc_id) != doc_id:
+            return None  # Not a document id, and must not name a path outside the jobs directory
+        try:
+            with open(self._pointer_file(doc_id), 'r') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def find_by_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """The most recent job for a document, which may be an update of it
+
+        Reads the document's pointer file and that one job, so polling stays cheap however many jobs are kept.
+        """
+        job_id = self._read_pointer(doc_id)
+        if job_id is None:
+            return None
+        # This worker's own copy of a job it runs is fresher than the throttled one on disk
+        return self.get_job(job_id)
+
+    @staticmethod
+    def describe(job: Dict[str, Any]) -> str:
+        """Human readable stage, e.g. 'embedding batch 3/8'"""
+        progress = job.get("progress")
+        if job["stage"] == "parsing" and progress:
+            return f"parsing page {progress['current']}/{progress['total']}"
+        if job["stage"] == "embedding" and progress:
+            return f"embedding batch {progress['current']}/{progress['total']}"
+        if job["stage"] == "failed" and job.get("error"):
+            return f"failed: {job['error']}"
+        return job["stage"]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; finished jobs cannot be cancelled"""
+        if job_id not in self.jobs:
+            # Run by another worker (or not picked up yet): leave it a note to act on
+            job = self.get_job(job_id)
+            if not job or job["status"] not in ("queued", "running"):
+                return False
+            with open(self._cancel_file(job_id), 'w'):
+                pass
+            return True
+        job = self.jobs[job_id]
+        if job["status"] not in ("queued", "running"):
+            return False
+        job.update({"status": "cancelled", "stage": "cancelled", "progress": None})
+        self._persist(job)
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        elif os.path.exists(job["file_path"]):
+            # Never started, so the spooled upload can go right away
+            os.remove(job["file_path"])
+        return True
+
+    def _progress_callback(self, job: Dict[str, Any]):
+        """Progress reporter handed to the processor; it also stops cancelled jobs"""
+        def report(stage: str, current: int = 0, total: int = 0):
+            if job["status"] == "cancelled":
+                raise IngestionCancelled()
+            stage_changed = job["stage"] != stage
+            job["stage"] = stage
+            job["progress"] = {"current": current, "total": total} if total else None
+            self._persist(job, force=stage_changed or current == total)
+        return report
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self.jobs.get(job_id)
+                if job and job["status"] == "queued":
+                    task = asyncio.create_task(self._run(job))
+                    self._running[job_id] = task
+                    try:
+                        await task
+                    finally:
+                        self._running.pop(job_id, None)
+            finally:
+                self._queue.task_done()
+
+    async def _processor(self):
+        if self.document_processor is None:
+            # The first job pays for importing the processing stack, off the event loop
+            self.document_processor = await asyncio.to_thread(self._get_document_processor)
+        return self.document_processor
+
+    async def _run(self, job: Dict[str, Any]):
+        job.update({"status": "running", "stage": "parsing", "progress": None, "error": None})
+        self._persist(job)
+        try:
+            document_processor = await self._processor()
+            # The parser maps the spooled file instead of reading it into memory
+            if job.get("mode") == "update":
+                job["result"] = await document_processor.update_document(
+                    job["doc_id"],
+                    None,
+                    job["filename"],
+                    progress=self._progress_callback(job),
+                    file_path=job["file_path"]
+                )
+            else:
+                await document_processor.process_document(
+                    None,
+                    job["filename"],
+                    doc_id=job["doc_id"],
+                    progress=self._progress_callback(job),
+                    file_path=job["file_path"]
+                )
+            job.update({"status": "done", "stage": "done", "progress": None})
+        except (asyncio.CancelledError, IngestionCancelled):
+            if self._stopping:
+                # Shutting down: leave the job to be resumed on the next start
+                job.update({"status": "queued", "stage": "queued", "progress": None})
+                self._persist(job)
+                raise
+            job.update({"status": "cancelled", "stage": "cancelled", "progress": None})
+            if job.get("mode") != "update":
+                # A cancelled update leaves the document in place, whichever version it last swapped in
+                await self._discard_partial_document(job)
+        except Exception as e:
+            print(f"Ingestion job {job['job_id']} failed: {e}")
+            errors.labels(source="ingestion").inc()
+            job.update({"status": "failed", "stage": "failed", "error": str(e)})
+        self._persist(job)
+        if job["status"] in ("done", "cancelled") and os.path.exists(job["file_path"]):
+            os.remove(job["file_path"])
+
+    async def _discard_partial_document(self, job: Dict[str, Any]):
+        """Remove anything a cancelled job already wrote"""
+        try:
+            await (await self._processor()).delete_document(job["doc_id"])
+        except Exception:
+            pass  # Nothing was written yet
+
+
+# Global ingestion queue instance
+ingestion_queue = IngestionQueue()
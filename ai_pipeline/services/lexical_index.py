@@ -0,0 +1,177 @@
+import os
+import re
+import json
+import uuid
+import math
+import heapq
+import threading
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from config.settings import settings
+from services.store_versions import current_version
+
+LEXICAL_INDEX_FILE = "lexical.json"
+
+# Question words carry no signal for BM25 and would otherwise dominate short queries
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or the to was what when where which who why will with you your".split()
+)
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-/.][a-z0-9]+)*")
+_THOUSANDS_SEPARATOR = re.compile(r"(?<=\d),(?=\d{3}\b)")
+
+
+def _compound_tokens(text: str) -> List[str]:
+    """Lowercased tokens that keep identifiers such as cs-101, 2024/25 or 12.5 together"""
+    text = _THOUSANDS_SEPARATOR.sub("", text.lower())
+    return [token for token in _TOKEN_PATTERN.findall(text) if token not in _STOPWORDS]
+
+
+def tokenize(text: str) -> List[str]:
+    """Index terms: compound identifiers plus their parts, so 'CS-101' also matches 'CS 101'"""
+    terms = []
+    for token in _compound_tokens(text):
+        terms.append(token)
+        parts = re.split(r"[-/.]", token)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part and part not in _STOPWORDS)
+    return terms
+
+
+def is_identifier_query(query: str) -> bool:
+    """True for short lookups of an exact code, form number, date or amount"""
+    tokens = _compound_tokens(query)
+    return 0 < len(tokens) <= 2 and any(any(ch.isdigit() for ch in token) for token in tokens)
+
+
+class LexicalIndex:
+    """Inverted index of one document's chunks: term -> [[chunk number, term frequency], ...]"""
+
+    def __init__(self):
+        self.sources: List[str] = []  # Chunk "source" metadata, e.g. "3-0", by chunk number
+        self.lengths: List[int] = []
+        self.postings: Dict[str, List[List[int]]] = {}
+
+    def add(self, document: Document):
+        chunk_number = len(self.sources)
+        terms = tokenize(document.page_content)
+        for term, count in Counter(terms).items():
+            self.postings.setdefault(term, []).append([chunk_number, count])
+        self.sources.append(document.metadata.get("source", str(chunk_number)))
+        self.lengths.append(len(terms))
+
+    @classmethod
+    def from_documents(cls, documents: List[Document]) -> "LexicalIndex":
+        index = cls()
+        for document in documents:
+            index.add(document)
+        return index
+
+    def save(self, directory: str):
+        path = os.path.join(directory, LEXICAL_INDEX_FILE)
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"  # Unique, so concurrent writers never share a temp file
+        with open(temp_path, 'w') as f:
+            json.dump({"sources": self.sources, "lengths": self.lengths, "postings": self.postings}, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["LexicalIndex"]:
+        path = os.path.join(directory, LEXICAL_INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            data = json.load(f)
+        index = cls()
+        index.sources, index.lengths, index.postings = data["sources"], data["lengths"], data["postings"]
+        return index
+
+
+def bm25_search(indexes: List[Tuple[str, LexicalIndex]], query: str, k: int, k1: float = 1.5, b: float = 0.75) -> List[Tuple[float, str, str]]:
+    """Okapi BM25 over the union of several documents' chunks; returns (score, doc_id, source), best first"""
+    terms = set(tokenize(query))
+    total_chunks = sum(len(index.sources) for _, index in indexes)
+    if not terms or not total_chunks:
+        return []
+    average_length = (sum(sum(index.lengths) for _, index in indexes) / total_chunks) or 1.0
+
+    scores: Dict[Tuple[str, int], float] = {}
+    for term in terms:
+        document_frequency = sum(len(index.postings.get(term, ())) for _, index in indexes)
+        if not document_frequency:
+            continue
+        idf = math.log(1 + (total_chunks - document_frequency + 0.5) / (document_frequency + 0.5))
+        for doc_id, index in indexes:
+            for chunk_number, frequency in index.postings.get(term, ()):
+                length_norm = 1 - b + b * index.lengths[chunk_number] / average_length
+                score = idf * frequency * (k1 + 1) / (frequency + k1 * length_norm)
+                scores[(doc_id, chunk_number)] = scores.get((doc_id, chunk_number), 0.0) + score
+
+    sources = {doc_id: index.sources for doc_id, index in indexes}
+    best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+    return [(score, doc_id, sources[doc_id][chunk_number]) for (doc_id, chunk_number), score in best]
+
+
+class LexicalIndexStore:
+    """Small LRU of loaded per-document lexical indexes"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries if max_entries is not None else settings.lexical_index_cache_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, doc_id: str, build: Optional[Callable[[], List[Document]]] = None) -> Optional[LexicalIndex]:
+        """Load a document's index, building it from its stored chunks if it predates lexical indexing
+
+        A built index is kept only if the document still points at the version it was built from.
+        """
+        directory = os.path.join(settings.vector_store_path, doc_id)
+        version = current_version(directory)
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            # An entry loaded before another worker swapped in a new version is stale
+            if entry is not None and entry[1] == version:
+                self._entries.move_to_end(doc_id)
+                return entry[0]
+
+        # Read from the resolved version, so a swap in between cannot mix two versions
+        target = os.path.realpath(directory)
+        index = LexicalIndex.load(target)
+        if index is None and build is not None and os.path.isdir(target):
+            documents = build()
+            if documents:
+                index = LexicalIndex.from_documents(documents)
+                self._save_built(index, directory, target, version)
+        if index is None:
+            return None
+
+        with self._lock:
+            self._entries[doc_id] = (index, version)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
+
+    @staticmethod
+    def _save_built(index: LexicalIndex, directory: str, target: str, version: Optional[str]):
+        """Store an index built for an older store next to its chunks, unless that version is no longer current
+
+        New versions get their lexical index before they are published. This only covers stores
+        written before lexical indexing. The index is saved into the resolved version directory
+        and never through the link.
+        """
+        if current_version(directory) != version:
+            return  # Replaced meanwhile; the new version has its own index
+        try:
+            index.save(target)
+        except OSError as e:
+            # Pruned meanwhile, or another worker is writing the same file; the next miss builds it again
+            print(f"Could not save lexical index to {target}: {e}")
+
+    def invalidate(self, doc_id: str):
+        with self._lock:
+            self._entries.pop(doc_id, None)
+
+
+# Global lexical index store instance
+lexical_index_store = LexicalIndexStore()
@@ -0,0 +1,242 @@
+import os
+import json
+import mmap
+import pickle
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from config.settings import settings
+
+INDEX_FILE = "index.faiss"
+CHUNK_DATA_FILE = "chunks.bin"
+CHUNK_INDEX_FILE = "chunks.idx"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+
+# Zero-copy mapping of the index file where FAISS supports it; older releases copy flat codes into RAM
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+# Index types that keep vectors as embedded, so their search distances are exact
+_EXACT_INDEXES = (faiss.IndexFlat, faiss.IndexHNSWFlat, faiss.IndexIVFFlat)
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """The index that holds the vectors, below any PCA projection in front of it"""
+    if isinstance(index, faiss.IndexPreTransform):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def _open_chunks(directory: str) -> Tuple[np.ndarray, Optional[mmap.mmap]]:
+    """Memory-map a store's chunk offsets and chunk records"""
+    chunk_index = np.load(os.path.join(directory, CHUNK_INDEX_FILE), mmap_mode="r", allow_pickle=False)
+    chunk_data = None
+    with open(os.path.join(directory, CHUNK_DATA_FILE), 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            chunk_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return chunk_index, chunk_data
+
+
+def _decode(chunk_data: mmap.mmap, start: int, end: int) -> Document:
+    record = json.loads(chunk_data[int(start):int(end)])
+    return Document(page_content=record["text"], metadata=record["metadata"])
+
+
+def read_documents(directory: str) -> List[Document]:
+    """Every chunk of a store in index order, without loading its index"""
+    chunk_index, chunk_data = _open_chunks(directory)
+    return [_decode(chunk_data, start, end) for start, end, _ in chunk_index]
+
+
+def is_mapped_store(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, CHUNK_INDEX_FILE)) and os.path.exists(os.path.join(directory, INDEX_FILE))
+
+
+def is_pickle_store(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, LEGACY_DOCSTORE_FILE)) and os.path.exists(os.path.join(directory, INDEX_FILE))
+
+
+class MappedVectorStore:
+    """One document's chunks: a memory-mapped FAISS index plus an offset-indexed chunk file read only for hits
+
+    Position i in the index is record i of chunks.bin; chunks.idx holds each record's byte range and source id.
+    """
+
+    def __init__(self, directory: str, index: faiss.Index, chunk_index: np.ndarray, chunk_data: Optional[mmap.mmap]):
+        self.directory = directory
+        self.index = index
+        self._chunk_index = chunk_index
+        self._chunk_data = chunk_data
+        self._positions: Optional[Dict[str, int]] = None
+        self._projection = None
+        self._stored_residual = 0.0
+        self._quantized = not isinstance(index, (faiss.IndexPreTransform,) + _EXACT_INDEXES)
+        if isinstance(index, faiss.IndexPreTransform):
+            self._projection = faiss.downcast_VectorTransform(index.chain.at(0))
+            # Expected squared length a chunk lost to the projection: the dropped share of the variance of unit vectors
+            mean = faiss.vector_to_array(self._projection.mean)
+            eigenvalues = faiss.vector_to_array(self._projection.eigenvalues)
+            if eigenvalues.sum() > 0:
+                dropped = eigenvalues[self._projection.d_out:].sum() / eigenvalues.sum()
+                self._stored_residual = float(max(0.0, 1.0 - mean @ mean) * dropped)
+
+    @classmethod
+    def load(cls, directory: str) -> "MappedVectorStore":
+        # Resolve the document's version link once, so every file comes from the same version
+        directory = os.path.realpath(directory)
+        index = faiss.read_index(os.path.join(directory, INDEX_FILE), _MMAP_FLAGS)
+        # Search breadth follows the current settings rather than whatever the index was written with
+        inner = base_index(index)
+        if isinstance(inner, faiss.IndexIVF):
+            inner.nprobe = settings.vector_index_nprobe
+        elif isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = settings.vector_index_ef_search
+        chunk_index, chunk_data = _open_chunks(directory)
+        return cls(directory, index, chunk_index, chunk_data)
+
+    @staticmethod
+    def write(directory: str, documents: List[Document], index: faiss.Index):
+        """Write the index and chunk files, one at a time
+
+        Only write into a directory no reader can see yet, such as a new document version, or
+        while the service is stopped: a concurrent load could pair old and new files.
+        """
+        if index.ntotal != len(documents):
+            raise Exception(f"Index holds {index.ntotal} vectors for {len(documents)} chunks")
+        os.makedirs(directory, exist_ok=True)
+        records = [
+            json.dumps({"text": document.page_content, "metadata": document.metadata}, separators=(",", ":")).encode("utf-8")
+            for document in documents
+        ]
+        sources = [str(document.metadata.get("source", position)).encode("utf-8") for position, document in enumerate(documents)]
+        chunk_index = np.zeros(len(records), dtype=[("start", "<u8"), ("end", "<u8"), ("source", f"S{max([len(s) for s in sources] + [1])}")])
+        offset = 0
+        for position, record in enumerate(records):
+            chunk_index[position] = (offset, offset + len(record), sources[position])
+            offset += len(record)
+
+        def replace(name: str, write_temp):
+            path = os.path.join(directory, name)
+            write_temp(f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+
+        def write_data(path: str):
+            with open(path, 'wb') as f:
+                for record in records:
+                    f.write(record)
+
+        def write_chunk_index(path: str):
+            with open(path, 'wb') as f:
+                np.save(f, chunk_index, allow_pickle=False)
+
+        replace(CHUNK_DATA_FILE, write_data)
+        replace(INDEX_FILE, lambda path: faiss.write_index(index, path))
+        replace(CHUNK_INDEX_FILE, write_chunk_index)
+
+    def __len__(self) -> int:
+        return len(self._chunk_index)
+
+    def document(self, position: int) -> Document:
+        """Materialize one chunk's text and metadata"""
+        start, end, _ = self._chunk_index[position]
+        return _decode(self._chunk_data, start, end)
+
+    def documents(self, sources: Optional[List[str]] = None) -> List[Document]:
+        """All chunks in index order, or only those with the given source ids"""
+        if sources is None:
+            return [self.document(position) for position in range(len(self))]
+        source_positions = self._source_positions()
+        positions = sorted(source_positions[source] for source in set(sources) if source in source_positions)
+        return [self.document(position) for position in positions]
+
+    def _source_positions(self) -> Dict[str, int]:
+        if self._positions is None:
+            self._positions = {source.decode("utf-8"): position for position, source in enumerate(self._chunk_index["source"])}
+        return self._positions
+
+    def vectors(self, sources: List[str]) -> Dict[str, List[float]]:
+        """Embedded vectors of the chunks with these source ids, by source id
+
+        Empty when the index keeps its vectors quantized or projected, since those cannot be recovered exactly.
+        """
+        if not isinstance(self.index, (faiss.IndexFlat, faiss.IndexHNSWFlat)):
+            return {}
+        source_positions = self._source_positions()
+        return {
+            source: self.index.reconstruct(source_positions[source]).tolist()
+            for source in set(sources) if source in source_positions
+        }
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, **kwargs) -> List[Tuple[Document, float]]:
+        """Nearest chunks with their squared L2 distances, like the LangChain FAISS store"""
+        if not len(self):
+            return []
+        vector = np.asarray([embedding], dtype=np.float32)
+        if vector.shape[1] != self.index.d:
+            raise Exception(
+                f"Query vector has {vector.shape[1]} dimensions but {self.directory} holds {self.index.d}; "
+                "re-embed it with reembed_vector_stores.py"
+            )
+        if self._quantized:
+            hits = self._search_quantized(vector, min(k, self.index.ntotal))
+        else:
+            distances, positions = self.index.search(vector, min(k, self.index.ntotal))
+            residual = self._projection_residual(vector)
+            hits = [(float(distance) + residual, int(position)) for distance, position in zip(distances[0], positions[0]) if position != -1]
+        return [(self.document(position), distance) for distance, position in hits]
+
+    def _search_quantized(self, vector: np.ndarray, k: int) -> List[Tuple[float, int]]:
+        """Hits of an SQ8 or PQ index scored by cosine with their decoded vectors, as (2 - 2 * cosine, position)
+
+        Quantization also changes the length of the stored vectors, which skews their squared
+        distances. Normalizing the decoded vectors removes that part of the error. The result
+        stays on the squared L2 scale of unit vectors, so it merges with exact stores.
+        """
+        distances, positions, decoded = self.index.search_and_reconstruct(vector, k)
+        found = positions[0] != -1
+        decoded = decoded[0][found]
+        norms = np.maximum(np.linalg.norm(decoded, axis=1), 1e-12) * max(float(np.linalg.norm(vector[0])), 1e-12)
+        cosine = decoded @ vector[0] / norms
+        return sorted((float(2.0 - 2.0 * similarity), int(position)) for similarity, position in zip(cosine, positions[0][found]))
+
+    def _projection_residual(self, vector: np.ndarray) -> float:
+        """Squared distance a PCA projection hides: the query's dropped part plus the chunks' expected one
+
+        Adding it back keeps distances comparable with other stores, projected or not.
+        """
+        if self._projection is None:
+            return 0.0
+        centred = vector[0] - faiss.vector_to_array(self._projection.mean)
+        projected = self._projection.apply(vector)
+        return max(0.0, float(centred @ centred) - float((projected * projected).sum())) + self._stored_residual
+
+
+def read_pickle_store(directory: str) -> Tuple[faiss.Index, List[Document]]:
+    """Index and chunks of a LangChain FAISS store (index.faiss + pickled docstore), in index order
+
+    This is the only place a pickled docstore is still read, so only read stores this service wrote itself.
+    """
+    with open(os.path.join(directory, LEGACY_DOCSTORE_FILE), 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    index = faiss.read_index(os.path.join(directory, INDEX_FILE))
+    return index, [docstore.search(index_to_docstore_id[position]) for position in range(index.ntotal)]
+
+
+def convert_pickle_store(directory: str) -> int:
+    """Rewrite a pickle store in the mapped format in place; returns its chunk count
+
+    The files are replaced one by one, so this only runs from convert_vector_stores.py while the service is stopped.
+    """
+    index, documents = read_pickle_store(directory)
+    MappedVectorStore.write(directory, documents, index)
+    os.remove(os.path.join(directory, LEGACY_DOCSTORE_FILE))
+    return len(documents)
+
+
+def open_store(directory: str) -> MappedVectorStore:
+    """Load a per-document store; stores still in the pickle format have to be converted offline first"""
+    if not is_mapped_store(directory) and is_pickle_store(directory):
+        raise Exception(f"{directory} is still in the pickle format; convert it with convert_vector_stores.py")
+    return MappedVectorStore.load(directory)
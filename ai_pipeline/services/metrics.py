@@ -0,0 +1,83 @@
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Seconds; spans a cached lookup up to a slow completion or a large parse
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# With several uvicorn workers, point PROMETHEUS_MULTIPROC_DIR at an empty directory before the
+# server starts. Every worker then writes its samples there and any worker's /metrics reports the
+# sum. Without it each worker reports only its own requests.
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def render() -> bytes:
+    """All metrics in the Prometheus text format, summed over every worker in multiprocess mode"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead():
+    """Drop this worker's live gauges from the shared samples when it exits"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests, errors and in-flight requests, timed until the body is fully sent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            # Route templates keep document ids out of the label values
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            http_request_seconds.labels(method=scope["method"], path=path).observe(time.perf_counter() - started)
+            http_requests.labels(method=scope["method"], path=path, status=str(status["code"])).inc()
+            if status["code"] >= 500:
+                errors.labels(source="http").inc()
+
+
+# Pipeline stage latencies
+ingestion_stage_seconds = Histogram(
+    "ai_pipeline_ingestion_stage_seconds", "Time spent in each document ingestion stage", ["stage"], buckets=DEFAULT_BUCKETS
+)
+chat_stage_seconds = Histogram(
+    "ai_pipeline_chat_stage_seconds", "Time spent in each stage of answering a chat query", ["stage"], buckets=DEFAULT_BUCKETS
+)
+
+# Requests and errors
+http_requests = Counter("ai_pipeline_http_requests", "HTTP requests by route and status", ["method", "path", "status"])
+http_request_seconds = Histogram(
+    "ai_pipeline_http_request_seconds", "HTTP request latency until the response body is sent", ["method", "path"], buckets=DEFAULT_BUCKETS
+)
+http_requests_in_flight = Gauge(
+    "ai_pipeline_http_requests_in_flight", "HTTP requests currently being served", multiprocess_mode="livesum"
+)
+errors = Counter("ai_pipeline_errors", "Failures by where they surfaced: http, chat or ingestion", ["source"])
+
+# Cache effectiveness: vector_store, embedding, query_embedding, response and response_semantic
+cache_hits = Counter("ai_pipeline_cache_hits", "Cache lookups answered from the cache", ["cache"])
+cache_misses = Counter("ai_pipeline_cache_misses", "Cache lookups that fell through to the slow path", ["cache"])
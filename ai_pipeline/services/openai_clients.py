@@ -0,0 +1,111 @@
+import asyncio
+from typing import TYPE_CHECKING, Optional
+
+import httpx
+
+from config.settings import settings
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+    from langchain_openai import OpenAIEmbeddings
+
+
+class OpenAIClients:
+    """Shared OpenAI clients backed by pooled HTTP connections"""
+
+    def __init__(self):
+        self._http_client: Optional[httpx.Client] = None
+        self._async_http_client: Optional[httpx.AsyncClient] = None
+        self._chat: Optional["AsyncOpenAI"] = None
+        self._embeddings: Optional["OpenAIEmbeddings"] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def api_key_available(self) -> bool:
+        return bool(settings.openai_api_key) and settings.openai_api_key != "your_openai_api_key_here"
+
+    @property
+    def embedding_dimensions(self) -> Optional[int]:
+        """Width requested from the embeddings API, or None for the model's own"""
+        if settings.embedding_reduction == "provider" and settings.embedding_dimensions > 0:
+            return settings.embedding_dimensions
+        return None
+
+    @property
+    def embedding_space(self) -> str:
+        """Names the vectors the embeddings API returns; cached vectors are only reused within one space"""
+        if self.embedding_dimensions:
+            return f"{settings.embedding_model}@{self.embedding_dimensions}"
+        return settings.embedding_model
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(settings.openai_timeout_seconds, connect=settings.openai_connect_timeout_seconds)
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.openai_max_connections,
+            max_keepalive_connections=settings.openai_max_connections
+        )
+
+    @property
+    def http_client(self) -> httpx.Client:
+        """Pooled client for the blocking calls that run in worker threads"""
+        if self._http_client is None:
+            self._http_client = httpx.Client(timeout=self._timeout(), limits=self._limits())
+        return self._http_client
+
+    @property
+    def async_http_client(self) -> httpx.AsyncClient:
+        if self._async_http_client is None:
+            self._async_http_client = httpx.AsyncClient(timeout=self._timeout(), limits=self._limits())
+        return self._async_http_client
+
+    @property
+    def chat(self) -> "AsyncOpenAI":
+        if self._chat is None:
+            # The SDKs are imported on first use to keep service startup fast
+            from openai import AsyncOpenAI
+            self._chat = AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                base_url=settings.openai_base_url,
+                http_client=self.async_http_client,
+                max_retries=settings.openai_max_retries
+            )
+        return self._chat
+
+    @property
+    def embeddings(self) -> "OpenAIEmbeddings":
+        """Embeddings client shared by every service, with sync and async transports"""
+        if self._embeddings is None:
+            from langchain_openai import OpenAIEmbeddings
+            self._embeddings = OpenAIEmbeddings(
+                openai_api_key=settings.openai_api_key,
+                openai_api_base=settings.openai_base_url,
+                model=settings.embedding_model,
+                dimensions=self.embedding_dimensions,
+                http_client=self.http_client,
+                http_async_client=self.async_http_client,
+                max_retries=settings.openai_max_retries
+            )
+        return self._embeddings
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Caps the number of in-flight completion requests"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.openai_max_concurrency)
+        return self._semaphore
+
+    async def aclose(self):
+        if self._async_http_client is not None:
+            await self._async_http_client.aclose()
+            self._async_http_client = None
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
+        self._chat = None
+        self._embeddings = None
+
+
+# Global client instance
+openai_clients = OpenAIClients()
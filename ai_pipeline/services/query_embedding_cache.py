@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from config.settings import settings
+from services.metrics import cache_hits, cache_misses
+from services.openai_clients import openai_clients
+
+# Embedding usage of the request being served; set per request by the chat service
+_request_usage: ContextVar[Optional[Dict[str, int]]] = ContextVar("query_embedding_usage", default=None)
+
+
+class QueryEmbeddingCache:
+    """Small LRU of query vectors, so a question is embedded once however many stores it is searched in"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries if max_entries is not None else settings.query_embedding_cache_size
+        self._entries = OrderedDict()  # (model, query) -> vector
+        self._lock = threading.Lock()
+        self._pending: Dict[Any, asyncio.Future] = {}  # (model, query) -> embedding call in flight
+        self.hits = 0
+        self.misses = 0
+        self.searches = 0
+
+    def track_request(self) -> Dict[str, int]:
+        """Start counting query vector uses and embedding API calls for the current request"""
+        usage = {"searches": 0, "embedding_calls": 0}
+        _request_usage.set(usage)
+        return usage
+
+    def count_searches(self, searches: int):
+        """Record searches that used the query vector; each of them used to embed the query itself"""
+        usage = _request_usage.get()
+        if usage is not None:
+            usage["searches"] += searches
+        self.searches += searches
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """The text that is both embedded and used as the key; case is kept, since the model sees it"""
+        return " ".join(query.split())
+
+    async def embed(self, query: str, embeddings) -> List[float]:
+        """Vector of the normalized query; concurrent requests for the same query share one embedding call"""
+        text = self.normalize(query)
+        key = (openai_clients.embedding_space, text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                cache_hits.labels(cache="query_embedding").inc()
+                return vector
+            pending = self._pending.get(key)
+            if pending is not None:
+                # Already being embedded for another request
+                self.hits += 1
+                cache_hits.labels(cache="query_embedding").inc()
+            else:
+                self.misses += 1
+                cache_misses.labels(cache="query_embedding").inc()
+                pending = asyncio.ensure_future(self._fetch(key, text, embeddings))
+                self._pending[key] = pending
+                usage = _request_usage.get()
+                if usage is not None:
+                    usage["embedding_calls"] += 1
+        # Shielded, so one caller giving up does not cancel the call the others wait on
+        return await asyncio.shield(pending)
+
+    async def _fetch(self, key, text: str, embeddings) -> List[float]:
+        try:
+            vector = await embeddings.aembed_query(text)
+            with self._lock:
+                self._entries[key] = vector
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return vector
+        finally:
+            # A failed call is not remembered; the next request tries again
+            with self._lock:
+                self._pending.pop(key, None)
+
+    @staticmethod
+    def report(usage: Dict[str, int]) -> Dict[str, int]:
+        """Per-request summary returned alongside the answer"""
+        saved = max(0, usage["searches"] - usage["embedding_calls"])
+        return {"searches": usage["searches"], "embedding_calls": usage["embedding_calls"], "embedding_calls_saved": saved}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "searches": self.searches,
+                "embedding_calls_saved": max(0, self.searches - self.misses),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Global query embedding cache instance
+query_embedding_cache = QueryEmbeddingCache()
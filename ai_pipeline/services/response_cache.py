@@ -0,0 +1,374 @@
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from config.settings import settings
+from services.metrics import cache_hits, cache_misses
+from utils.pdf_utils import calculate_file_hash
+
+
+def normalize_vector(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+def document_set(document_ids: Iterable[str]) -> str:
+    """Order-independent identity of the documents an answer was drawn from"""
+    return "\n".join(sorted(set(document_ids)))
+
+
+def best_match(candidates, vector: np.ndarray, threshold: float) -> Optional[str]:
+    """Key of the (key, vector bytes) candidate most similar to vector, if any reaches the threshold"""
+    best_key, best_score = None, threshold
+    for key, blob in candidates:
+        if len(blob) != vector.nbytes:
+            continue  # Stored before the embedding width changed
+        score = float(np.dot(np.frombuffer(blob, dtype=np.float32), vector))
+        if score >= best_score:
+            best_key, best_score = key, score
+    return best_key
+
+
+class ResponseCacheBackend(ABC):
+    """Storage behind the response cache; every method is blocking and is called off the event loop"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def find_similar(self, doc_set: str, vector: np.ndarray, threshold: float) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def put(self, key: str, value: Any, doc_set: str, vector: Optional[np.ndarray], ttl_seconds: float):
+        ...
+
+    @abstractmethod
+    def invalidate_document(self, doc_id: str) -> int:
+        ...
+
+    def count(self) -> Optional[int]:
+        """Number of stored entries, or None where the backend cannot tell cheaply"""
+        return None
+
+
+class MemoryResponseBackend(ResponseCacheBackend):
+    """Per-process LRU, for single-worker deployments"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, doc_set, vector bytes, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[3] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def find_similar(self, doc_set: str, vector: np.ndarray, threshold: float) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            candidates = [
+                (key, entry[2]) for key, entry in self._entries.items()
+                if entry[1] == doc_set and entry[2] is not None and entry[3] >= now
+            ]
+            key = best_match(candidates, vector, threshold)
+            if key is None:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key: str, value: Any, doc_set: str, vector: Optional[np.ndarray], ttl_seconds: float):
+        blob = vector.tobytes() if vector is not None else None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, doc_set, blob, time.time() + ttl_seconds)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_document(self, doc_id: str) -> int:
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if doc_id in entry[1].split("\n")]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def count(self) -> Optional[int]:
+        return len(self._entries)
+
+
+class SQLiteResponseBackend(ResponseCacheBackend):
+    """Cache file shared by every uvicorn worker on the host and kept across restarts"""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the cache database on first use (caller holds the lock)"""
+        if self._conn is None:
+            # Other workers write to the same file, so wait for their locks instead of failing
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, doc_set TEXT NOT NULL, vector BLOB, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_doc_set ON responses (doc_set)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS response_documents (doc_id TEXT NOT NULL, key TEXT NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_response_documents_doc_id ON response_documents (doc_id)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value FROM responses WHERE key = ? AND expires_at >= ?", (key, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return json.loads(row[0])
+
+    def find_similar(self, doc_set: str, vector: np.ndarray, threshold: float) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            candidates = conn.execute(
+                "SELECT key, vector FROM responses WHERE doc_set = ? AND vector IS NOT NULL AND expires_at >= ?",
+                (doc_set, now)
+            ).fetchall()
+            key = best_match(candidates, vector, threshold)
+            if key is None:
+                return None
+            row = conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return json.loads(row[0]) if row else None
+
+    def put(self, key: str, value: Any, doc_set: str, vector: Optional[np.ndarray], ttl_seconds: float):
+        now = time.time()
+        blob = vector.tobytes() if vector is not None else None
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, doc_set, vector, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(value), doc_set, blob, now + ttl_seconds, now)
+            )
+            conn.execute("DELETE FROM response_documents WHERE key = ?", (key,))
+            if doc_set:
+                conn.executemany(
+                    "INSERT INTO response_documents (doc_id, key) VALUES (?, ?)",
+                    [(doc_id, key) for doc_id in doc_set.split("\n")]
+                )
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Drop expired entries, then the least recently used ones past the entry bound"""
+        conn.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+        excess = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                (excess,)
+            )
+        conn.execute("DELETE FROM response_documents WHERE key NOT IN (SELECT key FROM responses)")
+
+    def invalidate_document(self, doc_id: str) -> int:
+        with self._lock:
+            conn = self._connection()
+            removed = conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM response_documents WHERE doc_id = ?)",
+                (doc_id,)
+            ).rowcount
+            conn.execute("DELETE FROM response_documents WHERE key NOT IN (SELECT key FROM responses)")
+            conn.commit()
+            return removed
+
+    def count(self) -> Optional[int]:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class RedisResponseBackend(ResponseCacheBackend):
+    """Cache shared by workers on several hosts; size is bounded by the server's maxmemory policy"""
+
+    def __init__(self, url: str, prefix: str = "campusmitra:response"):
+        try:
+            import redis
+        except ImportError:
+            raise Exception("RESPONSE_CACHE_BACKEND=redis requires the redis package (pip install redis)")
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, kind: str, name: str) -> str:
+        return f"{self.prefix}:{kind}:{name}"
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._redis.get(self._key("entry", key))
+        return json.loads(value) if value is not None else None
+
+    def find_similar(self, doc_set: str, vector: np.ndarray, threshold: float) -> Optional[Any]:
+        set_key = self._key("set", calculate_file_hash(doc_set.encode("utf-8")))
+        keys = [key.decode("utf-8") for key in self._redis.smembers(set_key)]
+        if not keys:
+            return None
+        blobs = self._redis.mget([self._key("vector", key) for key in keys])
+        expired = [key for key, blob in zip(keys, blobs) if blob is None]
+        if expired:
+            self._redis.srem(set_key, *expired)
+        match = best_match([(key, blob) for key, blob in zip(keys, blobs) if blob is not None], vector, threshold)
+        return self.get(match) if match else None
+
+    def put(self, key: str, value: Any, doc_set: str, vector: Optional[np.ndarray], ttl_seconds: float):
+        ttl = max(1, int(ttl_seconds))
+        pipe = self._redis.pipeline()
+        pipe.set(self._key("entry", key), json.dumps(value), ex=ttl)
+        if vector is not None:
+            set_key = self._key("set", calculate_file_hash(doc_set.encode("utf-8")))
+            pipe.set(self._key("vector", key), vector.tobytes(), ex=ttl)
+            pipe.sadd(set_key, key)
+            pipe.expire(set_key, ttl)
+        for doc_id in filter(None, doc_set.split("\n")):
+            pipe.sadd(self._key("doc", doc_id), key)
+            pipe.expire(self._key("doc", doc_id), ttl)
+        pipe.execute()
+
+    def invalidate_document(self, doc_id: str) -> int:
+        doc_key = self._key("doc", doc_id)
+        keys = [key.decode("utf-8") for key in self._redis.smembers(doc_key)]
+        if keys:
+            self._redis.delete(*[self._key(kind, key) for key in keys for kind in ("entry", "vector")])
+        self._redis.delete(doc_key)
+        return len(keys)
+
+
+class ResponseCache:
+    """Chat answer cache with TTL, optional semantic matching and a pluggable shared backend"""
+
+    def __init__(self, backend: Optional[ResponseCacheBackend] = None, ttl_seconds: Optional[float] = None):
+        self._backend = backend
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.response_cache_ttl_seconds
+        self._backend_lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def backend(self) -> ResponseCacheBackend:
+        """Backend chosen by RESPONSE_CACHE_BACKEND, created on first use"""
+        with self._backend_lock:
+            if self._backend is None:
+                if settings.response_cache_backend == "redis":
+                    self._backend = RedisResponseBackend(settings.response_cache_redis_url)
+                elif settings.response_cache_backend == "memory":
+                    self._backend = MemoryResponseBackend(settings.response_cache_max_entries)
+                else:
+                    self._backend = SQLiteResponseBackend(settings.response_cache_path, settings.response_cache_max_entries)
+            return self._backend
+
+    @staticmethod
+    def key(kind: str, model: str, prompt_version: str, document_ids: Iterable[str], query: str) -> str:
+        """Key that is identical in every process for the same question, model, prompt and documents"""
+        normalized_query = " ".join(query.lower().split())
+        payload = json.dumps([kind, model, prompt_version, sorted(set(document_ids)), normalized_query])
+        return f"{kind}:{calculate_file_hash(payload.encode('utf-8'))}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Exact lookup; expired entries count as misses"""
+        try:
+            value = await asyncio.to_thread(self.backend.get, key)
+        except Exception as e:
+            print(f"Error reading response cache: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            cache_misses.labels(cache="response").inc()
+        else:
+            self.hits += 1
+            cache_hits.labels(cache="response").inc()
+        return value
+
+    async def find_similar(self, document_ids: Iterable[str], query_vector: List[float], threshold: Optional[float] = None) -> Optional[Any]:
+        """Best cached answer for the same documents whose query embedding is within the threshold"""
+        threshold = threshold if threshold is not None else settings.semantic_cache_threshold
+        try:
+            value = await asyncio.to_thread(
+                self.backend.find_similar, document_set(document_ids), normalize_vector(query_vector), threshold
+            )
+        except Exception as e:
+            print(f"Error reading response cache: {e}")
+            value = None
+        if value is not None:
+            self.semantic_hits += 1
+            cache_hits.labels(cache="response_semantic").inc()
+        return value
+
+    async def put(self, key: str, value: Any, document_ids: Iterable[str] = (), query_vector: Optional[List[float]] = None):
+        vector = normalize_vector(query_vector) if query_vector is not None else None
+        try:
+            await asyncio.to_thread(self.backend.put, key, value, document_set(document_ids), vector, self.ttl_seconds)
+        except Exception as e:
+            # A cache write failure must never fail the answer itself
+            print(f"Error writing response cache: {e}")
+
+    async def invalidate_document(self, doc_id: str) -> int:
+        """Forget every answer drawn from a document that was deleted or replaced
+
+        A failure is logged rather than raised, so it cannot fail the upload, update or delete
+        that triggered it; the stale answers then expire with their TTL.
+        """
+        try:
+            removed = await asyncio.to_thread(self.backend.invalidate_document, doc_id)
+        except Exception as e:
+            print(f"Error invalidating response cache for {doc_id}: {e}")
+            return 0
+        self.invalidations += removed
+        return removed
+
+    async def stats(self) -> Dict[str, Any]:
+        try:
+            # Counting queries the backend, which may be a database or a remote server
+            entries = await asyncio.to_thread(self.backend.count)
+        except Exception as e:
+            print(f"Error reading response cache: {e}")
+            entries = None
+        # Semantic hits are exact misses that were answered anyway
+        lookups = self.hits + self.misses
+        return {
+            "backend": settings.response_cache_backend,
+            "entries": entries,
+            "ttl_seconds": self.ttl_seconds,
+            "semantic": settings.enable_semantic_cache,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
+
+
+# Global response cache instance
+response_cache = ResponseCache()
@@ -0,0 +1,125 @@
+import re
+from typing import List, Tuple
+
+# Section headers the model sometimes echoes back from the prompt
+UNWANTED_HEADERS = [
+    "### YOUR RESPONSE ###",
+    "### INSTRUCTIONS FOR THE ASSISTANT ###",
+    "### CONVERSATION CONTEXT ###",
+    "### PDF CONTENT ###",
+    "### USER QUESTION ###"
+]
+
+# Formats the model uses to introduce the follow-up questions
+SUGGESTION_MARKERS = [
+    "### SUGGESTED QUESTIONS ###",
+    "SUGGESTED QUESTIONS:",
+    "### Suggested Questions",
+    "##Suggested Questions",
+    "Suggested Questions",
+    "[Title: SUGGESTED QUESTIONS:]"
+]
+
+
+def extract_suggestions(suggestion_text: str) -> List[str]:
+    """Pull the numbered follow-up questions out of the suggestion section"""
+    suggestions = []
+    for line in suggestion_text.strip().split('\n'):
+        line = line.strip()
+        # Extract numbered questions (1., 2., 3.)
+        if line and (line.startswith('1.') or line.startswith('2.') or line.startswith('3.')):
+            suggestion = line[2:].strip()  # Remove "1. " or "2. " etc.
+            if suggestion and not suggestion.startswith('[') and not suggestion.startswith('#'):
+                suggestions.append(suggestion)
+    return suggestions
+
+
+def parse_response(response_text: str) -> Tuple[str, List[str]]:
+    """Split a complete model answer into the cleaned response and suggested questions"""
+    suggestions = []
+    main_response = response_text
+
+    # Remove unwanted headers and clean the response
+    for header in UNWANTED_HEADERS:
+        main_response = main_response.replace(header, "")
+
+    for marker in SUGGESTION_MARKERS:
+        if marker in main_response:
+            parts = main_response.split(marker)
+            main_response = parts[0].strip()
+            if len(parts) > 1:
+                suggestions = extract_suggestions(parts[1])
+            break  # Found suggestions, stop looking
+
+    # Final cleanup of main response - remove any remaining ### symbols and empty lines
+    main_response = main_response.replace("###", "").strip()
+
+    # Remove multiple consecutive newlines and clean up spacing
+    main_response = re.sub(r'\n\s*\n\s*\n', '\n\n', main_response)
+    return main_response.strip(), suggestions
+
+
+class StreamingResponseParser:
+    """Applies the parse_response clean-up to streamed tokens as they arrive"""
+
+    # Anything that could still turn into a header, a marker or a stray ### is held back
+    _patterns = UNWANTED_HEADERS + SUGGESTION_MARKERS + ["###"]
+
+    def __init__(self):
+        self.raw_text = ""
+        self._pending = ""
+        self._started = False
+        self._in_suggestions = False
+
+    def _holdback(self, text: str) -> int:
+        """Length of the tail of text that may be the start of a pattern"""
+        hold = 0
+        for pattern in self._patterns:
+            for length in range(min(len(pattern) - 1, len(text)), hold, -1):
+                if text.endswith(pattern[:length]):
+                    hold = length
+                    break
+        return hold
+
+    def _clean(self, text: str, final: bool = False) -> str:
+        text = text.replace("###", "")
+        text = re.sub(r'\n\s*\n\s*\n', '\n\n', text)
+        if not self._started:
+            text = text.lstrip()
+        if final:
+            text = text.rstrip()
+        if text:
+            self._started = True
+        return text
+
+    def feed(self, token: str) -> str:
+        """Add a streamed token and return the text that is now safe to show"""
+        self.raw_text += token
+        if self._in_suggestions:
+            return ""
+
+        self._pending += token
+        for header in UNWANTED_HEADERS:
+            self._pending = self._pending.replace(header, "")
+
+        # The earliest marker ends the answer; ties go to the longer marker
+        found = [(self._pending.find(marker), -len(marker)) for marker in SUGGESTION_MARKERS if marker in self._pending]
+        if found:
+            position = min(found)[0]
+            text, self._pending = self._pending[:position], ""
+            self._in_suggestions = True
+            return self._clean(text, final=True)
+
+        # Hold back partial patterns and trailing whitespace until the next token decides them
+        cut = len(self._pending) - self._holdback(self._pending)
+        while cut > 0 and self._pending[cut - 1].isspace():
+            cut -= 1
+        text, self._pending = self._pending[:cut], self._pending[cut:]
+        return self._clean(text)
+
+    def finish(self) -> str:
+        """Flush whatever answer text is still held back once the stream ends"""
+        if self._in_suggestions:
+            return ""
+        text, self._pending = self._pending, ""
+        return self._clean(text, final=True)
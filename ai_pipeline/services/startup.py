@@ -0,0 +1,75 @@
+import time
+import asyncio
+from typing import Any, Callable, Dict, Optional
+
+from config.settings import settings
+
+
+class StartupMonitor:
+    """Times service startup and loads heavy services in the background once /health answers"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.first_health_seconds: Optional[float] = None
+        self.services_loaded_seconds: Optional[float] = None
+        self.prewarm_seconds: Optional[float] = None
+        self.prewarmed_documents = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def elapsed(self) -> float:
+        return round(time.perf_counter() - self._started, 3)
+
+    def mark_health(self):
+        if self.first_health_seconds is None:
+            self.first_health_seconds = self.elapsed()
+            print(f"First /health answered {self.first_health_seconds}s after startup began")
+
+    def start_prewarm(self, get_document_processor: Callable[[], Any]):
+        """Schedule loading of the heavy services without holding up startup"""
+        if settings.enable_startup_prewarm and self._task is None:
+            self._task = asyncio.create_task(self._prewarm(get_document_processor))
+
+    async def _prewarm(self, get_document_processor: Callable[[], Any]):
+        try:
+            # Importing langchain, FAISS and the OpenAI SDK takes seconds; do it off the event loop
+            document_processor = await asyncio.to_thread(get_document_processor)
+            self.services_loaded_seconds = self.elapsed()
+            if not document_processor.api_key_available:
+                return
+            await asyncio.to_thread(self._load_indexes, document_processor)
+            self.prewarm_seconds = self.elapsed()
+            print(f"Prewarmed {self.prewarmed_documents} document indexes in {self.prewarm_seconds}s")
+        except Exception as e:
+            print(f"Warning: Startup prewarm failed: {e}")
+
+    def _load_indexes(self, document_processor):
+        from services.document_registry import document_registry
+        from services.lexical_index import lexical_index_store
+        if settings.use_corpus_index:
+            from services.corpus_index import corpus_index
+            from services.openai_clients import openai_clients
+            corpus_index.load(document_processor.embeddings)
+            # A corpus built with another embedding model or width cannot answer any query until it is re-embedded
+            corpus_index.require_space(openai_clients.embedding_space, document_processor.embeddings)
+        for doc_id in document_registry.most_queried(settings.prewarm_documents):
+            try:
+                if not settings.use_corpus_index:
+                    document_processor.get_vector_store(doc_id)
+                lexical_index_store.get(doc_id)
+                self.prewarmed_documents += 1
+            except Exception as e:
+                print(f"Warning: Could not prewarm document {doc_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "uptime_seconds": self.elapsed(),
+            "first_health_seconds": self.first_health_seconds,
+            "services_loaded_seconds": self.services_loaded_seconds,
+            "prewarm_seconds": self.prewarm_seconds,
+            "prewarmed_documents": self.prewarmed_documents,
+        }
+
+
+# Global startup monitor instance
+startup_monitor = StartupMonitor()
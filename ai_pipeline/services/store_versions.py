@@ -0,0 +1,84 @@
+import os
+import uuid
+import shutil
+from typing import Optional
+
+from config.settings import settings
+
+# vector_stores/<doc_id> is a symlink to vector_stores/_versions/<doc_id>/<version>
+VERSIONS_DIR = "_versions"
+
+
+def document_path(doc_id: str) -> str:
+    return os.path.join(settings.vector_store_path, doc_id)
+
+
+def current_version(path: str) -> Optional[str]:
+    """Version a document path points at; None for a store still in a plain directory, or no store at all"""
+    try:
+        return os.readlink(path)
+    except OSError:
+        return None
+
+
+def new_version_dir(doc_id: str) -> str:
+    """Create an empty directory for the next version of a document"""
+    path = os.path.join(settings.vector_store_path, VERSIONS_DIR, doc_id, uuid.uuid4().hex)
+    os.makedirs(path)
+    return path
+
+
+def adopt_plain_directory(doc_id: str, root: Optional[str] = None) -> bool:
+    """Move a store written before versioning into the versioned layout
+
+    A symlink cannot replace a directory in one step, so the document is missing for the
+    moment between the two renames. convert_vector_stores.py does this while the service is stopped.
+    Returns True if the directory was moved.
+    """
+    root = root or settings.vector_store_path
+    path = os.path.join(root, doc_id)
+    if os.path.islink(path) or not os.path.isdir(path):
+        return False
+    version_path = os.path.join(root, VERSIONS_DIR, doc_id, uuid.uuid4().hex)
+    os.makedirs(os.path.dirname(version_path), exist_ok=True)
+    os.rename(path, version_path)
+    _point_at(doc_id, version_path, root)
+    return True
+
+
+def _point_at(doc_id: str, version_path: str, root: Optional[str] = None):
+    root = root or settings.vector_store_path
+    link = os.path.join(root, f"_link-{doc_id}-{uuid.uuid4().hex[:8]}")
+    os.symlink(os.path.relpath(version_path, root), link)
+    os.replace(link, os.path.join(root, doc_id))
+
+
+def publish(doc_id: str, version_path: str):
+    """Make a fully written version directory the document's current one in a single rename
+
+    Every worker sees either the old or the new version. The version it replaced is kept, so
+    a worker that resolved the old link just before the swap can still finish loading it.
+    """
+    path = document_path(doc_id)
+    adopt_plain_directory(doc_id)
+    previous = current_version(path)
+    _point_at(doc_id, version_path)
+
+    versions_dir = os.path.join(settings.vector_store_path, VERSIONS_DIR, doc_id)
+    keep = {os.path.basename(version_path), os.path.basename(previous or "")}
+    for name in os.listdir(versions_dir):
+        if name not in keep:
+            shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+
+
+def remove_document(doc_id: str) -> bool:
+    """Delete a document's store and all its versions; False if there was nothing to delete"""
+    path = document_path(doc_id)
+    versions_dir = os.path.join(settings.vector_store_path, VERSIONS_DIR, doc_id)
+    found = os.path.lexists(path) or os.path.isdir(versions_dir)
+    if os.path.islink(path):
+        os.remove(path)
+    elif os.path.isdir(path):
+        shutil.rmtree(path)
+    shutil.rmtree(versions_dir, ignore_errors=True)
+    return found
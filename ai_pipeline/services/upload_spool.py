@@ -0,0 +1,129 @@
+import os
+import uuid
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from config.settings import settings
+
+# Room for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# Headers of a single part; real clients send a few hundred bytes
+MAX_PART_HEADER_BYTES = 16 * 1024
+
+
+class InvalidUpload(Exception):
+    """Raised when a request does not carry the expected file; the client's error, not the server's"""
+
+
+class UploadTooLarge(InvalidUpload):
+    """Raised as soon as an upload being received passes the size limit"""
+
+
+async def spool_upload(
+    request: Request,
+    field: str = "file",
+    max_bytes: Optional[int] = None,
+    accept: Optional[Callable[[str], bool]] = None,
+    unsupported: str = "Unsupported file type"
+) -> Tuple[str, str, int]:
+    """Stream one file field of a multipart request into temp_uploads; returns (filename, path, size)
+
+    Only the network chunk being parsed is held in memory, and the upload is abandoned
+    as soon as it passes the limit, its part headers grow too large, or accept rejects
+    its filename. The caller owns the spooled file.
+    """
+    max_bytes = max_bytes if max_bytes is not None else settings.max_file_size
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise UploadTooLarge(f"File size exceeds {max_bytes // (1024 * 1024)}MB limit")
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise InvalidUpload("Expected a multipart/form-data upload")
+
+    state: Dict = {"header_field": b"", "header_value": b"", "headers": {}, "header_bytes": 0, "filename": None, "writing": False}
+    pending: List[bytes] = []
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["header_bytes"] = 0
+
+    def count_header_bytes(count: int):
+        state["header_bytes"] += count
+        if state["header_bytes"] > MAX_PART_HEADER_BYTES:
+            raise InvalidUpload(f"Multipart part headers exceed {MAX_PART_HEADER_BYTES // 1024}KB")
+
+    def on_header_field(data: bytes, start: int, end: int):
+        count_header_bytes(end - start)
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        count_header_bytes(end - start)
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"], state["header_value"] = b"", b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        # Only the first part carrying the expected file is kept
+        state["writing"] = (
+            state["filename"] is None
+            and disposition.get(b"name") == field.encode("utf-8")
+            and b"filename" in disposition
+        )
+        if state["writing"]:
+            state["filename"] = os.path.basename(disposition[b"filename"].decode("utf-8", "replace"))
+            if accept is not None and not accept(state["filename"]):
+                # Refused before a single byte of the file is written
+                raise InvalidUpload(unsupported)
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if state["writing"]:
+            pending.append(data[start:end])
+
+    def on_part_end():
+        state["writing"] = False
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    os.makedirs(settings.temp_uploads_path, exist_ok=True)
+    path = os.path.join(settings.temp_uploads_path, f"{uuid.uuid4()}.part")
+    size = 0
+    f = open(path, 'wb')
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if pending:
+                data = b"".join(pending)
+                pending.clear()
+                size += len(data)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"File size exceeds {max_bytes // (1024 * 1024)}MB limit")
+                await asyncio.to_thread(f.write, data)
+        parser.finalize()
+        f.close()
+        if state["filename"] is None:
+            raise InvalidUpload(f"No '{field}' file in the upload")
+    except MultipartParseError as e:
+        f.close()
+        os.remove(path)
+        raise InvalidUpload(f"Malformed multipart upload: {e}")
+    except BaseException:
+        f.close()
+        os.remove(path)
+        raise
+    return state["filename"], path, size
@@ -0,0 +1,126 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from config.settings import settings
+from services.metrics import cache_hits, cache_misses
+from services.store_versions import current_version
+
+
+class VectorStorePool:
+    """Long-lived LRU pool of loaded vector stores, bounded by a byte budget"""
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else settings.vector_store_pool_max_bytes
+        self._entries = OrderedDict()  # doc_id -> (store, size in bytes, version it was loaded from)
+        self._lock = threading.Lock()
+        self._load_locks = {}  # doc_id -> lock held while that store is being loaded; kept until it leaves the pool
+        self._generations = {}  # doc_id -> bumped on invalidate so in-flight loads are discarded
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _directory_size(path: str) -> int:
+        """Approximate the in-memory footprint of a store by its size on disk"""
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _current_entry(self, doc_id: str, version: Optional[str]):
+        """The pooled entry if it was loaded from the version on disk; a stale one is dropped (caller holds the lock)"""
+        entry = self._entries.get(doc_id)
+        if entry is not None and entry[2] != version:
+            # Another worker swapped in a new version of the document
+            del self._entries[doc_id]
+            self.current_bytes -= entry[1]
+            return None
+        return entry
+
+    def get(self, doc_id: str, path: str, loader: Callable[[], Any]) -> Any:
+        """Return the pooled store for doc_id, loading it at most once across concurrent callers"""
+        version = current_version(path)
+        with self._lock:
+            entry = self._current_entry(doc_id, version)
+            if entry is not None:
+                self._entries.move_to_end(doc_id)
+                self.hits += 1
+                cache_hits.labels(cache="vector_store").inc()
+                return entry[0]
+            load_lock = self._load_locks.setdefault(doc_id, threading.Lock())
+
+        with load_lock:
+            # Another caller may have finished loading while we waited
+            with self._lock:
+                entry = self._current_entry(doc_id, version)
+                if entry is not None:
+                    self._entries.move_to_end(doc_id)
+                    self.hits += 1
+                    cache_hits.labels(cache="vector_store").inc()
+                    return entry[0]
+                self.misses += 1
+                cache_misses.labels(cache="vector_store").inc()
+                generation = self._generations.get(doc_id, 0)
+
+            store = loader()
+            size = self._directory_size(path)
+
+            with self._lock:
+                if self._generations.get(doc_id, 0) == generation:
+                    # A version swapped in during the load only costs a reload on the next lookup
+                    self._entries[doc_id] = (store, size, version)
+                    self.current_bytes += size
+                    self._evict()
+            return store
+
+    def _evict(self):
+        """Drop least recently used stores until the pool fits its budget (caller holds the lock)"""
+        # Always keep the most recent entry, even if it alone exceeds the budget
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            evicted_id, (_, size, _) = self._entries.popitem(last=False)
+            self._load_locks.pop(evicted_id, None)
+            self.current_bytes -= size
+            self.evictions += 1
+            print(f"Evicted vector store {evicted_id} from pool ({size} bytes)")
+
+    def invalidate(self, doc_id: str):
+        """Drop a store from the pool, e.g. after its document was deleted"""
+        with self._lock:
+            self._generations[doc_id] = self._generations.get(doc_id, 0) + 1
+            # A load still in flight is discarded by the generation check, so the next lookup loads afresh anyway
+            self._load_locks.pop(doc_id, None)
+            entry = self._entries.pop(doc_id, None)
+            if entry is not None:
+                self.current_bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            for doc_id in list(self._entries.keys()):
+                self._generations[doc_id] = self._generations.get(doc_id, 0) + 1
+            self._entries.clear()
+            self._load_locks.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Global pool instance
+vector_store_pool = VectorStorePool()
@@ -1,10 +1,26 @@
+import os
+import re
+import mmap
+import signal
 import hashlib
-from typing import BinaryIO
+import threading
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, List
+
+from pypdf import PdfReader
 
 def calculate_file_hash(file_content: bytes) -> str:
     """Calculate SHA256 hash of file content"""
     return hashlib.sha256(file_content).hexdigest()
 
+def calculate_path_hash(file_path: str) -> str:
+    """SHA256 hash of a file on disk, read in blocks; equal to calculate_file_hash of its content"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
 def validate_pdf_file(filename: str) -> bool:
     """Validate if file is a PDF based on extension"""
     return filename.lower().endswith('.pdf')
@@ -19,3 +35,76 @@ def format_file_size(size_bytes: int) -> str:
         size_bytes /= 1024.0
         i += 1
     return f"{size_bytes:.1f}{size_names[i]}"
+
+class PageTimeout(Exception):
+    """Raised when extracting a single page takes too long"""
+
+def _raise_page_timeout(signum, frame):
+    raise PageTimeout()
+
+def clean_page_text(text: str) -> str:
+    """Join hyphenated words and collapse single line breaks in extracted page text"""
+    text = re.sub(r"(\w+)-\n(\w+)", r"\1\2", text)
+    text = re.sub(r"(?<!\n\s)\n(?!\s\n)", " ", text.strip())
+    text = re.sub(r"\n\s*\n", "\n\n", text)
+    return text
+
+def extract_page_texts(pdf: PdfReader, start: int, end: int, page_timeout: float = 0) -> List[str]:
+    """Extract and clean pages [start, end) of an open PDF, with placeholders for failed pages"""
+    # Per-page timeouts rely on SIGALRM, which is Unix-only and needs the main thread
+    use_alarm = (
+        page_timeout > 0
+        and hasattr(signal, "setitimer")
+        and threading.current_thread() is threading.main_thread()
+    )
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_page_timeout)
+
+    output = []
+    try:
+        for i in range(start, end):
+            try:
+                if use_alarm:
+                    signal.setitimer(signal.ITIMER_REAL, page_timeout)
+                text = pdf.pages[i].extract_text()
+                if use_alarm:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+                if text:  # Only process if text was extracted
+                    output.append(clean_page_text(text))
+                else:
+                    # Add placeholder for empty pages
+                    output.append(f"[Page {i+1} - No extractable text]")
+            except PageTimeout:
+                print(f"Timed out extracting page {i+1} after {page_timeout}s")
+                output.append(f"[Page {i+1} - Text extraction timed out]")
+            except Exception as page_error:
+                if use_alarm:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+                print(f"Error processing page {i+1}: {str(page_error)}")
+                output.append(f"[Page {i+1} - Error extracting text: {str(page_error)}]")
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+    return output
+
+@contextmanager
+def open_mapped_pdf(file_path: str) -> Iterator[PdfReader]:
+    """Open a PDF memory-mapped; PdfReader(path) would first copy the whole file into memory"""
+    with open(file_path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            raise Exception("PDF file appears to be empty or corrupted")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield PdfReader(data)
+
+def extract_page_range(file_path: str, start: int, end: int, page_timeout: float = 0) -> List[str]:
+    """Parser worker process entry point: open the PDF and extract one page range"""
+    with open_mapped_pdf(file_path) as pdf:
+        return extract_page_texts(pdf, start, end, page_timeout)
+
+def extract_all_pages(file_path: str, page_timeout: float = 0) -> List[str]:
+    """Parser worker process entry point for bulk ingestion: one whole document per task"""
+    with open_mapped_pdf(file_path) as pdf:
+        if not pdf.pages:
+            raise Exception("PDF file appears to be empty or corrupted")
+        return extract_page_texts(pdf, 0, len(pdf.pages), page_timeout)
@@ -0,0 +1,13 @@
+import json
+from typing import Any, AsyncIterator, Tuple
+
+
+def format_sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def sse_stream(events: AsyncIterator[Tuple[str, Any]]) -> AsyncIterator[str]:
+    """Turn (event, data) pairs into an SSE body"""
+    async for event, data in events:
+        yield format_sse_event(event, data)
@@ -5,6 +5,7 @@ import helmet from "helmet";
 import dotenv from "dotenv";
 import connectDB from "./src/config/database.js";
 import apiRoutes from "./src/routes/index.js";
+import { resumeIngestionTracking } from "./src/services/aiProxyService.js";
 import { apiLimiter } from "./src/middleware/rateLimiter.js";
 
 // Load environment variables
@@ -14,8 +15,8 @@ const app = express();
 const PORT = process.env.PORT || 3001;
 const FRONTEND_URL = process.env.FRONTEND_URL || "http://localhost:5173";
 
-// Initialize database connection
-connectDB();
+// Initialize database connection, then resume tracking documents queued before a restart
+connectDB().then(resumeIngestionTracking);
 
 // Security middleware
 app.use(helmet());
@@ -76,23 +76,32 @@ export const uploadDocumentToAI = async (file, title, uploadedBy) => {
         }
       );
 
+      // The pipeline queues the document and processes it in the background
+      const queued = Boolean(response.data.job_id);
+      const status = queued ? "processing" : "indexed";
+
       if (response.data.success) {
         await Document.findByIdAndUpdate(document._id, {
-          status: "indexed",
+          status,
           aiPipelineId: response.data.document_id,
         });
+        if (queued) {
+          trackIngestionJob(document._id, response.data.document_id);
+        }
       }
 
       return {
         success: true,
-        message: "Document uploaded and processed successfully",
+        message: queued
+          ? "Document uploaded and queued for processing"
+          : "Document uploaded and processed successfully",
         document: {
           id: document._id,
           title: document.title,
           filename: document.filename,
           size: document.size,
           uploadedAt: document.uploadDate,
-          status: "indexed",
+          status,
           aiPipelineId: response.data.document_id,
         },
       };
@@ -128,6 +137,76 @@ export const uploadDocumentToAI = async (file, title, uploadedBy) => {
   }
 };
 
+// Give up after about an hour of polling, or a minute of not_found/error responses in a row
+const MAX_STATUS_POLLS = Number(process.env.INGESTION_STATUS_MAX_POLLS) || 1200;
+const MAX_STATUS_MISSES = Number(process.env.INGESTION_STATUS_MAX_MISSES) || 20;
+
+// Poll the AI pipeline until a queued document is indexed, failed or cancelled
+const trackIngestionJob = (documentId, aiPipelineId, intervalMs = 3000) => {
+  let attempts = 0;
+  let misses = 0;
+
+  const markFailed = async (errorMessage) => {
+    try {
+      await Document.findByIdAndUpdate(documentId, { status: "failed", errorMessage });
+    } catch (error) {
+      console.error(`Error marking document ${documentId} failed:`, error.message);
+    }
+  };
+
+  const poll = async () => {
+    attempts += 1;
+    try {
+      const { data } = await axios.get(
+        `${AI_PIPELINE_URL}/api/documents/status/${aiPipelineId}`,
+        { timeout: 10000 }
+      );
+
+      if (data.status === "processed") {
+        await Document.findByIdAndUpdate(documentId, { status: "indexed" });
+        return;
+      }
+      if (data.status === "failed" || data.status === "cancelled") {
+        await markFailed(data.message);
+        return;
+      }
+      // A deleted document, or a job the pipeline no longer knows about
+      misses = data.status === "not_found" ? misses + 1 : 0;
+    } catch (error) {
+      misses += 1;
+      console.error(`Error checking status of document ${aiPipelineId}:`, error.message);
+    }
+
+    if (misses >= MAX_STATUS_MISSES) {
+      await markFailed("The AI pipeline no longer reports this document");
+      return;
+    }
+    if (attempts >= MAX_STATUS_POLLS) {
+      await markFailed("Timed out waiting for the AI pipeline to process the document");
+      return;
+    }
+    setTimeout(poll, intervalMs);
+  };
+
+  setTimeout(poll, intervalMs);
+};
+
+// Polling does not survive a restart, so pick up documents still marked as processing
+export const resumeIngestionTracking = async () => {
+  if (MOCK_MODE) {
+    return;
+  }
+  try {
+    const documents = await Document.find({
+      status: "processing",
+      aiPipelineId: { $exists: true, $ne: null },
+    });
+    documents.forEach((doc) => trackIngestionJob(doc._id, doc.aiPipelineId));
+  } catch (error) {
+    console.error("Error resuming ingestion tracking:", error.message);
+  }
+};
+
 // Get all indexed documents from database
 export const getIndexedDocuments = async () => {
   try {